@@ -0,0 +1,65 @@
+"""
+Micro-benchmark: conversão de valores pt-BR (`1.234.567,89`).
+
+Compara a antiga cadeia de `.str.replace` + `astype(float)` com
+`common.numeric.parse_br_decimal` numa coluna de vários milhões de linhas.
+
+Uso: python benchmarks/bench_numeric.py [--rows 5000000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from common.numeric import parse_br_decimal
+
+
+def make_column(rows, seed=42):
+    """Coluna sintética no formato do VL_SALDO_FINAL (com aspas, negativos e milhares)"""
+    rng = np.random.default_rng(seed)
+    cents = rng.integers(-10**9, 10**12, size=min(rows, 200_000))
+    sample = []
+    for c in cents:
+        integer, frac = divmod(abs(int(c)), 100)
+        text = f"{integer:,}".replace(",", ".") + f",{frac:02d}"
+        sample.append(('"-' if c < 0 else '"') + text + '"')
+    repeats = -(-rows // len(sample))
+    return pd.Series((sample * repeats)[:rows], dtype=str)
+
+
+def replace_chain(series):
+    return series.astype(str).str.replace('"', '').str.replace('.', '').str.replace(',', '.').astype(float)
+
+
+def timed(func, series, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(series)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    series = make_column(args.rows)
+    old_time, old = timed(replace_chain, series, args.repeat)
+    new_time, (new, malformed) = timed(parse_br_decimal, series, args.repeat)
+
+    assert np.array_equal(old.to_numpy(), new.to_numpy()) and malformed.empty
+    print(f"linhas:            {args.rows:,}")
+    print(f"cadeia de replace: {old_time:.3f}s ({args.rows / old_time / 1e6:.1f} M linhas/s)")
+    print(f"parse_br_decimal:  {new_time:.3f}s ({args.rows / new_time / 1e6:.1f} M linhas/s)")
+    print(f"speedup:           {old_time / new_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
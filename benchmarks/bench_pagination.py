@@ -0,0 +1,63 @@
+"""
+Benchmark: latência da página N em /api/operadoras (OFFSET x cursor).
+
+Usa o banco sintético do bench_search e mede, para páginas cada vez mais
+fundas, a antiga paginação `LIMIT/OFFSET` e a paginação por cursor (keyset)
+da API, que continua do último registro entregue pelo índice.
+
+Uso: python benchmarks/bench_pagination.py [--rows 300000]
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import text
+
+from bench_search import api, import_data, make_operadoras
+
+LIMIT = 10
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        import_data.bulk_load(import_data.create_engine(url), {'operadoras': make_operadoras(args.rows)})
+        engine = api.create_db_engine(url)
+        branches, _ = api.operadora_branches(None, "sqlite")
+        columns = api.qualified(api.OPERADORA_COLUMNS)
+
+        print(f"{'página':>8} {'OFFSET (ms)':>12} {'cursor (ms)':>12}")
+        with engine.connect() as conn:
+            pages = [1, 100, 1_000, 10_000, args.rows // LIMIT]
+            for page in pages:
+                offset = (page - 1) * LIMIT
+                legacy = lambda: conn.execute(text("SELECT * FROM operadoras ORDER BY registro_ans LIMIT :limit OFFSET :offset"),
+                                              {"limit": LIMIT, "offset": offset}).all()
+                # Cursor equivalente ao que a página anterior teria devolvido
+                last = conn.execute(text("SELECT registro_ans FROM operadoras ORDER BY registro_ans LIMIT 1 OFFSET :o"),
+                                    {"o": offset - 1}).scalar() if offset else None
+                sql, params = api.keyset_query(columns, branches, (0, [last]) if last else None, LIMIT)
+                keyset = lambda: conn.execute(text(sql), params).all()
+                print(f"{page:>8} {timed(legacy, args.repeat):>12.2f} {timed(keyset, args.repeat):>12.2f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    main()
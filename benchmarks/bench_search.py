@@ -0,0 +1,104 @@
+"""
+Benchmark: busca de operadoras (/api/operadoras?search=...) conforme a tabela cresce.
+
+Monta bancos SQLite sintéticos com o import_data (mesma carga e mesmos índices
+de produção) e compara, para cada tamanho, a antiga busca `LIKE '%termo%'` com a
+busca indexada da API (FTS5 trigram + prefixos em registro_ans/cnpj).
+
+Uso: python benchmarks/bench_search.py [--sizes 10000 100000 300000]
+"""
+import argparse
+import importlib.util
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+import_data = load_module("import_data_bench", ROOT / "src" / "3_database" / "import_data.py")
+api = load_module("api_bench", ROOT / "src" / "4_web" / "backend" / "main.py")
+
+WORDS = ["SAÚDE", "ASSISTÊNCIA", "MÉDICA", "ODONTOLÓGICA", "COOPERATIVA", "PLANO", "VIDA",
+         "HOSPITAL", "SERVIÇOS", "ADMINISTRADORA", "BENEFÍCIOS", "CLÍNICA", "NORTE", "SUL"]
+
+# Sílabas do "nome próprio" de cada operadora (15^4 combinações, poucas repetidas)
+SYLLABLES = ["BA", "CE", "DI", "FO", "GU", "LA", "ME", "NI", "PO", "RU", "SA", "TE", "VI", "XO", "ZU"]
+
+# (descrição, termo): termo raro, palavra comum, sem resultado, prefixo curto, registro e CNPJ
+QUERIES = [
+    ("nome raro", "fovipoxo"),
+    ("palavra comum", "saude"),
+    ("sem resultado", "inexistente"),
+    ("prefixo curto", "ad"),
+    ("registro ANS", "4242"),
+    ("CNPJ pontuado", "10.000.042"),
+]
+
+
+def make_operadoras(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(WORDS), size=(rows, 3))
+    own = rng.integers(0, len(SYLLABLES), size=(rows, 4))
+    names = [f"{''.join(SYLLABLES[s] for s in own[i])} {WORDS[a]} {WORDS[b]} {WORDS[c]}"
+             for i, (a, b, c) in enumerate(picks)]
+    return pd.DataFrame({
+        'registro_ans': [f"{i:06d}" for i in range(rows)],
+        'cnpj': [f"{10_000_000 + i:08d}000199" for i in range(rows)],
+        'razao_social': names,
+        'modalidade': 'Medicina de Grupo',
+        'uf': rng.choice(['SP', 'RJ', 'MG', 'RS'], size=rows),
+        'razao_social_busca': import_data.fold_series(pd.Series(names)),
+    })
+
+
+def timed(conn, sql, params, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(text(sql), params).all()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'operadoras':>10} {'consulta':<15} {'LIKE (ms)':>10} {'índice (ms)':>12}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+            import_data.bulk_load(import_data.create_engine(url), {'operadoras': make_operadoras(size)})
+            engine = api.create_db_engine(url)
+            with engine.connect() as conn:
+                for label, term in QUERIES:
+                    legacy = ("SELECT * FROM operadoras WHERE razao_social LIKE :search"
+                              " OR registro_ans LIKE :search LIMIT 10")
+                    like_ms, _ = timed(conn, legacy, {"search": f"%{term}%"}, args.repeat)
+                    branches, params = api.operadora_branches(term, "sqlite")
+                    sql, page_params = api.keyset_query(api.qualified(api.OPERADORA_COLUMNS), branches, None, 10)
+                    indexed_ms, _ = timed(conn, sql, {**params, **page_params}, args.repeat)
+                    print(f"{size:>10} {label:<15} {like_ms:>10.2f} {indexed_ms:>12.2f}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    main()
@@ -0,0 +1,114 @@
+"""
+Teste de carga local da API: latência p50/p99 e requisições por segundo.
+
+Suba a API (ex.: `uvicorn main:app --workers 1` em src/4_web/backend) e rode:
+
+    python benchmarks/load_test_api.py --url http://127.0.0.1:8000 --concurrency 50 --requests 5000
+
+Para comparar antes/depois, rode o mesmo comando contra as duas versões da API
+com o mesmo database.db. Para comparar os modos de acesso ao banco, suba a API
+com API_DB_MODE=sync e depois com API_DB_MODE=async e use alta concorrência:
+
+    python benchmarks/load_test_api.py --concurrency 600 --requests 6000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/api/operadoras?limit=10",
+    "/api/operadoras?search=SAUDE",
+    "/api/operadoras/{id}",
+    "/api/operadoras/{id}/despesas",
+    "/api/estatisticas",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def run(url, paths, ids, concurrency, total, timeout):
+    latencies = {path: [] for path in paths}
+    errors = 0
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                path = paths[i % len(paths)]
+                target = path.format(id=random.choice(ids)) if ids else path
+                start = time.perf_counter()
+                try:
+                    response = await client.get(target)
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies[path].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return latencies, errors, elapsed
+
+
+def summarize(latencies, errors, elapsed, total):
+    report = {"requests": total, "errors": errors, "seconds": round(elapsed, 3),
+              "rps": round(total / elapsed, 1), "endpoints": {}}
+    everything = [v for values in latencies.values() for v in values]
+    for path, values in list(latencies.items()) + [("TOTAL", everything)]:
+        report["endpoints"][path] = {
+            "p50_ms": round(statistics.median(values) * 1000, 2) if values else None,
+            "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+            "count": len(values),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da API (p50/p99 e req/s)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--path", action="append", help="Endpoint a testar ({id} = registro ANS aleatório)")
+    parser.add_argument("--ids", default="", help="Registros ANS separados por vírgula para {id}")
+    parser.add_argument("--json", action="store_true", help="Imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    paths = args.path or DEFAULT_PATHS
+    ids = [i for i in args.ids.split(",") if i]
+    if not ids:
+        # Descobre alguns registros reais pela própria API
+        response = httpx.get(f"{args.url}/api/operadoras", params={"limit": 100}, timeout=args.timeout)
+        ids = [str(op["registro_ans"]) for op in response.json()["data"]] or ["0"]
+
+    latencies, errors, elapsed = asyncio.run(
+        run(args.url, paths, ids, args.concurrency, args.requests, args.timeout)
+    )
+    report = summarize(latencies, errors, elapsed, args.requests)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['requests']} requisições, concorrência {args.concurrency}: "
+          f"{report['rps']} req/s, {report['errors']} erros")
+    for path, stats in report["endpoints"].items():
+        print(f"  {path:40s} p50 {stats['p50_ms']:>8} ms   p99 {stats['p99_ms']:>8} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Suíte de benchmarks ponta a ponta sobre dados sintéticos da ANS.
+
+Gera (ou reaproveita) o FTP sintético do `synthetic_ans.py`, serve-o por HTTP
+local no lugar da ANS e roda as etapas 1 a 3 e a API num diretório de trabalho
+temporário, medindo o tempo e o pico de memória (tracemalloc) de cada caso:
+
+    etapa1.download            download + extração dos ZIPs (cache vazio)
+    etapa1.normalize_and_read  leitura/filtro dos CSVs contábeis
+    etapa1.main                etapa 1 completa (consolidado, Parquet, CSV, ZIP)
+    etapa2.enrich_aggregate    enriquecimento com o cadastro + groupby
+    etapa2.main                etapa 2 completa
+    etapa3.import_data         carga no SQLite
+    api.<endpoint>             p50/p99 de cada endpoint (sem cache de respostas)
+
+O resultado é gravado em JSON (commit, máquina, parâmetros e métricas). Com
+`--compare` os tempos são comparados a um resultado anterior e o script sai com
+código 1 se algum caso ficou mais lento que a tolerância.
+
+Uso:
+    python benchmarks/run_benchmarks.py --rows 1000000
+    python benchmarks/run_benchmarks.py --rows 1000000 --compare benchmarks/results/<outro>.json
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import synthetic_ans
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Endpoints medidos ({id} = registro ANS existente no banco gerado)
+ENDPOINTS = [
+    "/api/operadoras?limit=10",
+    "/api/operadoras?search=saude",
+    "/api/operadoras/{id}",
+    "/api/operadoras/{id}/despesas",
+    "/api/operadoras/{id}/serie",
+    "/api/operadoras/{id}/crescimento",
+    "/api/operadoras/{id}/percentil",
+    "/api/estatisticas",
+    "/api/estatisticas/operadoras",
+    "/api/estatisticas/uf",
+    "/api/estatisticas/percentis",
+]
+EXPORT_ENDPOINT = "/api/exportar/despesas_consolidadas"
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def relocate(module, workspace):
+    """Aponta todos os caminhos do módulo que ficam sob BASE_DIR para `workspace`"""
+    for name, value in list(vars(module).items()):
+        if isinstance(value, Path) and value.is_relative_to(module.BASE_DIR) and value != module.BASE_DIR:
+            setattr(module, name, workspace / value.relative_to(module.BASE_DIR))
+
+
+def measure(func, repeat=1, setup=None, memory=True):
+    """
+    Melhor tempo e média de `repeat` execuções de `func` e, numa execução extra
+    sob tracemalloc, o pico de memória alocada (em MB). `setup` roda antes de cada execução.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    result = {"seconds": round(min(times), 4), "mean_seconds": round(statistics.mean(times), 4), "runs": repeat}
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            func()
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit or None, dirty
+    except OSError:
+        return None, None
+
+
+def run_stages(data_dir, workspace, base_url, quarters, repeat, memory):
+    """Etapas 1 a 3 sobre o FTP sintético; devolve (resultados, URL do banco, diretório do snapshot)"""
+    stage1 = load_module("bench_integration", ROOT / "src" / "1_integration" / "main.py")
+    stage2 = load_module("bench_transformation", ROOT / "src" / "2_transformation" / "main.py")
+    stage3 = load_module("bench_import_data", ROOT / "src" / "3_database" / "import_data.py")
+    for module in (stage1, stage2, stage3):
+        relocate(module, workspace)
+    stage1.BASE_URL = f"{base_url}{synthetic_ans.ACCOUNTING_DIR}/"
+    stage2.CADASTRO_URL = f"{base_url}{synthetic_ans.CADOP_PATH}"
+    db_url = f"sqlite:///{workspace / 'database.db'}"
+    stage3.DB_URL = db_url
+    for directory in (stage1.DATA_RAW, stage1.DATA_PROCESSED):
+        os.makedirs(directory, exist_ok=True)
+    results = {}
+
+    listed = stage1.get_available_quarters(stage1.create_cache(), count=quarters)
+
+    def clean_download():
+        shutil.rmtree(stage1.CACHE_DIR, ignore_errors=True)
+        shutil.rmtree(stage1.DATA_RAW, ignore_errors=True)
+
+    results["etapa1.download"] = measure(lambda: stage1.download_all(listed), repeat, clean_download, memory)
+    dirs = stage1.download_all(listed)
+    files = [(stage1.find_expense_file(d), year, quarter) for (year, quarter, _), d in zip(listed, dirs)]
+
+    def read_all():
+        return sum(len(stage1.normalize_and_read(path, year, quarter, chunksize=stage1.CHUNK_ROWS))
+                   for path, year, quarter in files)
+    results["etapa1.normalize_and_read"] = {**measure(read_all, repeat, memory=memory), "rows_out": read_all()}
+    results["etapa1.main"] = measure(lambda: stage1.main(full=True, count=quarters), repeat, memory=memory)
+
+    cad_path = stage2.download_cadastro()
+    consolidated = stage2.load_consolidated()
+    results["etapa2.enrich_aggregate"] = {
+        **measure(lambda: stage2.aggregate(stage2.enrich(consolidated, cad_path)), repeat, memory=memory),
+        "rows_in": len(consolidated),
+    }
+    results["etapa2.main"] = measure(lambda: stage2.main(full=True), repeat, memory=memory)
+    results["etapa3.import_data"] = measure(stage3.import_data, repeat, memory=memory)
+    return results, db_url, stage3.SNAPSHOT_DIR
+
+
+def run_api(db_url, snapshot_dir, requests, memory):
+    """p50/p99 de cada endpoint (cache de respostas desligado) e tempo da exportação completa"""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+
+    api = load_module("bench_api", ROOT / "src" / "4_web" / "backend" / "main.py")
+    api.engine = api.create_db_engine(db_url)
+    api.SNAPSHOT_DIR = snapshot_dir
+    api.response_cache = api.ResponseCache(max_entries=0)
+    with api.engine.connect() as conn:
+        ids = [row[0] for row in conn.execute(text("SELECT registro_ans FROM rollup_ranking_operadoras "
+                                                   "ORDER BY posicao LIMIT 50"))]
+    results = {}
+    with TestClient(api.app) as client:
+        for endpoint in ENDPOINTS:
+            latencies = []
+            for i in range(requests):
+                start = time.perf_counter()
+                response = client.get(endpoint.format(id=ids[i % len(ids)]))
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{endpoint}: HTTP {response.status_code}")
+            results[f"api.{endpoint}"] = {
+                "seconds": round(statistics.median(latencies), 6),
+                "p50_ms": round(statistics.median(latencies) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+                "requests": requests,
+            }
+
+        def export():
+            # Lê a resposta em blocos, como um consumidor real (sem guardar o corpo)
+            with client.stream("GET", EXPORT_ENDPOINT) as response:
+                return sum(len(chunk) for chunk in response.iter_bytes())
+        results[f"api.{EXPORT_ENDPOINT}"] = {**measure(export, 1, memory=memory), "bytes": export()}
+    api.engine.dispose()
+    return results
+
+
+def compare(current, baseline, tolerance, floor=0.005):
+    """
+    Tabela com a variação de cada caso em relação ao resultado anterior.
+    Regressão: mais lento que (1 + tolerance) vezes e pelo menos `floor` segundos a mais.
+    """
+    regressions = []
+    print(f"\n{'caso':<45} {'anterior':>10} {'atual':>10} {'variação':>9}")
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            continue
+        before, after = old["seconds"], result["seconds"]
+        change = (after - before) / before if before else 0.0
+        slower = after > before * (1 + tolerance) and after - before > floor
+        if slower:
+            regressions.append(name)
+        print(f"{name:<45} {before:>10.4f} {after:>10.4f} {change:>+8.1%}{'  <-- regressão' if slower else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000, help="Linhas contábeis sintéticas (10 mil a 50 milhões)")
+    parser.add_argument("--quarters", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições de cada caso (vale o melhor tempo)")
+    parser.add_argument("--requests", type=int, default=200, help="Requisições por endpoint da API")
+    parser.add_argument("--data-dir", type=Path, help="Onde gerar/reaproveitar o FTP sintético")
+    parser.add_argument("--no-memory", action="store_true", help="Não mede o pico de memória (sem a execução extra)")
+    parser.add_argument("--output", type=Path, help="Arquivo JSON do resultado (padrão: benchmarks/results/)")
+    parser.add_argument("--compare", type=Path, help="Resultado anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Piora relativa aceita no --compare")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    data_dir = args.data_dir or Path(tempfile.gettempdir()) / f"ans_sintetico_{args.rows}_{args.quarters}_{args.seed}"
+    start = time.perf_counter()
+    params = synthetic_ans.generate(data_dir, args.rows, args.quarters, seed=args.seed)
+    print(f"Dados sintéticos: {params['rows']:,} linhas, {params['operators']:,} operadoras "
+          f"({time.perf_counter() - start:.1f}s) em {data_dir}")
+
+    server, base_url = synthetic_ans.serve(data_dir)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            results, db_url, snapshot_dir = run_stages(data_dir, Path(tmp), base_url, args.quarters, args.repeat,
+                                                       not args.no_memory)
+            results.update(run_api(db_url, snapshot_dir, args.requests, not args.no_memory))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    commit, dirty = git_revision()
+    report = {
+        "meta": {
+            "commit": commit, "dirty": dirty, "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            **params, "repeat": args.repeat, "requests": args.requests,
+        },
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"{(commit or 'local')[:10]}_{params['rows']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    for name, result in results.items():
+        memory = f"{result['peak_mb']:>8.1f} MB" if "peak_mb" in result else ""
+        print(f"{name:<45} {result['seconds']:>10.4f} s {memory}")
+    print(f"Resultado salvo em {output}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} caso(s) mais lento(s) que a tolerância de {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Gerador determinístico de dados sintéticos no formato da ANS e servidor HTTP local.
+
+Monta, em `--out`, a mesma árvore do FTP de dados abertos usada pelas etapas 1 e 2:
+
+    demonstracoes_contabeis/<ano>/<N>T<ano>.zip        (CSV contábil trimestral)
+    operadoras_de_plano_de_saude_ativas/Relatorio_cadop.csv
+
+Os CSVs seguem o formato real: latin1, `;`, todos os campos entre aspas, valores
+pt-BR (`"1.234.567,89"`) e uma árvore de CD_CONTA_CONTABIL em que cada conta
+sintética é a soma das suas filhas. A mesma semente gera os mesmos bytes (ZIPs
+com data fixa), então os hashes da origem são estáveis entre execuções.
+
+Uso:
+    python benchmarks/synthetic_ans.py --rows 1000000 --out /tmp/ans
+    python benchmarks/synthetic_ans.py --rows 1000000 --out /tmp/ans --serve 8765
+"""
+import argparse
+import json
+import threading
+import time
+import zipfile
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ACCOUNTING_DIR = "demonstracoes_contabeis"
+CADOP_PATH = "operadoras_de_plano_de_saude_ativas/Relatorio_cadop.csv"
+HEADER = ["DATA", "REG_ANS", "CD_CONTA_CONTABIL", "DESCRICAO", "VL_SALDO_INICIAL", "VL_SALDO_FINAL"]
+
+# Plano de contas reduzido (conta, descrição); contas sem filhas recebem valores aleatórios
+ACCOUNTS = [
+    ("1", "ATIVO"),
+    ("12", "ATIVO CIRCULANTE"),
+    ("121", "DISPONÍVEL"),
+    ("122", "REALIZÁVEL"),
+    ("13", "ATIVO NÃO CIRCULANTE"),
+    ("2", "PASSIVO"),
+    ("21", "PASSIVO CIRCULANTE"),
+    ("211", "PROVISÕES TÉCNICAS DE OPERAÇÕES DE ASSISTÊNCIA À SAÚDE"),
+    ("23", "PATRIMÔNIO LÍQUIDO"),
+    ("3", "RECEITAS"),
+    ("31", "CONTRAPRESTAÇÕES EFETIVAS DE PLANO DE ASSISTÊNCIA À SAÚDE"),
+    ("311", "RECEITAS COM OPERAÇÕES DE ASSISTÊNCIA À SAÚDE"),
+    ("33", "OUTRAS RECEITAS OPERACIONAIS"),
+    ("4", "DESPESAS"),
+    ("41", "EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS DE ASSISTÊNCIA A SAÚDE"),
+    ("411", "EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS - CONSULTAS MÉDICAS"),
+    ("412", "EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS - INTERNAÇÕES"),
+    ("413", "EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS - EXAMES"),
+    ("46", "DESPESAS ADMINISTRATIVAS"),
+    ("461", "DESPESAS COM PESSOAL PRÓPRIO"),
+]
+CODES = [code for code, _ in ACCOUNTS]
+LEAVES = [code for code in CODES if not any(c != code and c.startswith(code) for c in CODES)]
+# Conta x folha: 1 quando a folha pertence à subárvore da conta
+TREE = np.array([[leaf.startswith(code) for leaf in LEAVES] for code in CODES], dtype=np.int64)
+
+UFS = ["SP", "RJ", "MG", "RS", "PR", "SC", "BA", "PE", "CE", "GO", "DF", "ES", "PA", "AM", "MT", "MS"]
+MODALIDADES = ["Medicina de Grupo", "Cooperativa Médica", "Odontologia de Grupo", "Autogestão",
+               "Seguradora Especializada em Saúde", "Cooperativa Odontológica", "Filantropia"]
+WORDS = ["SAÚDE", "ASSISTÊNCIA", "MÉDICA", "ODONTOLÓGICA", "COOPERATIVA", "PLANO", "VIDA",
+         "HOSPITAL", "SERVIÇOS", "ADMINISTRADORA", "BENEFÍCIOS", "CLÍNICA", "NORTE", "SUL"]
+SYLLABLES = ["BA", "CE", "DI", "FO", "GU", "LA", "ME", "NI", "PO", "RU", "SA", "TE", "VI", "XO", "ZU"]
+CADOP_COLUMNS = ["REGISTRO_OPERADORA", "CNPJ", "Razao_Social", "Nome_Fantasia", "Modalidade", "Logradouro",
+                 "Numero", "Complemento", "Bairro", "Cidade", "UF", "CEP", "DDD", "Telefone", "Fax",
+                 "Endereco_eletronico", "Representante", "Cargo_Representante",
+                 "Regiao_de_Comercializacao", "Data_Registro_ANS"]
+
+# Operadoras por bloco gravado no ZIP (limita a memória do gerador)
+CHUNK_OPERATORS = 20_000
+
+
+def quarters_until(count, until=(2023, 4)):
+    """Os `count` trimestres terminando em `until`, do mais antigo ao mais recente"""
+    year, n = until
+    result = []
+    for _ in range(count):
+        result.append((year, n))
+        year, n = (year, n - 1) if n > 1 else (year - 1, 4)
+    return result[::-1]
+
+
+# Grupos de milhar e centavos já formatados, indexados pelo valor
+_GROUP = np.array([str(i) for i in range(1000)], dtype=object)
+_GROUP_PADDED = np.array([f"{i:03d}" for i in range(1000)], dtype=object)
+_CENTS = np.array([f"{i:02d}" for i in range(100)], dtype=object)
+
+
+def format_br(cents):
+    """Centavos (int64) como texto pt-BR com milhares: -123456789 -> '-1.234.567,89'"""
+    absolute = np.abs(cents)
+    rest = absolute // 100
+    group, rest = rest % 1000, rest // 1000
+    text = np.where(rest == 0, _GROUP[group], _GROUP_PADDED[group])
+    while (rest > 0).any():
+        active = rest > 0
+        group, rest = rest % 1000, rest // 1000
+        text = np.where(active, np.where(rest == 0, _GROUP[group], _GROUP_PADDED[group]) + "." + text, text)
+    return np.where(cents < 0, "-", "").astype(object) + text + "," + _CENTS[absolute % 100]
+
+
+def quoted(*columns):
+    """Texto CSV (`"a";"b";...` por linha) a partir de colunas do mesmo tamanho"""
+    template = ";".join(['"{}"'] * len(columns)) + "\n"
+    return "".join(template.format(*row) for row in zip(*columns))
+
+
+def make_operators(count, seed):
+    """Registro ANS (6 dígitos, únicos), CNPJ, razão social, UF e modalidade de cada operadora"""
+    rng = np.random.default_rng([seed, 0])
+    registros = rng.choice(900_000, size=count, replace=False) + 100_000
+    own = rng.integers(0, len(SYLLABLES), size=(count, 4))
+    words = rng.integers(0, len(WORDS), size=(count, 2))
+    names = [f"{''.join(SYLLABLES[s] for s in own[i])} {WORDS[a]} {WORDS[b]} LTDA"
+             for i, (a, b) in enumerate(words)]
+    return pd.DataFrame({
+        "REGISTRO_OPERADORA": registros.astype(str),
+        "CNPJ": [f"{c:08d}000{d:03d}" for c, d in zip(rng.integers(0, 10**8, count), rng.integers(100, 999, count))],
+        "Razao_Social": names,
+        "UF": np.array(UFS)[rng.integers(0, len(UFS), count)],
+        "Modalidade": np.array(MODALIDADES)[rng.integers(0, len(MODALIDADES), count)],
+    })
+
+
+def write_quarter(path, year, n, operators, seed):
+    """ZIP de um trimestre: uma linha por (operadora, conta), em blocos de CHUNK_OPERATORS"""
+    info = zipfile.ZipInfo(f"{n}T{year}.csv", date_time=(year, 3 * n, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    data = f"{year}-{3 * n - 2:02d}-01"
+    codes = np.array(CODES)
+    descriptions = np.array([desc for _, desc in ACCOUNTS])
+    with zipfile.ZipFile(path, "w") as z, z.open(info, "w", force_zip64=True) as out:
+        out.write((";".join(f'"{h}"' for h in HEADER) + "\n").encode("latin1"))
+        for block, start in enumerate(range(0, len(operators), CHUNK_OPERATORS)):
+            regs = operators[start:start + CHUNK_OPERATORS]
+            rng = np.random.default_rng([seed, year, n, block])
+            # Folhas com valores de até 10 milhões; contas sintéticas = soma das filhas
+            leaves = rng.integers(0, 10**9, size=(len(regs), len(LEAVES)))
+            final = leaves @ TREE.T
+            initial = final - rng.integers(0, 10**8, size=final.shape)
+            lines = quoted(
+                np.full(final.size, data),
+                np.repeat(regs, len(CODES)),
+                np.tile(codes, len(regs)),
+                np.tile(descriptions, len(regs)),
+                format_br(initial.ravel()),
+                format_br(final.ravel()),
+            )
+            out.write(lines.encode("latin1"))
+
+
+def write_cadop(path, operators, seed):
+    """Relatorio_cadop.csv com todas as colunas do cadastro real (latin1, `;`, aspas)"""
+    rng = np.random.default_rng([seed, 1])
+    operators = operators.reset_index(drop=True)
+    count = len(operators)
+    numbers = pd.Series(rng.integers(1, 5000, count)).astype(str)
+    columns = {
+        **{col: operators[col] for col in ["REGISTRO_OPERADORA", "CNPJ", "Razao_Social", "Modalidade", "UF"]},
+        "Nome_Fantasia": operators["Razao_Social"].str.split(" ").str[0],
+        "Logradouro": "RUA " + operators["Razao_Social"].str.split(" ").str[0],
+        "Numero": numbers,
+        "Complemento": "",
+        "Bairro": "CENTRO",
+        "Cidade": "CIDADE " + operators["UF"],
+        "CEP": pd.Series(rng.integers(10**7, 10**8, count)).astype(str),
+        "DDD": pd.Series(rng.integers(11, 99, count)).astype(str),
+        "Telefone": pd.Series(rng.integers(10**7, 10**8, count)).astype(str),
+        "Fax": "",
+        "Endereco_eletronico": "contato@" + operators["REGISTRO_OPERADORA"] + ".com.br",
+        "Representante": "REPRESENTANTE " + numbers,
+        "Cargo_Representante": "DIRETOR",
+        "Regiao_de_Comercializacao": pd.Series(rng.integers(1, 7, count)).astype(str),
+        "Data_Registro_ANS": "2000-01-01",
+    }
+    frame = pd.DataFrame(columns)[CADOP_COLUMNS].astype(str)
+    with open(path, "w", encoding="latin1", newline="") as out:
+        out.write(";".join(f'"{c}"' for c in CADOP_COLUMNS) + "\n")
+        out.write(quoted(*(frame[c] for c in CADOP_COLUMNS)))
+
+
+def generate(out_dir, rows=100_000, quarters=4, until=(2023, 4), seed=42):
+    """
+    Gera (ou reaproveita, se os parâmetros forem os mesmos) o FTP sintético em
+    `out_dir`. `rows` é o total aproximado de linhas nos CSVs contábeis: cada
+    operadora tem uma linha por conta do plano em cada trimestre. Cerca de 2%
+    das operadoras ficam fora do cadastro e o cadastro tem 5% de operadoras
+    sem movimento, como no dado real. Retorna os parâmetros efetivos.
+    """
+    out_dir = Path(out_dir)
+    operators_count = max(1, min(880_000, rows // (quarters * len(CODES))))
+    params = {"rows": operators_count * quarters * len(CODES), "quarters": quarters, "until": list(until),
+              "operators": operators_count, "seed": seed}
+    meta_path = out_dir / "sintetico.json"
+    if meta_path.exists() and json.loads(meta_path.read_text()) == params:
+        return params
+
+    extra = max(1, operators_count // 20)
+    operators = make_operators(operators_count + extra, seed)
+    active = operators["REGISTRO_OPERADORA"].to_numpy()[:operators_count]
+    # Cadastro: operadoras com movimento (menos ~2%) + operadoras sem movimento
+    registered = operators.drop(index=range(0, operators_count, 50))
+
+    for year, n in quarters_until(quarters, until):
+        folder = out_dir / ACCOUNTING_DIR / str(year)
+        folder.mkdir(parents=True, exist_ok=True)
+        write_quarter(folder / f"{n}T{year}.zip", year, n, active, seed)
+    cadop = out_dir / CADOP_PATH
+    cadop.parent.mkdir(parents=True, exist_ok=True)
+    write_cadop(cadop, registered, seed)
+    meta_path.write_text(json.dumps(params))
+    return params
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve(root, port=0):
+    """
+    Serve `root` por HTTP em segundo plano (listagens de diretório no lugar do
+    índice do FTP, com Last-Modified para as requisições condicionais).
+    Retorna (servidor, url base); encerre com server.shutdown().
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), partial(QuietHandler, directory=str(root)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", required=True, help="Diretório de saída")
+    parser.add_argument("--rows", type=int, default=100_000, help="Linhas contábeis no total (10 mil a 50 milhões)")
+    parser.add_argument("--quarters", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--serve", type=int, metavar="PORTA", help="Depois de gerar, serve o diretório nesta porta")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    params = generate(args.out, args.rows, args.quarters, seed=args.seed)
+    print(f"{params['rows']:,} linhas, {params['operators']:,} operadoras, {args.quarters} trimestres "
+          f"em {time.perf_counter() - start:.1f}s")
+    if args.serve is not None:
+        server, url = serve(args.out, args.serve)
+        print(f"Servindo em {url} (BASE_URL = {url}{ACCOUNTING_DIR}/)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
 import os
 import re
+import sys
+import time
+import shutil
+import argparse
 import zipfile
 import requests
 import pandas as pd
 from bs4 import BeautifulSoup
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from requests.adapters import HTTPAdapter
 from pathlib import Path
+from urllib.parse import urljoin
 import logging
 
 # Configuração de Logs
@@ -15,114 +22,236 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 DATA_RAW = BASE_DIR / "data" / "raw"
 DATA_PROCESSED = BASE_DIR / "data" / "processed"
+CACHE_DIR = BASE_DIR / "data" / "cache"
 OUTPUT_ZIP = BASE_DIR / "consolidado_despesas.zip"
+OUTPUT_CSV = DATA_PROCESSED / "consolidado_despesas.csv"
+# Formato intermediário lido pelas etapas 2 e 3 (o CSV/ZIP fica só como entregável)
+OUTPUT_PARQUET = DATA_PROCESSED / "consolidado_despesas.parquet"
+# Modo incremental: resultado de cada trimestre + manifesto com o hash da origem
+QUARTERS_DIR = DATA_PROCESSED / "trimestres"
+MANIFEST = DATA_PROCESSED / "manifest.json"
+# Relatórios de execução (tempos, contadores e pico de memória) em JSON
+REPORTS_DIR = DATA_PROCESSED / "relatorios"
+
+# Módulos compartilhados entre as etapas (src/common)
+sys.path.insert(0, str(BASE_DIR / "src"))
+from common import deliverable, metrics, stages
+from common.download_cache import DownloadCache
+from common.numeric import parse_br_decimal, log_malformed
+from common.interchange import PARQUET_AVAILABLE, cast_partitions, read_table, write_table
+from common.manifest import file_sha256, load_manifest, quarter_key, save_manifest
 
 # URL Base da ANS (Ajustada para o caminho provável das demonstrações contábeis)
 # A URL do PDF é a raiz. Navegando, geralmente é demonstracoes_contabeis/
 BASE_URL = "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/"
 
-def get_available_quarters():
+# Download concorrente: número de trimestres baixados em paralelo e tamanho do
+# bloco gravado em disco (o ZIP nunca fica inteiro em memória)
+DEFAULT_WORKERS = 3
+CHUNK_SIZE = 1024 * 1024
+
+# Listagens do FTP já interpretadas ficam válidas por este tempo (segundos)
+LISTING_TTL = 6 * 3600
+
+# Leitura do CSV contábil em blocos de linhas (0 = arquivo inteiro em memória)
+CHUNK_ROWS = 200_000
+
+def create_session(pool_size=DEFAULT_WORKERS):
+    """Cria uma sessão HTTP com pool de conexões compartilhado entre as threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.verify = False # gov.br as vezes tem erro de cert
+    return session
+
+def create_cache(pool_size=DEFAULT_WORKERS):
+    """Cache de downloads (requisições condicionais e retomada) sobre a sessão compartilhada"""
+    return DownloadCache(CACHE_DIR, create_session(pool_size))
+
+def parse_quarter_arg(text):
+    """Converte '2023-1T' (ou '2023-1') em (2023, 1)"""
+    m = re.match(r'^(\d{4})-?([1-4])T?$', text.strip(), re.IGNORECASE)
+    if not m:
+        raise ValueError(f"Trimestre inválido: {text} (use AAAA-NT, ex.: 2023-1T)")
+    return int(m.group(1)), int(m.group(2))
+
+def list_links(cache, url):
+    """Links (href absolutos) de uma página de índice do FTP da ANS"""
+    content = cache.read(url)
+    if content is None:
+        raise RuntimeError(f"Falha ao listar {url}")
+    soup = BeautifulSoup(content, 'html.parser')
+    return [urljoin(url, a.get('href')) for a in soup.find_all('a') if a.get('href')]
+
+def list_year(cache, year):
+    """
+    Lista os trimestres de um ano, resolvendo cada entrada para o ZIP real:
+    ZIPs direto na pasta do ano (1T2023.zip) ou dentro de subpastas (1T/).
+    Retorna [(ano, 'NT', url_do_zip)].
+    """
+    year_url = f"{BASE_URL}{year}/"
+    logging.info(f"Verificando ano {year}...")
+    found = {}
+    for link in list_links(cache, year_url):
+        name = link.rstrip('/').rsplit('/', 1)[-1]
+        # Procura padrões como 1T2023, 1T, 1Q etc. O padrão da ANS varia entre anos.
+        m = re.search(r'([1-4])[TQ]', name, re.IGNORECASE)
+        if not m or not link.startswith(year_url):
+            continue
+        quarter = f"{m.group(1)}T"
+        if link.lower().endswith('.zip'):
+            found.setdefault(quarter, link)
+        elif link.endswith('/') and quarter not in found:
+            zips = sorted(l for l in list_links(cache, link) if l.lower().endswith('.zip'))
+            if zips:
+                found[quarter] = zips[0]
+    return [(year, q, url) for q, url in found.items()]
+
+def get_available_quarters(cache=None, count=3, since=None, until=None, workers=DEFAULT_WORKERS):
     """
     Busca na página da ANS os anos e trimestres disponíveis.
-    Retorna uma lista ordenada de tuplas (ano, trimestre, url).
+    Retorna uma lista ordenada (mais recente primeiro) de tuplas (ano, trimestre, url),
+    com até `count` trimestres dentro do intervalo [since, until] (tuplas (ano, n)).
+    As listagens dos anos são buscadas em paralelo (no máximo `workers` por vez) e
+    o resultado já interpretado fica em cache por LISTING_TTL segundos. Se a
+    listagem de um ano falhar, vale a última salva; sem ela, o ano fica de fora
+    (com erro no log). Nunca há URLs inventadas.
     """
+    cache = cache or create_cache(workers)
+    listing_path = CACHE_DIR / "listagem_trimestres.json"
+    listing = load_manifest(listing_path)
+    if listing.get('base_url') != BASE_URL:
+        listing = {'base_url': BASE_URL, 'years': {}}
+    now = time.time()
+
+    def fresh(entry):
+        return entry is not None and now - entry.get('fetched_at', 0) < LISTING_TTL
+
+    def in_range(year, quarter):
+        key = (int(year), int(quarter[0]))
+        return (since is None or key >= since) and (until is None or key <= until)
+
     logging.info(f"Acessando {BASE_URL} para listar arquivos...")
-    try:
-        response = requests.get(BASE_URL, verify=False) # verify=False pois gov.br as vezes tem erro de cert
-        if response.status_code != 200:
-            logging.error(f"Erro ao acessar URL: {response.status_code}")
-            return []
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        links = soup.find_all('a')
-        
-        # Regex para encontrar pastas de ano (ex: 2023/)
-        year_links = []
-        for link in links:
-            href = link.get('href')
-            if href and re.match(r'^\d{4}/?$', href):
-                year_links.append(href.strip('/'))
-        
-        year_links.sort(reverse=True) # Anos mais recentes primeiro
-        
-        quarters = []
-        
-        # Para cada ano, busca os trimestres
-        for year in year_links:
-            if len(quarters) >= 3: break # Já temos o suficiente (otimização)
-            
-            year_url = f"{BASE_URL}{year}/"
-            logging.info(f"Verificando ano {year}...")
-            resp_year = requests.get(year_url, verify=False)
-            soup_year = BeautifulSoup(resp_year.content, 'html.parser')
-            
-            q_links = soup_year.find_all('a')
-            found_quarters = []
-            for ql in q_links:
-                href = ql.get('href')
-                # Procura padrões como 1T2023, 202301, 1_trimestre, etc. 
-                # O padrão da ANS varia, mas geralmente é trimestral em pastas.
-                # Assumindo estrutura comum de pasta ou arquivo zip direto.
-                # O PDF diz estrutura "YYYY/QQ/".
-                if href and (re.search(r'[1-4]T', href, re.IGNORECASE) or re.search(r'[1-4]Q', href, re.IGNORECASE)):
-                     found_quarters.append(href)
-            
-            # Ordena trimestres do mais recente pro antigo
-            found_quarters.sort(reverse=True)
-            
-            for q in found_quarters:
-                full_url = f"{year_url}{q}"
-                quarters.append((year, q.strip('/'), full_url))
-                if len(quarters) >= 3: break
-                
-        return quarters[:3]
-
-    except Exception as e:
-        logging.error(f"Erro ao listar trimestres: {e}")
-        # Fallback de segurança para garantir execução mesmo sem scraping
-        logging.warning("Usando fallback de trimestres.")
-        return [
-            ("2023", "3T", "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/2023/3T2023.zip"),
-            ("2023", "2T", "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/2023/2T2023.zip"),
-            ("2023", "1T", "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/2023/1T2023.zip")
-        ]
+    if not fresh(listing.get('root')):
+        try:
+            # Regex para encontrar pastas de ano (ex: 2023/)
+            years = sorted({
+                m.group(1) for link in list_links(cache, BASE_URL)
+                if (m := re.search(r'/(\d{4})/?$', link)) and link.startswith(BASE_URL)
+            }, reverse=True)
+            listing['root'] = {'fetched_at': now, 'years': years}
+        except Exception as e:
+            # Sem a página raiz, vale a última listagem salva (mesmo vencida); sem ela, nada
+            if listing.get('root') is None:
+                logging.error(f"Erro ao listar os anos em {BASE_URL}: {e}")
+                return []
+            logging.warning(f"Erro ao listar os anos em {BASE_URL}: {e}. Usando a listagem salva.")
+    years = [y for y in listing['root']['years']
+             if (since is None or int(y) >= since[0]) and (until is None or int(y) <= until[0])]
+
+    def list_or_none(year):
+        try:
+            return list_year(cache, year)
+        except Exception as e:
+            logging.error(f"Erro ao listar o ano {year}: {e}")
+            return None
+
+    # Sem início definido, busca só os anos necessários para `count` (4 trimestres por ano)
+    batch = max(1, len(years) if since is not None or not count else count // 4 + 1)
+    quarters = []
+    for start in range(0, len(years), batch):
+        pending = [y for y in years[start:start + batch] if not fresh(listing['years'].get(y))]
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending) or 1))) as executor:
+            for year, found in zip(pending, executor.map(list_or_none, pending)):
+                if found is not None:
+                    listing['years'][year] = {'fetched_at': now, 'quarters': found}
+                elif year in listing['years']:
+                    logging.warning(f"Ano {year}: usando a listagem salva.")
+                else:
+                    # Só os trimestres encontrados de fato; o ano fica de fora desta execução
+                    logging.warning(f"Ano {year} ignorado: listagem indisponível.")
+        for year in years[start:start + batch]:
+            entry = listing['years'].get(year)
+            if entry is not None:
+                quarters += [tuple(q) for q in entry['quarters'] if in_range(q[0], q[1])]
+        if count and len(quarters) >= count:
+            break
 
-def download_and_extract(url, year, quarter):
-    """Baixa o ZIP e extrai na pasta raw"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    save_manifest(listing_path, listing)
+
+    # Ordena trimestres do mais recente pro antigo
+    quarters.sort(key=lambda q: (int(q[0]), q[1]), reverse=True)
+    return quarters[:count] if count else quarters
+
+def download_and_extract(url, year, quarter, cache=None, chunk_size=CHUNK_SIZE):
+    """
+    Baixa o ZIP (via cache em disco, em blocos) e extrai na pasta raw apenas o
+    CSV de despesas (mesma regra de find_expense_file). Se o ZIP não mudou desde
+    a última extração, reaproveita o diretório já extraído. `url` é a do ZIP, já
+    resolvida pela listagem (list_year).
+    """
     target_dir = DATA_RAW / f"{year}_{quarter}"
     os.makedirs(target_dir, exist_ok=True)
+    cache = cache or create_cache(1)
     
     logging.info(f"Baixando {year}-{quarter} de {url}...")
-    try:
-        # Se a URL for um diretório, precisamos achar o ZIP dentro dele
-        if not url.endswith('.zip'):
-             # Lógica simplificada: assume que a URL já aponta pro ZIP no fallback ou tenta adivinhar
-             # Em um cenário real, faria outro requests.get para achar o .zip
-             url = url.rstrip('/') + '.zip'
-
-        response = requests.get(url, verify=False)
-        if response.status_code == 200:
-            with zipfile.ZipFile(BytesIO(response.content)) as z:
-                z.extractall(target_dir)
+    with metrics.span("download_and_extract", trimestre=f"{year}-{quarter}"):
+        try:
+            # O ZIP vai para disco em blocos: o pico de memória depende do chunk, não do arquivo
+            zip_path, meta = cache.fetch(url, chunk_size=chunk_size)
+            if zip_path is None:
+                return None
+            metrics.count("zip_bytes", meta['size'], trimestre=f"{year}-{quarter}")
+        
+            # Marca com o hash do ZIP de origem: evita reextrair o mesmo conteúdo
+            marker = target_dir / ".source_sha256"
+            if marker.exists() and marker.read_text() == meta['sha256'] and find_expense_file(target_dir):
+                logging.info(f"{year}-{quarter} inalterado, usando {target_dir}")
+                return target_dir
+        
+            with zipfile.ZipFile(zip_path) as z:
+                member = select_expense_file(
+                    [info.filename for info in z.infolist() if not info.is_dir()]
+                )
+                if member is None:
+                    logging.warning(f"Nenhum CSV encontrado em {url}")
+                    return target_dir
+                destination = target_dir / os.path.basename(member)
+                with z.open(member) as src, open(destination, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, chunk_size)
+                metrics.count("extracted_bytes", destination.stat().st_size, trimestre=f"{year}-{quarter}")
+            marker.write_text(meta['sha256'])
+        
             logging.info(f"Extraído em {target_dir}")
             return target_dir
-        else:
-            logging.error(f"Falha no download: {response.status_code}")
+        except Exception as e:
+            logging.error(f"Erro ao baixar/extrair {url}: {e}")
             return None
-    except Exception as e:
-        logging.error(f"Erro ao baixar/extrair {url}: {e}")
-        return None
 
-def find_expense_file(directory):
-    """Encontra o arquivo de despesas (Eventos/Sinistros) no diretório"""
-    candidates = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.lower().endswith('.csv'):
-                candidates.append(os.path.join(root, file))
-                # Prioridade por nome
-                if "EVENTOS" in file.upper() or "DESPESA" in file.upper() or "SINISTRO" in file.upper():
-                    return os.path.join(root, file)
+def download_all(quarters, workers=DEFAULT_WORKERS, cache=None):
+    """
+    Baixa os trimestres em paralelo com uma sessão HTTP compartilhada.
+    Retorna os diretórios extraídos na mesma ordem de `quarters`.
+    """
+    workers = max(1, min(workers, len(quarters) or 1))
+    cache = cache or create_cache(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(download_and_extract, url, year, quarter, cache)
+            for year, quarter, url in quarters
+        ]
+        return [f.result() for f in futures]
+
+def select_expense_file(paths):
+    """Escolhe, entre caminhos de arquivos, o CSV de despesas (Eventos/Sinistros)"""
+    candidates = [p for p in paths if p.lower().endswith('.csv')]
+    for path in candidates:
+        # Prioridade por nome
+        name = os.path.basename(path).upper()
+        if "EVENTOS" in name or "DESPESA" in name or "SINISTRO" in name:
+            return path
     
     # Se não achou com nome específico, mas tem CSV (estrutura nova de arquivo único), retorna o primeiro
     if candidates:
@@ -130,126 +259,332 @@ def find_expense_file(directory):
         
     return None
 
-def normalize_and_read(file_path, year, quarter):
-    """Lê CSV, fixando encoding e separadores"""
-    logging.info(f"Processando {file_path}...")
-    try:
-        # Tenta ler com encoding latin1 (comum) ou utf-8
-        try:
-            df = pd.read_csv(file_path, sep=';', encoding='latin1', on_bad_lines='skip', dtype=str)
-        except:
-            df = pd.read_csv(file_path, sep=';', encoding='utf-8', on_bad_lines='skip', dtype=str)
-            
-        # Limpar aspas das colunas se necessário
-        df.columns = df.columns.str.replace('"', '').str.strip()
-        
-        # Mapeamento baseado no arquivo inspecionado:
-        # "DATA";"REG_ANS";"CD_CONTA_CONTABIL";"DESCRICAO";"VL_SALDO_INICIAL";"VL_SALDO_FINAL"
-        
-        if 'REG_ANS' not in df.columns:
-            # Tenta achar coluna que parece REG_ANS
-            for col in df.columns:
-                if 'REG' in col.upper() or 'ANS' in col.upper():
-                    df.rename(columns={col: 'REG_ANS'}, inplace=True)
-                    break
-
-        if 'VL_SALDO_FINAL' not in df.columns:
-             for col in df.columns:
-                if 'VALOR' in col.upper() or 'SALDO' in col.upper():
-                    df.rename(columns={col: 'VL_SALDO_FINAL'}, inplace=True)
-                    break
-        
-        # Filtro: Despesas com Eventos/Sinistros
-        # Geralmente Contas de classe 4 (Despesas Assistenciais)
-        # E especificamente eventos. Vamos filtrar quem tem "EVENTOS" ou "SINISTROS" na descrição
-        # OU conta começa com 4.
+def find_expense_file(directory):
+    """Encontra o arquivo de despesas (Eventos/Sinistros) no diretório"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for file in files:
+            paths.append(os.path.join(root, file))
+    return select_expense_file(paths)
+
+def normalize_columns(columns):
+    """
+    Normaliza os nomes das colunas do CSV contábil.
+    Retorna o mapeamento {nome_original: nome_padronizado}.
+    """
+    # Limpar aspas das colunas se necessário
+    clean = [str(c).replace('"', '').strip() for c in columns]
+    mapping = dict(zip(columns, clean))
+    
+    # Mapeamento baseado no arquivo inspecionado:
+    # "DATA";"REG_ANS";"CD_CONTA_CONTABIL";"DESCRICAO";"VL_SALDO_INICIAL";"VL_SALDO_FINAL"
+    
+    if 'REG_ANS' not in clean:
+        # Tenta achar coluna que parece REG_ANS
+        for original, col in mapping.items():
+            if 'REG' in col.upper() or 'ANS' in col.upper():
+                mapping[original] = 'REG_ANS'
+                break
+
+    if 'VL_SALDO_FINAL' not in mapping.values():
+        for original, col in mapping.items():
+            if 'VALOR' in col.upper() or 'SALDO' in col.upper():
+                mapping[original] = 'VL_SALDO_FINAL'
+                break
+    return mapping
+
+def expense_mask(df):
+    """
+    Filtro: Despesas com Eventos/Sinistros
+    Geralmente Contas de classe 4 (Despesas Assistenciais)
+    E especificamente eventos. Filtra quem tem "EVENTOS" ou "SINISTROS" na descrição
+    OU conta começa com 4.
+    """
+    mask = pd.Series(False, index=df.index)
+    
+    if 'CD_CONTA_CONTABIL' in df.columns:
+        mask |= df['CD_CONTA_CONTABIL'].str.startswith('4', na=False)
         
-        mask = pd.Series(False, index=df.index)
+    if 'DESCRICAO' in df.columns:
+        mask |= df['DESCRICAO'].str.upper().str.contains('EVENTO', na=False)
+        mask |= df['DESCRICAO'].str.upper().str.contains('SINISTRO', na=False)
+    return mask
+
+def finalize_expenses(df, year, quarter, source=None):
+    """Cria as colunas padrão e converte os valores das linhas já filtradas"""
+    # Cria colunas padrão
+    df['Trimestre'] = quarter
+    df['Ano'] = year
+    
+    # Tratamento de valores
+    if 'VL_SALDO_FINAL' in df.columns:
+        # Formato pt-BR (1.234,56, com ou sem aspas); células inválidas viram NaN e vão para o log
+        df['ValorDespesas'], malformed = parse_br_decimal(df['VL_SALDO_FINAL'])
+        log_malformed(malformed, source or f"{year}-{quarter}")
+        metrics.count("values_malformed", len(malformed), trimestre=f"{year}-{quarter}")
+    else:
+        df['ValorDespesas'] = 0.0
         
-        if 'CD_CONTA_CONTABIL' in df.columns:
-            mask |= df['CD_CONTA_CONTABIL'].str.startswith('4', na=False)
-            
-        if 'DESCRICAO' in df.columns:
-            mask |= df['DESCRICAO'].str.upper().str.contains('EVENTO', na=False)
-            mask |= df['DESCRICAO'].str.upper().str.contains('SINISTRO', na=False)
-            
-        if mask.any():
-            df = df[mask]
+    # Renomear para o padrão interno esperado
+    df.rename(columns={'REG_ANS': 'CNPJ'}, inplace=True) # Placeholder ID
+    return df
+
+def open_accounting_csv(file_path, chunksize=None):
+    """Abre o CSV contábil (latin1 comum, utf-8 como alternativa), inteiro ou em blocos"""
+    # Tenta ler com encoding latin1 (comum) ou utf-8
+    try:
+        return pd.read_csv(file_path, sep=';', encoding='latin1', on_bad_lines='skip', dtype=str, chunksize=chunksize)
+    except:
+        return pd.read_csv(file_path, sep=';', encoding='utf-8', on_bad_lines='skip', dtype=str, chunksize=chunksize)
+
+def iter_expense_chunks(file_path, year, quarter, chunksize=CHUNK_ROWS):
+    """
+    Versão em streaming de normalize_and_read: lê o CSV em blocos de `chunksize`
+    linhas, filtra cada bloco e produz apenas as linhas de despesas, com
+    CNPJ categórico e valores float64. O pico de memória depende do bloco.
+    """
+    def read(filtered):
+        mapping = None
+        with open_accounting_csv(file_path, chunksize) as reader:
+            for chunk in reader:
+                # Normalização das colunas feita uma vez, a partir do cabeçalho
+                if mapping is None:
+                    mapping = normalize_columns(chunk.columns)
+                chunk.rename(columns=mapping, inplace=True)
+                # Linhas do arquivo contadas só na primeira passada; a releitura sem
+                # filtro tem contador próprio
+                metrics.count("rows_read" if filtered else "rows_reread", len(chunk),
+                              trimestre=f"{year}-{quarter}")
+                if filtered:
+                    chunk = chunk[expense_mask(chunk)]
+                metrics.count("rows_kept", len(chunk), trimestre=f"{year}-{quarter}")
+                if chunk.empty:
+                    continue
+                chunk = finalize_expenses(chunk.copy(), year, quarter, file_path)
+                if 'CNPJ' in chunk.columns:
+                    chunk['CNPJ'] = chunk['CNPJ'].astype('category')
+                yield chunk
+
+    found = False
+    for chunk in read(filtered=True):
+        found = True
+        yield chunk
+    
+    # Como no modo em memória: se nenhuma linha casou com o filtro, mantém o arquivo inteiro
+    if not found:
+        yield from read(filtered=False)
+
+def normalize_and_read(file_path, year, quarter, chunksize=None):
+    """Lê CSV, fixando encoding e separadores (em blocos se `chunksize` for informado)"""
+    logging.info(f"Processando {file_path}...")
+    with metrics.span("normalize_and_read", trimestre=f"{year}-{quarter}"):
+        try:
+            if chunksize:
+                chunks = list(iter_expense_chunks(file_path, year, quarter, chunksize))
+                if not chunks:
+                    return pd.DataFrame()
+                df = pd.concat(chunks)
+                if 'CNPJ' in df.columns:
+                    df['CNPJ'] = df['CNPJ'].astype('category')
+                return df
+
+            df = open_accounting_csv(file_path)
+            df.rename(columns=normalize_columns(df.columns), inplace=True)
+            metrics.count("rows_read", len(df), trimestre=f"{year}-{quarter}")
         
-        # Cria colunas padrão
-        df['Trimestre'] = quarter
-        df['Ano'] = year
+            mask = expense_mask(df)
+            if mask.any():
+                df = df[mask]
+            metrics.count("rows_kept", len(df), trimestre=f"{year}-{quarter}")
         
-        # Tratamento de valores
-        if 'VL_SALDO_FINAL' in df.columns:
-            # Remove aspas do conteudo se tiver
-            df['ValorDespesas'] = df['VL_SALDO_FINAL'].astype(str).str.replace('"', '').str.replace('.', '').str.replace(',', '.').astype(float)
-        else:
-            df['ValorDespesas'] = 0.0
-            
-        # Renomear para o padrão interno esperado
-        df.rename(columns={'REG_ANS': 'CNPJ'}, inplace=True) # Placeholder ID
+            return finalize_expenses(df, year, quarter, file_path)
+        except Exception as e:
+            logging.error(f"Erro ao ler arquivo {file_path}: {e}")
+            return pd.DataFrame()
+
+def project_quarter(df):
+    """Seleciona as colunas finais do consolidado para o resultado de um trimestre"""
+    # Mapeamos REG_ANS para CNPJ conforme requisito de saída, embora sejam identificadores distintos
+    if 'REG_ANS' in df.columns:
+         df = df.rename(columns={'REG_ANS': 'CNPJ'})
+    
+    cols_to_keep = ['CNPJ', 'Trimestre', 'Ano', 'ValorDespesas']
+    # Adiciona Razao Social vazia se não vier no arquivo (geralmente vem no cadastro)
+    if 'RazaoSocial' not in df.columns:
+        df = df.assign(RazaoSocial='DESCONHECIDO')
         
-        return df
-    except Exception as e:
-        logging.error(f"Erro ao ler arquivo {file_path}: {e}")
-        return pd.DataFrame()
+    final_cols = [c for c in cols_to_keep if c in df.columns] + ['RazaoSocial']
+    return df[final_cols]
+
+def source_hash(dir_path, file_path):
+    """Hash do ZIP de origem (marcado na extração) ou, na falta dele, do próprio CSV"""
+    marker = Path(dir_path) / ".source_sha256"
+    if marker.exists():
+        return marker.read_text()
+    return file_sha256(file_path)
+
+def process_quarter(dir_path, year, quarter, chunksize, previous, load=True, quarters_dir=None):
+    """
+    Processa um trimestre, reaproveitando o resultado salvo quando a origem não mudou.
+    Retorna (DataFrame projetado, entrada do manifesto) ou (None, None).
+    Com `load=False` e pyarrow disponível, devolve o caminho do Parquet do trimestre
+    no lugar do DataFrame (usado pelos processos do pool). `quarters_dir` substitui
+    QUARTERS_DIR (os processos do pool recebem o diretório do processo principal).
+    """
+    quarters_dir = Path(quarters_dir or QUARTERS_DIR)
+    file_path = find_expense_file(dir_path)
+    if not file_path:
+        logging.warning(f"Arquivo de despesas não encontrado em {dir_path}")
+        return None, None
+
+    key = quarter_key(year, quarter)
+    sha = source_hash(dir_path, file_path)
+    stored = quarters_dir / f"{key}.parquet"
+    if previous is not None and previous.get('sha256') == sha and stored.exists():
+        logging.info(f"{year}-{quarter} inalterado, reaproveitando {stored.name}")
+        return (read_table(stored) if load else stored), previous
+
+    df = normalize_and_read(file_path, year, quarter, chunksize=chunksize)
+    if df.empty:
+        return None, None
+    df = project_quarter(df)
+    entry = {'ano': year, 'trimestre': quarter, 'sha256': sha, 'rows': len(df)}
+    if PARQUET_AVAILABLE:
+        os.makedirs(quarters_dir, exist_ok=True)
+        write_table(df, stored)
+        if not load:
+            return stored, entry
+    return df, entry
+
+def _quarter_worker(task, quarters_dir):
+    """
+    Executado em cada processo do pool: processa um trimestre e mede o tempo.
+    Spans e contadores do processo voltam junto, para o relatório da execução.
+    """
+    start = time.perf_counter()
+    with metrics.collect() as report:
+        result, entry = process_quarter(*task, load=False, quarters_dir=quarters_dir)
+    return result, entry, os.getpid(), time.perf_counter() - start, report.snapshot()
+
+def process_all(tasks, processes=1, context=None):
+    """
+    Processa os trimestres (tuplas de argumentos de process_quarter), em paralelo
+    quando `processes` > 1. Os processos devolvem o caminho do Parquet de cada
+    trimestre em vez do DataFrame serializado; a ordem de `tasks` é mantida.
+    `context` é o contexto do multiprocessing (padrão: o método de início da
+    plataforma). Retorna uma lista de (DataFrame, entrada do manifesto).
+    """
+    if processes <= 1 or len(tasks) <= 1:
+        return [process_quarter(*task) for task in tasks]
 
-def main():
+    # O alvo do pool é importável em qualquer método de início (fork, spawn,
+    # forkserver): cada processo carrega este script pelo caminho, não pelo nome
+    # com que o processo principal o carregou
+    worker = partial(stages.call, __file__, '_quarter_worker')
+    results = []
+    with ProcessPoolExecutor(max_workers=min(processes, len(tasks)), mp_context=context) as executor:
+        outputs = executor.map(worker, tasks, [QUARTERS_DIR] * len(tasks))
+        for task, (result, entry, pid, elapsed, report) in zip(tasks, outputs):
+            logging.info(f"{task[1]}-{task[2]} processado em {elapsed:.2f}s (processo {pid})")
+            metrics.merge(report)
+            # Resultado compacto: com pyarrow o processo devolve só o caminho do Parquet
+            if isinstance(result, Path):
+                result = read_table(result)
+            results.append((result, entry))
+    return results
+
+def main(workers=DEFAULT_WORKERS, chunksize=CHUNK_ROWS, full=False, processes=1,
+         count=3, since=None, until=None, output_format='zip', compresslevel=None, keep_csv=False):
+    """
+    Baixa, filtra e consolida os trimestres. Retorna o consolidado (com Ano e
+    Trimestre nos tipos da leitura do Parquet) ou None se nada foi gerado ou se
+    nenhum trimestre mudou desde a última execução.
+    `output_format`/`compresslevel` escolhem o entregável (ZIP, gzip ou zstd) e
+    `keep_csv` mantém o CSV sem compressão em data/processed.
+    """
     os.makedirs(DATA_RAW, exist_ok=True)
     os.makedirs(DATA_PROCESSED, exist_ok=True)
     
+    cache = create_cache(workers)
+
+    # Sem pyarrow não há onde guardar o resultado por trimestre: sempre reprocessa tudo
+    incremental = not full and PARQUET_AVAILABLE
+    manifest = load_manifest(MANIFEST) if incremental else {}
+    previous = {quarter_key(q['ano'], q['trimestre']): q for q in manifest.get('quarters', [])}
+
     # 1. Identificar Trimestres
-    quarters = get_available_quarters()
+    quarters = get_available_quarters(cache, count=count, since=since, until=until, workers=workers)
     if not quarters:
         logging.error("Nenhum trimestre encontrado.")
         return
 
     all_data = []
+    entries = []
 
-    # 2. Loop de Download e Processamento
-    for year, quarter, url in quarters:
-        dir_path = download_and_extract(url, year, quarter)
-        if dir_path:
-            file_path = find_expense_file(dir_path)
-            if file_path:
-                df = normalize_and_read(file_path, year, quarter)
-                if not df.empty:
-                    all_data.append(df)
-            else:
-                logging.warning(f"Arquivo de despesas não encontrado em {dir_path}")
+    # 2. Download concorrente e Processamento (na ordem dos trimestres)
+    dirs = download_all(quarters, workers=workers, cache=cache)
+    cache.log_stats()
+    metrics.count("bytes_downloaded", cache.stats['bytes'])
+    metrics.count("download_cache_hits", cache.stats['hits'])
+    tasks = [
+        (dir_path, year, quarter, chunksize, previous.get(quarter_key(year, quarter)))
+        for (year, quarter, url), dir_path in zip(quarters, dirs) if dir_path
+    ]
+    for df, entry in process_all(tasks, processes):
+        if df is not None:
+            all_data.append(df)
+            entries.append(entry)
 
     # 3. Consolidação
     if all_data:
-        final_df = pd.concat(all_data, ignore_index=True)
-        
-        # Selecionar e renomear colunas finais
-        # Mapeamos REG_ANS para CNPJ conforme requisito de saída, embora sejam identificadores distintos
-        if 'REG_ANS' in final_df.columns:
-             final_df.rename(columns={'REG_ANS': 'CNPJ'}, inplace=True)
-        
-        cols_to_keep = ['CNPJ', 'Trimestre', 'Ano', 'ValorDespesas']
-        # Adiciona Razao Social vazia se não vier no arquivo (geralmente vem no cadastro)
-        if 'RazaoSocial' not in final_df.columns:
-            final_df['RazaoSocial'] = 'DESCONHECIDO' 
-            
-        final_cols = [c for c in cols_to_keep if c in final_df.columns] + ['RazaoSocial']
-        final_df = final_df[final_cols]
-
-        output_csv = DATA_PROCESSED / "consolidado_despesas.csv"
-        final_df.to_csv(output_csv, index=False, sep=';', encoding='utf-8')
-        logging.info(f"Arquivo consolidado salvo em {output_csv}")
-        
-        # 4. Zipar
-        with zipfile.ZipFile(OUTPUT_ZIP, 'w', zipfile.ZIP_DEFLATED) as z:
-            z.write(output_csv, arcname="consolidado_despesas.csv")
-        logging.info(f"Arquivo ZIP criado: {OUTPUT_ZIP}")
+        output = deliverable.output_path(OUTPUT_ZIP, OUTPUT_CSV.name, output_format)
+        if incremental and entries == manifest.get('quarters') and output.exists():
+            logging.info("Nenhum trimestre novo ou alterado. Consolidado mantido.")
+            return
+
+        with metrics.span("consolidacao"):
+            final_df = cast_partitions(pd.concat(all_data, ignore_index=True), ['Ano', 'Trimestre'])
+            metrics.count("rows_written", len(final_df))
+
+            write_table(final_df, OUTPUT_PARQUET, partition_cols=['Ano', 'Trimestre'])
+
+            # 4. Exportar entregável: CSV direto no ZIP (o CSV solto só com --keep-csv ou
+            # sem pyarrow, quando ele é a entrada da Etapa 2)
+            output = deliverable.write_csv(final_df, OUTPUT_ZIP, OUTPUT_CSV.name, output_format, compresslevel,
+                                           csv_path=OUTPUT_CSV, keep_csv=keep_csv or not PARQUET_AVAILABLE)
+            logging.info(f"Entregável criado: {output}")
+
+        # Manifesto lido pela Etapa 2 para saber quais trimestres mudaram
+        save_manifest(MANIFEST, {'quarters': entries})
+        return final_df
 
     else:
         logging.error("Nenhum dado processado.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extração e consolidação das despesas da ANS")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Número de trimestres baixados em paralelo")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS,
+                        help="Linhas por bloco na leitura dos CSVs (0 = arquivo inteiro em memória)")
+    parser.add_argument("--full", action="store_true",
+                        help="Reprocessa todos os trimestres, ignorando o manifesto")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Processos para ler/filtrar os trimestres em paralelo (padrão 1)")
+    parser.add_argument("--quarters", type=int, default=3,
+                        help="Quantidade de trimestres mais recentes (0 = todos do intervalo)")
+    parser.add_argument("--since", type=parse_quarter_arg, help="Primeiro trimestre, ex.: 2019-1T")
+    parser.add_argument("--until", type=parse_quarter_arg, help="Último trimestre, ex.: 2023-4T")
+    parser.add_argument("--output-format", choices=list(deliverable.FORMATS), default='zip',
+                        help="Entregável: zip (padrão), gzip (multithread) ou zstd")
+    parser.add_argument("--compresslevel", type=int, help="Nível de compressão (padrão: 6 no zip/gzip, 3 no zstd)")
+    parser.add_argument("--keep-csv", action="store_true", help="Mantém o CSV sem compressão em data/processed")
+    args = parser.parse_args()
+
     # Desabilita warnings de SSL inseguro para o teste
     import urllib3
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    main()
+    with metrics.run("etapa1", REPORTS_DIR):
+        main(workers=args.workers, chunksize=args.chunksize, full=args.full, processes=args.processes,
+             count=args.quarters, since=args.since, until=args.until, output_format=args.output_format,
+             compresslevel=args.compresslevel, keep_csv=args.keep_csv)
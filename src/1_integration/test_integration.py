@@ -0,0 +1,215 @@
+import importlib.util
+import multiprocessing
+import shutil
+import sys
+import threading
+import zipfile
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+import pytest
+
+# Carrega o main.py desta pasta com nome próprio (evita conflito com outros main.py)
+spec = importlib.util.spec_from_file_location("integration_main", Path(__file__).with_name("main.py"))
+integration = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = integration
+spec.loader.exec_module(integration)
+
+CSV_CONTENT = (
+    '"DATA";"REG_ANS";"CD_CONTA_CONTABIL";"DESCRICAO";"VL_SALDO_INICIAL";"VL_SALDO_FINAL"\n'
+    '"2023-01-01";"123456";"41";"EVENTOS CONHECIDOS";"0";"1.234,56"\n'
+)
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def ans_server(tmp_path):
+    """Servidor HTTP local que simula o FTP da ANS servindo ZIPs de fixture"""
+    site = tmp_path / "site"
+    site.mkdir()
+    for quarter in ("1T2023", "2T2023"):
+        with zipfile.ZipFile(site / f"{quarter}.zip", 'w') as z:
+            z.writestr("leiame.txt", "ignorar")
+            z.writestr("outro.csv", "a;b\n")
+            z.writestr(f"{quarter}_EVENTOS.csv", CSV_CONTENT)
+
+    server = HTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(site)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+def test_select_expense_file_prioriza_nome():
+    paths = ["a/leiame.txt", "a/outro.csv", "a/1T2023_EVENTOS.csv"]
+    assert integration.select_expense_file(paths) == "a/1T2023_EVENTOS.csv"
+    assert integration.select_expense_file(["x.csv", "y.csv"]) == "x.csv"
+    assert integration.select_expense_file(["x.txt"]) is None
+
+def test_download_all_extrai_somente_csv_de_despesas(ans_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(integration, "DATA_RAW", tmp_path / "raw")
+    monkeypatch.setattr(integration, "CACHE_DIR", tmp_path / "cache")
+    quarters = [
+        ("2023", "2T", f"{ans_server}2T2023.zip"),
+        ("2023", "1T", f"{ans_server}1T2023.zip"),
+    ]
+
+    dirs = integration.download_all(quarters, workers=2)
+
+    assert dirs == [tmp_path / "raw" / "2023_2T", tmp_path / "raw" / "2023_1T"]
+    for directory, (_, _, url) in zip(dirs, quarters):
+        assert [p.name for p in directory.glob("*.csv")] == [Path(url).stem + "_EVENTOS.csv"]
+        df = integration.normalize_and_read(integration.find_expense_file(directory), "2023", "1T")
+        assert df['ValorDespesas'].tolist() == [1234.56]
+
+def test_download_inexistente_retorna_none(ans_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(integration, "DATA_RAW", tmp_path / "raw")
+    monkeypatch.setattr(integration, "CACHE_DIR", tmp_path / "cache")
+    assert integration.download_all([("2020", "1T", f"{ans_server}1T2020.zip")]) == [None]
+
+def test_segundo_download_usa_cache_condicional(ans_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(integration, "DATA_RAW", tmp_path / "raw")
+    monkeypatch.setattr(integration, "CACHE_DIR", tmp_path / "cache")
+    quarters = [("2023", "1T", f"{ans_server}1T2023.zip")]
+
+    first = integration.create_cache()
+    integration.download_all(quarters, cache=first)
+    assert first.stats["misses"] == 1
+
+    extracted = tmp_path / "raw" / "2023_1T" / "1T2023_EVENTOS.csv"
+    mtime = extracted.stat().st_mtime_ns
+    second = integration.create_cache()
+    assert integration.download_all(quarters, cache=second) == [tmp_path / "raw" / "2023_1T"]
+    assert second.stats == {"hits": 1, "misses": 0, "resumed": 0, "bytes": 0}
+    assert extracted.stat().st_mtime_ns == mtime
+
+@pytest.mark.parametrize("lines", [
+    [
+        '"2023-01-01";"123456";"41";"EVENTOS CONHECIDOS";"0";"1.234,56"',
+        '"2023-01-01";"123456";"31";"RECEITAS";"0";"9.999,00"',
+        '"2023-01-01";"654321";"3";"SINISTROS A LIQUIDAR";"0";"10,5"',
+        '"2023-01-01";"";"411";"OUTROS";"0";"2.000.000,01"',
+        '"2023-01-01";"777";"1";"ATIVO";"0";"3,00"',
+    ],
+    # Nenhuma linha casa com o filtro: o arquivo inteiro é mantido
+    ['"2023-01-01";"1";"1";"ATIVO";"0";"1,00"', '"2023-01-01";"2";"2";"PASSIVO";"0";"2,00"'],
+])
+def test_streaming_identico_ao_modo_em_memoria(tmp_path, lines):
+    csv_path = tmp_path / "despesas.csv"
+    csv_path.write_text(CSV_CONTENT.splitlines()[0] + "\n" + "\n".join(lines) + "\n", encoding="latin1")
+
+    in_memory = integration.normalize_and_read(csv_path, "2023", "1T")
+    streamed = integration.normalize_and_read(csv_path, "2023", "1T", chunksize=2)
+
+    assert streamed['CNPJ'].dtype == 'category'
+    assert streamed['ValorDespesas'].dtype == 'float64'
+    assert streamed.to_csv(sep=';', index=False) == in_memory.to_csv(sep=';', index=False)
+
+def test_contadores_da_passada_sem_filtro(tmp_path):
+    # Nenhuma linha de despesa: a segunda passada relê o arquivo, contada à parte
+    csv_path = tmp_path / "despesas.csv"
+    csv_path.write_text(CSV_CONTENT.splitlines()[0] + '\n"2023-01-01";"1";"1";"ATIVO";"0";"1,00"\n'
+                        '"2023-01-01";"2";"2";"PASSIVO";"0";"2,00"\n', encoding="latin1")
+    with integration.metrics.collect() as report:
+        assert len(integration.normalize_and_read(csv_path, "2023", "1T", chunksize=1)) == 2
+    counters = {counter['name']: counter['value'] for counter in report.snapshot()['counters']}
+    assert (counters['rows_read'], counters['rows_reread'], counters['rows_kept']) == (2, 2, 2)
+
+# spawn/forkserver: os processos do pool não herdam o módulo carregado pelo teste
+@pytest.mark.parametrize("start_method", ["fork", "forkserver", "spawn"])
+def test_process_all_paralelo_igual_ao_serial(tmp_path, monkeypatch, start_method):
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{start_method} indisponível nesta plataforma")
+    monkeypatch.setattr(integration, "QUARTERS_DIR", tmp_path / "trimestres")
+    tasks = []
+    for i, quarter in enumerate(["1T", "2T", "3T", "4T"]):
+        directory = tmp_path / "raw" / f"2023_{quarter}"
+        directory.mkdir(parents=True)
+        (directory / "EVENTOS.csv").write_text(
+            CSV_CONTENT + f'"2023-01-01";"{i}";"42";"SINISTROS";"0";"{i},25"\n', encoding="latin1"
+        )
+        tasks.append((directory, "2023", quarter, 2, None))
+
+    serial = integration.process_all(tasks, processes=1)
+    parallel = integration.process_all(tasks, processes=2, context=multiprocessing.get_context(start_method))
+
+    assert [entry for _, entry in parallel] == [entry for _, entry in serial]
+    for (df_parallel, _), (df_serial, _) in zip(parallel, serial):
+        assert df_parallel.to_csv(sep=';', index=False) == df_serial.to_csv(sep=';', index=False)
+
+@pytest.fixture
+def ftp_index(tmp_path):
+    """Stand-in do índice HTML do FTP: ZIPs soltos na pasta do ano ou dentro de subpastas"""
+    site = tmp_path / "ftp"
+    for year in range(2014, 2024):
+        for n in range(1, 5):
+            folder = site / str(year) / (f"{n}T" if year == 2023 else "")
+            folder.mkdir(parents=True, exist_ok=True)
+            (folder / f"{n}T{year}.zip").write_bytes(b"zip")
+    (site / "2023" / "leiame.txt").write_text("ignorar")
+
+    requested = []
+    class CountingHandler(QuietHandler):
+        def do_GET(self):
+            requested.append(self.path)
+            super().do_GET()
+
+    server = HTTPServer(("127.0.0.1", 0), partial(CountingHandler, directory=str(site)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/", requested
+    server.shutdown()
+    server.server_close()
+
+def test_crawler_resolve_zips_e_usa_cache_da_listagem(ftp_index, tmp_path, monkeypatch):
+    base_url, requested = ftp_index
+    monkeypatch.setattr(integration, "BASE_URL", base_url)
+    monkeypatch.setattr(integration, "CACHE_DIR", tmp_path / "cache")
+
+    quarters = integration.get_available_quarters(count=6, workers=4)
+    assert quarters == [
+        ("2023", "4T", f"{base_url}2023/4T/4T2023.zip"),
+        ("2023", "3T", f"{base_url}2023/3T/3T2023.zip"),
+        ("2023", "2T", f"{base_url}2023/2T/2T2023.zip"),
+        ("2023", "1T", f"{base_url}2023/1T/1T2023.zip"),
+        ("2022", "4T", f"{base_url}2022/4T2022.zip"),
+        ("2022", "3T", f"{base_url}2022/3T2022.zip"),
+    ]
+
+    # Dez anos de histórico: anos já listados vêm do cache (TTL), sem novas requisições
+    requested.clear()
+    history = integration.get_available_quarters(count=0, since=(2014, 1), until=(2023, 4), workers=8)
+    assert len(history) == 40
+    assert history[-1] == ("2014", "1T", f"{base_url}2014/1T2014.zip")
+    assert sorted(requested) == [f"/{year}/" for year in range(2014, 2022)]
+
+    requested.clear()
+    assert integration.get_available_quarters(count=0, since=(2014, 1), workers=8) == history
+    assert requested == []
+
+def test_parse_quarter_arg():
+    assert integration.parse_quarter_arg("2023-1T") == (2023, 1)
+    with pytest.raises(ValueError):
+        integration.parse_quarter_arg("2023-5T")
+
+def test_listagem_sem_fallback_inventado(ftp_index, tmp_path, monkeypatch):
+    base_url, _ = ftp_index
+    monkeypatch.setattr(integration, "BASE_URL", base_url)
+    monkeypatch.setattr(integration, "CACHE_DIR", tmp_path / "cache")
+
+    # Intervalo sem nenhum ano listado: lista vazia, sem erro
+    assert integration.get_available_quarters(count=3, since=(2030, 1)) == []
+
+    # Ano cuja listagem falha (sem cache) fica de fora; os demais vêm normalmente
+    shutil.rmtree(tmp_path / "ftp" / "2022")
+    quarters = integration.get_available_quarters(count=6, workers=4)
+    assert [(year, quarter) for year, quarter, _ in quarters] == [
+        ("2023", "4T"), ("2023", "3T"), ("2023", "2T"), ("2023", "1T"), ("2021", "4T"), ("2021", "3T"),
+    ]
+    assert all(url.startswith(base_url) for _, _, url in quarters)
+
+    # Sem a página raiz e sem listagem salva: nada
+    monkeypatch.setattr(integration, "BASE_URL", f"{base_url}inexistente/")
+    assert integration.get_available_quarters(count=3) == []
@@ -1,9 +1,10 @@
+import argparse
+import numpy as np
 import pandas as pd
-import requests
-import zipfile
 import os
+import sys
+import shutil
 import logging
-from io import BytesIO
 from pathlib import Path
 
 # Configuração de Logs
@@ -13,78 +14,84 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 DATA_PROCESSED = BASE_DIR / "data" / "processed"
 DATA_RAW = BASE_DIR / "data" / "raw"
+CACHE_DIR = BASE_DIR / "data" / "cache"
 INPUT_CSV = DATA_PROCESSED / "consolidado_despesas.csv"
+INPUT_PARQUET = DATA_PROCESSED / "consolidado_despesas.parquet"
 OUTPUT_CSV = DATA_PROCESSED / "despesas_agregadas.csv"
+OUTPUT_PARQUET = DATA_PROCESSED / "despesas_agregadas.parquet"
+
+# Modo incremental: trimestres da Etapa 1 + estado agregado por (trimestre, grupo)
+QUARTERS_DIR = DATA_PROCESSED / "trimestres"
+STAGE1_MANIFEST = DATA_PROCESSED / "manifest.json"
+STATE_PARQUET = DATA_PROCESSED / "agregados_estado.parquet"
+STATE_MANIFEST = DATA_PROCESSED / "agregados_manifest.json"
+# Relatórios de execução (tempos, contadores e pico de memória) em JSON
+REPORTS_DIR = DATA_PROCESSED / "relatorios"
+GROUP_COLS = ['RazaoSocial', 'UF']
+# Cadastro projetado e indexado, reaproveitado entre execuções
+REGISTRY_PATH = DATA_PROCESSED / "operadoras_registro.parquet"
 OUTPUT_ZIP = BASE_DIR / "Teste_Gustavo.zip" # Nome genérico, o usuário renomeia
 
 CADASTRO_URL = "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/Relatorio_cadop.csv"
 
-def download_cadastro():
-    """Baixa o arquivo de operadoras ativas"""
+# Módulos compartilhados entre as etapas (src/common)
+sys.path.insert(0, str(BASE_DIR / "src"))
+from common import deliverable, metrics
+from common.download_cache import DownloadCache
+from common.numeric import convert_numeric_columns
+from common.interchange import PARQUET_AVAILABLE, has_table, read_table, write_table
+from common.manifest import file_sha256, load_manifest, quarter_key, save_manifest
+from common.registry import OperatorRegistry
+
+def download_cadastro(cache=None):
+    """Baixa o arquivo de operadoras ativas (requisição condicional via cache)"""
     logging.info("Baixando cadastro de operadoras...")
     target_path = DATA_RAW / "cadastro_operadoras.csv"
+    cache = cache or DownloadCache(CACHE_DIR)
     
     try:
-        r = requests.get(CADASTRO_URL, verify=False)
-        if r.status_code != 200:
-             logging.error(f"Erro ao baixar cadastro: {r.status_code}")
+        cached_path, meta = cache.fetch(CADASTRO_URL)
+        if cached_path is None:
+             logging.error("Erro ao baixar cadastro.")
              return None
         
-        with open(target_path, 'wb') as f:
-            f.write(r.content)
+        # Só reescreve a cópia local quando o conteúdo mudou
+        os.makedirs(DATA_RAW, exist_ok=True)
+        if not target_path.exists() or target_path.stat().st_size != meta['size'] \
+                or target_path.stat().st_mtime < cached_path.stat().st_mtime:
+            shutil.copyfile(cached_path, target_path)
+        cache.log_stats()
         return target_path
     except Exception as e:
         logging.error(f"Erro ao baixar cadastro: {e}")
         return None
 
-def main():
-    if not os.path.exists(INPUT_CSV):
-        logging.error(f"Arquivo de entrada {INPUT_CSV} não encontrado. Execute a Etapa 1 primeiro.")
-        return
+def load_consolidated():
+    """Carrega o consolidado da Etapa 1: Parquet tipado se existir, senão o CSV"""
+    if has_table(INPUT_PARQUET):
+        return read_table(INPUT_PARQUET, columns=['CNPJ', 'Trimestre', 'Ano', 'ValorDespesas', 'RazaoSocial'])
+    df = pd.read_csv(INPUT_CSV, sep=';', encoding='utf-8', dtype={'CNPJ': str, 'ValorDespesas': str})
+    return convert_numeric_columns(df, ['ValorDespesas'], INPUT_CSV.name)
 
-    # 1. Carregar Consolidado
-    logging.info("Carregando dados consolidados...")
-    df_despesas = pd.read_csv(INPUT_CSV, sep=';', encoding='utf-8', dtype={'CNPJ': str})
-    
-    # 2. Validações
+def enrich(df_despesas, cad_path):
+    """Valida os valores e enriquece as despesas com UF/Razão Social do cadastro"""
+    # Validações
     # Valores Positivos
+    metrics.count("rows_read", len(df_despesas))
     df_despesas = df_despesas[df_despesas['ValorDespesas'] > 0]
+    metrics.count("rows_kept", len(df_despesas))
     
-    # 3. Carregar e Enriquecer com Cadastro
-    cad_path = download_cadastro()
+    # Carregar e Enriquecer com Cadastro
     if cad_path:
         logging.info("Carregando cadastro...")
         try:
-            # O cadastro usa ponto e vírgula e latin1
-            df_cad = pd.read_csv(cad_path, sep=';', encoding='latin1', on_bad_lines='skip', dtype=str)
-            
-            # Limpar aspas se houver
-            df_cad.columns = df_cad.columns.str.replace('"', '').str.strip()
-            
             # Join: No consolidado, 'CNPJ' contém o Registro ANS (conforme etapa 1)
-            # No cadastro, o Registro ANS está em 'REGISTRO_OPERADORA'
-            df_merged = pd.merge(
-                df_despesas, 
-                df_cad, 
-                left_on='CNPJ', 
-                right_on='REGISTRO_OPERADORA', 
-                how='left'
-            )
-            
-            # Prioriza Razao_Social do cadastro
-            if 'Razao_Social' in df_merged.columns:
-                df_merged['RazaoSocial'] = df_merged['Razao_Social'].fillna(df_merged['RazaoSocial'])
-            
-            # Adicionar UF e Modalidade se existirem
-            cols_to_keep = ['RazaoSocial', 'UF', 'ValorDespesas', 'Trimestre', 'Ano', 'CNPJ_y', 'Modalidade']
-            # CNPJ_y é o CNPJ real vindo do cadastro
-            
-            # Limpeza final
-            df_final = df_merged.copy()
-            if 'CNPJ_y' in df_final.columns:
-                df_final['CNPJ_Real'] = df_final['CNPJ_y']
-            
-            df_agregado = df_final
+            # No cadastro, o Registro ANS está em 'REGISTRO_OPERADORA'. O registro guarda só
+            # as colunas usadas (Razao_Social, UF, Modalidade e o CNPJ real -> CNPJ_Real)
+            registry = OperatorRegistry.load_or_build(cad_path, REGISTRY_PATH)
+            with metrics.span("merge"):
+                df_agregado, unmatched = registry.enrich(df_despesas, key_col='CNPJ')
+            metrics.count("rows_unmatched", unmatched)
         except Exception as e:
             logging.error(f"Erro ao processar cadastro: {e}. Usando dados brutos.")
             df_agregado = df_despesas.copy()
@@ -93,15 +100,14 @@ def main():
         df_agregado = df_despesas.copy()
         df_agregado['UF'] = 'NI'
 
-    # 4. Agregação e Estatísticas
-    logging.info("Calculando agregações...")
-    
     # Garante que temos as colunas necessárias
     if 'UF' not in df_agregado.columns: df_agregado['UF'] = 'NI'
     if 'RazaoSocial' not in df_agregado.columns: df_agregado['RazaoSocial'] = df_agregado['CNPJ']
+    return df_agregado
 
-    # Agrupar por Operadora e UF
-    stats = df_agregado.groupby(['RazaoSocial', 'UF'])['ValorDespesas'].agg(
+def aggregate(df_agregado):
+    """Recalcula as estatísticas por Operadora e UF a partir das linhas (modo completo)"""
+    stats = df_agregado.groupby(GROUP_COLS, observed=True)['ValorDespesas'].agg(
         TotalDespesas='sum',
         MediaTrimestral='mean',
         DesvioPadrao='std'
@@ -109,20 +115,131 @@ def main():
     
     # Preencher NaNs no Desvio Padrão (ocorre se houver apenas 1 registro)
     stats['DesvioPadrao'] = stats['DesvioPadrao'].fillna(0)
+    return stats
+
+def partial_aggregates(df_agregado):
+    """
+    Estado agregado por (Ano, Trimestre, RazaoSocial, UF): contagem, soma e M2
+    (soma dos quadrados dos desvios, como no algoritmo de Welford).
+    """
+    grouped = df_agregado.groupby(['Ano', 'Trimestre'] + GROUP_COLS, observed=True)['ValorDespesas']
+    partials = grouped.agg(n='count', soma='sum', var='var').reset_index()
+    partials['m2'] = partials['var'].fillna(0) * (partials['n'] - 1)
+    partials['Ano'] = partials['Ano'].astype(str)
+    partials['Trimestre'] = partials['Trimestre'].astype(str)
+    return partials.drop(columns='var')
+
+def combine_aggregates(partials):
+    """
+    Junta os estados parciais de cada grupo (fórmula paralela de Chan) nas mesmas
+    estatísticas de aggregate(), sem voltar às linhas de despesas.
+    """
+    partials = partials[partials['n'] > 0]
+    grouped = partials.groupby(GROUP_COLS, observed=True)
+    n = grouped['n'].sum()
+    total = grouped['soma'].sum()
+    mean = total / n
+
+    # M2 combinado = soma dos M2 + n_i * (média_i - média)^2
+    group_mean = mean.reindex(pd.MultiIndex.from_frame(partials[GROUP_COLS])).to_numpy()
+    spread = partials['n'] * (partials['soma'] / partials['n'] - group_mean) ** 2
+    m2 = (partials['m2'] + spread).groupby([partials[c] for c in GROUP_COLS], observed=True).sum()
+
+    stats = pd.DataFrame({
+        'TotalDespesas': total,
+        'MediaTrimestral': mean,
+        'DesvioPadrao': np.sqrt(m2 / (n - 1)).where(n > 1, 0.0),
+    }).reset_index()
+    return stats
+
+def compute_incremental(cad_path, cad_sha, current):
+    """
+    Atualiza o estado agregado só com os trimestres novos ou alterados.
+    Retorna (stats, partials) ou None se o estado não puder ser reaproveitado.
+    """
+    state = load_manifest(STATE_MANIFEST)
+    if not has_table(STATE_PARQUET) or state.get('cadastro_sha256') != cad_sha:
+        return None
+    changed = [key for key, sha in current.items() if state.get('quarters', {}).get(key) != sha]
+    if any(not (QUARTERS_DIR / f"{key}.parquet").exists() for key in changed):
+        return None
+
+    partials = read_table(STATE_PARQUET)
+    keys = partials['Ano'].astype(str) + '_' + partials['Trimestre'].astype(str)
+    partials = partials[keys.isin(current.keys()) & ~keys.isin(changed)]
+    if changed:
+        logging.info(f"Trimestres novos/alterados: {', '.join(changed)}")
+        df_new = pd.concat(
+            [read_table(QUARTERS_DIR / f"{key}.parquet") for key in changed], ignore_index=True
+        )
+        partials = pd.concat([partials, partial_aggregates(enrich(df_new, cad_path))], ignore_index=True)
+    else:
+        logging.info("Nenhum trimestre novo ou alterado; apenas recombinando o estado.")
+    return combine_aggregates(partials), partials
+
+def main(full=False, consolidated=None, cad_path=None, output_format='zip', compresslevel=None, keep_csv=False):
+    """
+    Enriquece e agrega o consolidado e retorna as estatísticas (None em caso de erro).
+    `consolidated` e `cad_path` permitem receber o consolidado da Etapa 1 e o
+    cadastro já baixado em memória (runner do pipeline) em vez de lê-los do disco.
+    `output_format`, `compresslevel` e `keep_csv` como na Etapa 1.
+    """
+    if consolidated is None and not os.path.exists(INPUT_CSV) and not has_table(INPUT_PARQUET):
+        logging.error(f"Arquivo de entrada {INPUT_CSV} não encontrado. Execute a Etapa 1 primeiro.")
+        return None
+
+    if cad_path is None:
+        cad_path = download_cadastro()
+    cad_sha = file_sha256(cad_path) if cad_path else None
+    stage1 = load_manifest(STAGE1_MANIFEST)
+    current = {quarter_key(q['ano'], q['trimestre']): q['sha256'] for q in stage1.get('quarters', [])}
+
+    result = None
+    if not full and PARQUET_AVAILABLE and current:
+        with metrics.span("groupby", modo="incremental"):
+            result = compute_incremental(cad_path, cad_sha, current)
+
+    if result is None:
+        # 1. Carregar Consolidado
+        logging.info("Carregando dados consolidados...")
+        df_agregado = enrich(load_consolidated() if consolidated is None else consolidated, cad_path)
+
+        # 2. Agregação e Estatísticas
+        logging.info("Calculando agregações...")
+        with metrics.span("groupby"):
+            stats = aggregate(df_agregado)
+            partials = partial_aggregates(df_agregado) if PARQUET_AVAILABLE else None
+    else:
+        stats, partials = result
     
     # Ordenar por valor total
     stats.sort_values(by='TotalDespesas', ascending=False, inplace=True)
+
+    # Estado para a próxima execução incremental
+    if partials is not None:
+        write_table(partials, STATE_PARQUET)
+        save_manifest(STATE_MANIFEST, {'cadastro_sha256': cad_sha, 'quarters': current})
     
-    # 5. Salvar
-    stats.to_csv(OUTPUT_CSV, index=False, sep=';', encoding='utf-8')
-    logging.info(f"Arquivo agregado salvo em {OUTPUT_CSV}")
-    
-    # Zipar final
-    with zipfile.ZipFile(OUTPUT_ZIP, 'w', zipfile.ZIP_DEFLATED) as z:
-        z.write(OUTPUT_CSV, arcname="despesas_agregadas.csv")
-    logging.info(f"ZIP Final criado: {OUTPUT_ZIP}")
+    # Salvar (Parquet para a Etapa 3, CSV direto no ZIP como entregável)
+    metrics.count("rows_written", len(stats))
+    write_table(stats, OUTPUT_PARQUET)
+    output = deliverable.write_csv(stats, OUTPUT_ZIP, OUTPUT_CSV.name, output_format, compresslevel,
+                                   csv_path=OUTPUT_CSV, keep_csv=keep_csv or not PARQUET_AVAILABLE)
+    logging.info(f"Entregável final criado: {output}")
+    return stats
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enriquecimento e agregação das despesas")
+    parser.add_argument("--full", action="store_true",
+                        help="Recalcula as estatísticas a partir de todo o consolidado")
+    parser.add_argument("--output-format", choices=list(deliverable.FORMATS), default='zip',
+                        help="Entregável: zip (padrão), gzip (multithread) ou zstd")
+    parser.add_argument("--compresslevel", type=int, help="Nível de compressão (padrão: 6 no zip/gzip, 3 no zstd)")
+    parser.add_argument("--keep-csv", action="store_true", help="Mantém o CSV sem compressão em data/processed")
+    args = parser.parse_args()
+
     import urllib3
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    main()
+    with metrics.run("etapa2", REPORTS_DIR):
+        main(full=args.full, output_format=args.output_format, compresslevel=args.compresslevel,
+             keep_csv=args.keep_csv)
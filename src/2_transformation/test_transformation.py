@@ -0,0 +1,106 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Carrega o main.py desta pasta com nome próprio (evita conflito com outros main.py)
+spec = importlib.util.spec_from_file_location("transformation_main", Path(__file__).with_name("main.py"))
+transformation = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = transformation
+spec.loader.exec_module(transformation)
+
+@pytest.fixture(autouse=True)
+def registry_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(transformation, "REGISTRY_PATH", tmp_path / "registro.parquet")
+
+def make_despesas(seed, quarters):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for year, quarter in quarters:
+        n = 200
+        frames.append(pd.DataFrame({
+            'CNPJ': rng.integers(1, 30, n).astype(str),
+            'Trimestre': quarter,
+            'Ano': year,
+            'ValorDespesas': rng.normal(1e6, 3e5, n).round(2),
+            'RazaoSocial': 'DESCONHECIDO',
+        }))
+    return frames
+
+@pytest.fixture
+def cadastro(tmp_path):
+    path = tmp_path / "cadastro.csv"
+    pd.DataFrame({
+        'REGISTRO_OPERADORA': [str(i) for i in range(1, 25)],
+        'Razao_Social': [f"OPERADORA {i % 20}" for i in range(1, 25)],
+        'UF': [['SP', 'RJ', 'MG'][i % 3] for i in range(1, 25)],
+    }).to_csv(path, sep=';', index=False, encoding='latin1')
+    return path
+
+def test_combinacao_dos_parciais_igual_ao_recalculo(cadastro):
+    df = transformation.enrich(
+        pd.concat(make_despesas(1, [('2023', '1T'), ('2023', '2T'), ('2023', '3T')]), ignore_index=True),
+        cadastro,
+    )
+    expected = transformation.aggregate(df).set_index(transformation.GROUP_COLS).sort_index()
+    combined = transformation.combine_aggregates(
+        transformation.partial_aggregates(df)
+    ).set_index(transformation.GROUP_COLS).sort_index()
+
+    pd.testing.assert_frame_equal(combined, expected, rtol=1e-9)
+
+def test_incremental_so_processa_trimestre_novo(cadastro, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    processed = tmp_path / "processed"
+    (processed / "trimestres").mkdir(parents=True)
+    monkeypatch.setattr(transformation, "QUARTERS_DIR", processed / "trimestres")
+    monkeypatch.setattr(transformation, "STATE_PARQUET", processed / "estado.parquet")
+    monkeypatch.setattr(transformation, "STATE_MANIFEST", processed / "estado.json")
+
+    quarters = [('2023', '1T'), ('2023', '2T'), ('2023', '3T'), ('2023', '4T')]
+    frames = make_despesas(2, quarters)
+    for (year, quarter), df in zip(quarters, frames):
+        df.to_parquet(processed / "trimestres" / f"{year}_{quarter}.parquet", index=False)
+
+    # Estado inicial com os três primeiros trimestres (recalculo completo)
+    first = transformation.enrich(pd.concat(frames[:3], ignore_index=True), cadastro)
+    transformation.write_table(transformation.partial_aggregates(first), processed / "estado.parquet")
+    cad_sha = transformation.file_sha256(cadastro)
+    current = {f"{y}_{q}": "sha" for y, q in quarters[:3]}
+    transformation.save_manifest(processed / "estado.json", {'cadastro_sha256': cad_sha, 'quarters': current})
+
+    # Publicação de um novo trimestre e alteração do 1T: só esses são lidos
+    current.update({"2023_4T": "sha", "2023_1T": "sha-novo"})
+    read = []
+    original_read = transformation.read_table
+    monkeypatch.setattr(transformation, "read_table", lambda path, **kw: read.append(Path(path).name) or original_read(path, **kw))
+    stats, _ = transformation.compute_incremental(cadastro, cad_sha, current)
+
+    assert sorted(read) == ["2023_1T.parquet", "2023_4T.parquet", "estado.parquet"]
+    expected = transformation.aggregate(transformation.enrich(pd.concat(frames, ignore_index=True), cadastro))
+    pd.testing.assert_frame_equal(
+        stats.set_index(transformation.GROUP_COLS).sort_index(),
+        expected.set_index(transformation.GROUP_COLS).sort_index(),
+        rtol=1e-9,
+    )
+
+def test_incremental_exige_mesmo_cadastro(cadastro, tmp_path, monkeypatch):
+    monkeypatch.setattr(transformation, "STATE_PARQUET", tmp_path / "estado.parquet")
+    monkeypatch.setattr(transformation, "STATE_MANIFEST", tmp_path / "estado.json")
+    transformation.save_manifest(tmp_path / "estado.json", {'cadastro_sha256': 'antigo', 'quarters': {}})
+    (tmp_path / "estado.parquet").write_bytes(b"")
+    assert transformation.compute_incremental(cadastro, 'novo', {"2023_1T": "sha"}) is None
+
+def test_registro_enriquece_sem_merge_e_conta_sem_cadastro(cadastro):
+    registry = transformation.OperatorRegistry.from_csv(cadastro)
+    df = pd.DataFrame({'CNPJ': ['3', '99', '3'], 'ValorDespesas': [1.0, 2.0, 3.0], 'RazaoSocial': 'DESCONHECIDO'})
+
+    enriched, unmatched = registry.enrich(df)
+
+    assert unmatched == 1
+    assert enriched['RazaoSocial'].tolist() == ['OPERADORA 3', 'DESCONHECIDO', 'OPERADORA 3']
+    assert enriched['UF'].dtype == 'category'
+    assert enriched['UF'].tolist()[::2] == ['SP', 'SP'] and pd.isna(enriched['UF'].iloc[1])
@@ -5,6 +5,7 @@ CREATE TABLE IF NOT EXISTS operadoras (
     razao_social VARCHAR(255),
     modalidade VARCHAR(100),
     uf CHAR(2),
+    razao_social_busca VARCHAR(255), -- razão social sem acentos e minúscula (busca)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -29,6 +30,86 @@ CREATE TABLE IF NOT EXISTS despesas_agregadas (
     data_processamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Rollups para os endpoints de estatísticas (montados pelo import_data.py a cada carga,
+-- com o mesmo DDL de TABLES: somas e médias em DOUBLE PRECISION, como calculadas no pandas)
+CREATE TABLE IF NOT EXISTS rollup_operadora_trimestre (
+    registro_ans VARCHAR(20) NOT NULL,
+    razao_social VARCHAR(255),
+    uf CHAR(2),
+    modalidade VARCHAR(100),
+    ano INT NOT NULL,
+    trimestre VARCHAR(10) NOT NULL,
+    total_despesas DOUBLE PRECISION,
+    lancamentos INT
+);
+
+CREATE TABLE IF NOT EXISTS rollup_uf_trimestre (
+    uf CHAR(2),
+    ano INT NOT NULL,
+    trimestre VARCHAR(10) NOT NULL,
+    total_despesas DOUBLE PRECISION,
+    operadoras INT
+);
+
+CREATE TABLE IF NOT EXISTS rollup_modalidade_trimestre (
+    modalidade VARCHAR(100),
+    ano INT NOT NULL,
+    trimestre VARCHAR(10) NOT NULL,
+    total_despesas DOUBLE PRECISION,
+    operadoras INT
+);
+
+CREATE TABLE IF NOT EXISTS rollup_ranking_operadoras (
+    posicao INT NOT NULL,
+    registro_ans VARCHAR(20) NOT NULL,
+    razao_social VARCHAR(255),
+    uf CHAR(2),
+    modalidade VARCHAR(100),
+    total_despesas DOUBLE PRECISION,
+    media_trimestral DOUBLE PRECISION,
+    desvio_padrao DOUBLE PRECISION,
+    trimestres INT
+);
+
+-- Totais por tabela ('*') e despesas por operadora, usados na paginação da API
+CREATE TABLE IF NOT EXISTS contagens (
+    tabela VARCHAR(64) NOT NULL,
+    chave VARCHAR(64) NOT NULL,
+    linhas BIGINT NOT NULL
+);
+
+-- Versão da última carga (invalida o cache de respostas da API)
+CREATE TABLE IF NOT EXISTS versao_dados (
+    versao VARCHAR(32) NOT NULL,
+    carregado_em VARCHAR(32) NOT NULL
+);
+
 -- Índices para performance
+-- (import_data.py cria os mesmos índices nas tabelas de staging antes da troca)
 CREATE INDEX idx_despesas_ano_trimestre ON despesas_consolidadas(ano, trimestre);
+CREATE INDEX idx_despesas_registro_ans ON despesas_consolidadas(registro_ans, id);
 CREATE INDEX idx_operadoras_uf ON operadoras(uf);
+CREATE INDEX idx_operadoras_razao_social ON operadoras(razao_social);
+CREATE INDEX idx_operadoras_cnpj ON operadoras(cnpj, registro_ans);
+CREATE INDEX idx_operadoras_razao_social_busca ON operadoras(razao_social_busca, registro_ans);
+CREATE INDEX idx_agregadas_razao_social ON despesas_agregadas(razao_social);
+CREATE INDEX idx_agregadas_total ON despesas_agregadas(total_despesas);
+CREATE INDEX idx_contagens ON contagens(tabela, chave);
+CREATE INDEX idx_rollup_op_periodo ON rollup_operadora_trimestre(ano, trimestre, total_despesas);
+CREATE INDEX idx_rollup_op_uf ON rollup_operadora_trimestre(uf, ano, trimestre, total_despesas);
+CREATE INDEX idx_rollup_op_modalidade ON rollup_operadora_trimestre(modalidade, ano, trimestre, total_despesas);
+CREATE INDEX idx_rollup_op_registro ON rollup_operadora_trimestre(registro_ans, ano, trimestre);
+CREATE INDEX idx_rollup_uf_periodo ON rollup_uf_trimestre(ano, trimestre, total_despesas);
+CREATE INDEX idx_rollup_uf_uf ON rollup_uf_trimestre(uf, ano, trimestre);
+CREATE INDEX idx_rollup_mod_periodo ON rollup_modalidade_trimestre(ano, trimestre, total_despesas);
+CREATE INDEX idx_rollup_mod_modalidade ON rollup_modalidade_trimestre(modalidade, ano, trimestre);
+CREATE INDEX idx_ranking_posicao ON rollup_ranking_operadoras(posicao);
+CREATE INDEX idx_ranking_uf ON rollup_ranking_operadoras(uf, posicao);
+CREATE INDEX idx_ranking_modalidade ON rollup_ranking_operadoras(modalidade, posicao);
+CREATE INDEX idx_ranking_media ON rollup_ranking_operadoras(media_trimestral);
+CREATE INDEX idx_ranking_desvio ON rollup_ranking_operadoras(desvio_padrao);
+
+-- Busca textual por substring (criada pelo import_data.py)
+-- SQLite:     CREATE VIRTUAL TABLE operadoras_busca USING fts5(registro_ans UNINDEXED, razao_social_busca, tokenize='trigram');
+-- PostgreSQL: CREATE EXTENSION IF NOT EXISTS pg_trgm;
+--             CREATE INDEX idx_operadoras_busca_trgm ON operadoras USING gin (razao_social_busca gin_trgm_ops);
@@ -0,0 +1,72 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import create_engine, inspect, text
+
+# Carrega o import_data.py desta pasta com nome próprio
+spec = importlib.util.spec_from_file_location("import_data_main", Path(__file__).with_name("import_data.py"))
+import_data = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = import_data
+spec.loader.exec_module(import_data)
+
+def despesas(valor, n=5):
+    return pd.DataFrame({
+        'registro_ans': [str(i) for i in range(n)],
+        'ano': 2023,
+        'trimestre': '1T',
+        'valor_despesas': [valor] * (n - 1) + [None],
+    })
+
+def test_bulk_load_cria_indices_e_troca_tabelas(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}")
+    import_data.bulk_load(engine, {'despesas_consolidadas': despesas(1.0)})
+
+    # Um leitor com transação aberta continua vendo a carga anterior inteira
+    reader = engine.connect()
+    reader.exec_driver_sql("BEGIN")
+    assert reader.execute(text("SELECT SUM(valor_despesas) FROM despesas_consolidadas")).scalar() == 4.0
+
+    import_data.bulk_load(engine, {'despesas_consolidadas': despesas(2.0, n=7)})
+    assert reader.execute(text("SELECT SUM(valor_despesas) FROM despesas_consolidadas")).scalar() == 4.0
+    reader.rollback()
+    reader.close()
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, valor_despesas FROM despesas_consolidadas ORDER BY id")).all()
+    assert rows[-1] == (7, None) and sum(v or 0 for _, v in rows) == 12.0
+
+    inspector = inspect(engine)
+    assert sorted(inspector.get_table_names()) == ['contagens', 'despesas_consolidadas', 'versao_dados']
+    indexed = sorted(tuple(ix['column_names']) for ix in inspector.get_indexes('despesas_consolidadas'))
+    assert indexed == [('ano', 'trimestre'), ('registro_ans', 'id')]
+
+def test_bulk_load_grava_contagens(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}")
+    operadoras = pd.DataFrame({'registro_ans': ['0', '1'], 'cnpj': None, 'razao_social': ['A', 'B'],
+                               'modalidade': None, 'uf': 'SP', 'razao_social_busca': ['a', 'b']})
+    import_data.bulk_load(engine, {'operadoras': operadoras, 'despesas_consolidadas': despesas(1.0, n=3)})
+    # Recarregar só as despesas preserva a contagem de operadoras
+    import_data.bulk_load(engine, {'despesas_consolidadas': pd.concat([despesas(1.0, n=3), despesas(1.0, n=1)])})
+
+    with engine.connect() as conn:
+        counts = dict(((t, k), n) for t, k, n in conn.execute(text("SELECT tabela, chave, linhas FROM contagens")))
+    assert counts == {
+        ('operadoras', '*'): 2,
+        ('despesas_consolidadas', '*'): 4,
+        ('despesas_consolidadas', '0'): 2,
+        ('despesas_consolidadas', '1'): 1,
+        ('despesas_consolidadas', '2'): 1,
+    }
+
+def test_nomes_de_indice_cabem_no_limite_do_postgresql():
+    primeira, segunda = import_data.new_version(), import_data.new_version()
+    for table, spec in import_data.TABLES.items():
+        for cols in spec['indexes'] + ([list(spec['search'][1:]) + ['trgm']] if 'search' in spec else []):
+            nomes = [import_data.index_name(table, cols, stamp) for stamp in (primeira, segunda)]
+            assert all(len(nome) <= import_data.MAX_IDENTIFIER for nome in nomes)
+            # O carimbo sobrevive ao limite: cada carga cria nomes diferentes
+            assert nomes[0] != nomes[1] and nomes[0] == import_data.index_name(table, cols, primeira)
+    longo = import_data.index_name('t' * 80, ['a', 'b'], primeira)
+    assert len(longo) == import_data.MAX_IDENTIFIER and longo.endswith(primeira)
@@ -1,10 +1,284 @@
-from fastapi import FastAPI, HTTPException, Query
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, text
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import QueuePool
 from pathlib import Path
+from typing import Literal
+import anyio.to_thread
+import base64
+import binascii
+import contextvars
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import sys
+import time
 import pandas as pd
 
-app = FastAPI(title="Intuitive Care Challenge API", version="1.0")
+# Database
+BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
+
+# Módulos compartilhados com o pipeline (src/common)
+sys.path.insert(0, str(BASE_DIR / "src"))
+from common import columnar, export, metrics
+from common.response_cache import ResponseCache
+from common.search import MIN_TRIGRAM, digits_only, fold_text, match_phrase, prefix_bounds
+DB_PATH = BASE_DIR / "database.db"
+DB_URL = os.environ.get("DB_URL", f"sqlite:///{DB_PATH}")
+
+# Acesso ao banco: "sync" (engine síncrono em threads do Starlette) ou
+# "async" (engine assíncrono com aiosqlite/asyncpg, sem ocupar threads)
+DB_MODE = os.environ.get("API_DB_MODE", "sync")
+# Tempo máximo (s) de cada acesso ao banco numa requisição; acima disso responde 504
+REQUEST_TIMEOUT = float(os.environ.get("API_REQUEST_TIMEOUT", 10))
+
+# Threads do Starlette para endpoints síncronos; o pool de conexões acompanha esse número
+THREADPOOL_SIZE = int(os.environ.get("API_THREADPOOL_SIZE", 40))
+DB_POOL_SIZE = int(os.environ.get("API_DB_POOL_SIZE", THREADPOOL_SIZE))
+DB_POOL_TIMEOUT = float(os.environ.get("API_DB_POOL_TIMEOUT", 10))
+
+# Ajustes de leitura aplicados a cada conexão SQLite
+SQLITE_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,   # lê o arquivo via mmap (páginas compartilhadas entre workers)
+    "cache_size": -64 * 1024,         # 64 MB de cache de páginas por conexão
+    "temp_store": "MEMORY",
+}
+SQLITE_CACHED_STATEMENTS = 256        # statements preparados reaproveitados por conexão
+
+# Cache de respostas: limites do LRU e intervalo (s) entre consultas à versão da carga
+RESPONSE_CACHE_ENTRIES = int(os.environ.get("API_CACHE_ENTRIES", 1024))
+RESPONSE_CACHE_MB = int(os.environ.get("API_CACHE_MB", 64))
+DATA_VERSION_TTL = float(os.environ.get("API_DATA_VERSION_TTL", 1.0))
+
+# Snapshot colunar gravado pelo import_data (um diretório por versão da carga)
+SNAPSHOT_DIR = Path(os.environ.get("API_SNAPSHOT_DIR", BASE_DIR / "data" / "processed" / "snapshot"))
+
+# Linhas lidas do cursor do banco e codificadas por vez nas exportações
+EXPORT_BATCH_SIZE = int(os.environ.get("API_EXPORT_BATCH", 5000))
+
+# Métricas expostas em /metrics (formato de texto do Prometheus)
+REQUEST_DURATION = metrics.Histogram("api_request_duration_seconds", "Duração das requisições HTTP por rota",
+                                     ("route", "method", "status"))
+DB_QUERY_DURATION = metrics.Histogram("api_db_query_duration_seconds", "Duração das consultas ao banco por rota",
+                                      ("route",))
+# Escopo ASGI da requisição em andamento (a rota só é conhecida depois do roteamento)
+_request_scope = contextvars.ContextVar("request_scope", default=None)
+
+def route_label(scope):
+    """Template da rota (ex.: /api/operadoras/{id}), sem ids para não multiplicar as séries"""
+    route = scope.get("route") if scope else None
+    return getattr(route, "path", None) or "desconhecida"
+
+def instrument_engine(engine):
+    """Registra o tempo de cada execução de SQL no histograma, com a rota da requisição"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_DURATION.observe(time.perf_counter() - context._query_start, route_label(_request_scope.get()))
+
+    return engine
+
+def create_db_engine(url=DB_URL):
+    """
+    Engine com pool dimensionado para o threadpool da API.
+    SQLite: conexões somente leitura (o banco já vem em WAL do import_data), com
+    mmap, cache e cache de statements preparados. Servidores: pool com pre-ping,
+    reciclagem e transações somente leitura.
+    """
+    db_url = make_url(url)
+    pool_args = dict(poolclass=QueuePool, pool_size=DB_POOL_SIZE, max_overflow=0,
+                     pool_timeout=DB_POOL_TIMEOUT)
+
+    if db_url.get_backend_name() == "sqlite":
+        database = db_url.database
+
+        def connect():
+            conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True, check_same_thread=False,
+                                   cached_statements=SQLITE_CACHED_STATEMENTS)
+            for pragma, value in SQLITE_PRAGMAS.items():
+                conn.execute(f"PRAGMA {pragma}={value}")
+            return conn
+
+        # Arquivo local: sem pre-ping (seria um SELECT 1 a mais por requisição)
+        return instrument_engine(create_engine("sqlite://", creator=connect, **pool_args))
+
+    if db_url.get_backend_name() == "postgresql":
+        return instrument_engine(create_engine(url, pool_pre_ping=True, pool_recycle=1800,
+                                               connect_args={"options": "-c default_transaction_read_only=on"},
+                                               **pool_args))
+
+    return instrument_engine(create_engine(url, pool_pre_ping=True, pool_recycle=1800, **pool_args))
+
+def create_async_db_engine(url=DB_URL):
+    """
+    Engine assíncrono equivalente ao create_db_engine (mesmos ajustes e limites
+    de pool), com aiosqlite no SQLite e asyncpg no PostgreSQL.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    db_url = make_url(url)
+    pool_args = dict(poolclass=AsyncAdaptedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=0,
+                     pool_timeout=DB_POOL_TIMEOUT)
+
+    if db_url.get_backend_name() == "sqlite":
+        import aiosqlite
+        database = db_url.database
+
+        async def connect():
+            conn = await aiosqlite.connect(f"file:{database}?mode=ro", uri=True,
+                                           cached_statements=SQLITE_CACHED_STATEMENTS)
+            for pragma, value in SQLITE_PRAGMAS.items():
+                await conn.execute(f"PRAGMA {pragma}={value}")
+            return conn
+
+        async_engine = create_async_engine("sqlite+aiosqlite://", async_creator=connect, **pool_args)
+    elif db_url.get_backend_name() == "postgresql":
+        async_engine = create_async_engine(db_url.set(drivername="postgresql+asyncpg"), pool_pre_ping=True,
+                                           pool_recycle=1800, **pool_args,
+                                           connect_args={"server_settings": {"default_transaction_read_only": "on"}})
+    else:
+        raise ValueError(f"API_DB_MODE=async não suporta {db_url.get_backend_name()}")
+    instrument_engine(async_engine.sync_engine)
+    return async_engine
+
+engine = create_db_engine()
+async_engine = create_async_db_engine() if DB_MODE == "async" else None
+response_cache = ResponseCache(RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_MB * 1024 * 1024)
+_data_version = {"value": None, "checked": float("-inf")}
+_store = {"version": None, "value": None}
+
+def _run_with_connection(work):
+    with engine.connect() as conn:
+        return work(conn)
+
+async def run_db(work):
+    """
+    Executa `work(conn)` (consultas escritas com a API síncrona do SQLAlchemy)
+    no modo configurado: no async, numa conexão do engine assíncrono via
+    run_sync, sem ocupar thread; no sync, com o engine síncrono num thread do
+    threadpool. Responde 504 se passar de REQUEST_TIMEOUT.
+    """
+    try:
+        with anyio.fail_after(REQUEST_TIMEOUT):
+            if DB_MODE == "async":
+                async with async_engine.connect() as conn:
+                    return await conn.run_sync(work)
+            return await anyio.to_thread.run_sync(_run_with_connection, work, abandon_on_cancel=True)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Tempo limite da consulta excedido")
+
+async def data_version():
+    """
+    Versão da carga gravada pelo import_data em `versao_dados` (None sem banco).
+    Consultada no máximo a cada DATA_VERSION_TTL segundos.
+    """
+    now = time.monotonic()
+    if now - _data_version["checked"] < DATA_VERSION_TTL:
+        return _data_version["value"]
+    try:
+        value = await run_db(lambda conn: conn.execute(text("SELECT versao FROM versao_dados")).scalar())
+    except DBAPIError:
+        value = None
+    _data_version.update(value=value, checked=now)
+    return value
+
+async def cached_response(request, work):
+    """
+    Resposta JSON de `work(conn)` servida do cache enquanto a versão da carga não
+    mudar, com ETag forte (hash do corpo) e 304 para If-None-Match igual.
+    Sem versão (banco ausente ou antigo) nada é guardado.
+    """
+    version = await data_version()
+    key = f"{request.url.path}?{sorted(request.query_params.multi_items())}"
+    entry = response_cache.get(key, version) if version else None
+    if entry is None:
+        body = json.dumps(jsonable_encoder(await run_db(work)), ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        if version:
+            response_cache.put(key, version, body, etag)
+    else:
+        body, etag = entry
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+async def analytics_store():
+    """
+    Snapshot colunar da carga atual, aberto com mmap (as páginas ficam no cache
+    do sistema, compartilhadas entre os workers). Troca de snapshot quando a
+    versão em `versao_dados` muda; 503 se não houver snapshot para ela.
+    """
+    version = await data_version()
+    if version is not None and _store["version"] != version:
+        try:
+            _store.update(version=version, value=columnar.open_store(SNAPSHOT_DIR, version))
+        except (OSError, ValueError) as e:
+            # Gravado antes da troca das tabelas: se não existe agora, não vai aparecer
+            logging.warning(f"Snapshot colunar da versão {version} indisponível: {e}")
+            _store.update(version=version, value=None)
+    if version is None or _store["value"] is None:
+        raise HTTPException(status_code=503, detail="Snapshot analítico indisponível")
+    return _store["value"]
+
+@asynccontextmanager
+async def lifespan(app):
+    # Mesmo número de threads e de conexões: nenhuma requisição fica esperando o pool
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # Abre o snapshot na partida (cada worker mapeia os mesmos arquivos)
+    try:
+        await analytics_store()
+    except HTTPException:
+        pass
+    yield
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (sem BaseHTTPMiddleware, que bufferiza e custa uma task
+    por requisição): mede do início ao fim da resposta, inclusive streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        start = time.perf_counter()
+        token = _request_scope.set(scope)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_scope.reset(token)
+            REQUEST_DURATION.observe(time.perf_counter() - start, route_label(scope), scope["method"], str(status))
+
+app = FastAPI(title="Intuitive Care Challenge API", version="1.0", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -14,66 +288,477 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Database
-BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
-DB_PATH = BASE_DIR / "database.db"
-DB_URL = f"sqlite:///{DB_PATH}"
-engine = create_engine(DB_URL)
+# Adicionado por último: fica por fora e mede também o CORS
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "API is running. Go to /docs for Swagger UI."}
 
+# Colunas públicas (razao_social_busca de operadoras é só para o índice)
+OPERADORA_COLUMNS = "registro_ans, cnpj, razao_social, modalidade, uf"
+DESPESA_COLUMNS = "id, registro_ans, ano, trimestre, valor_despesas"
+
+def qualified(columns, alias="o"):
+    return ", ".join(f"{alias}.{col}" for col in columns.split(", "))
+
+def encode_cursor(branch, keys):
+    """Cursor opaco: bloco da consulta e chave da última linha entregue"""
+    raw = json.dumps([branch, keys], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor, branches):
+    try:
+        branch, keys = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not 0 <= branch < len(branches) or len(keys) != len(branches[branch][2]):
+            raise ValueError
+        return branch, keys
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def operadora_branches(search, dialect):
+    """
+    Blocos (origem, filtros, chave de ordenação) da listagem de operadoras, em
+    ordem de relevância, e os parâmetros dos filtros. Cada bloco é lido na ordem
+    de um índice, então o LIMIT para cedo mesmo com milhares de correspondências:
+    - sem busca: todas, por registro_ans;
+    - só dígitos (registro ANS ou CNPJ, com ou sem pontuação): prefixo de
+      registro_ans e depois prefixo de cnpj (a correspondência exata vem primeiro);
+    - texto: razões sociais (sem acentos) que começam com o termo e, com 3+
+      caracteres, as que o contêm, via FTS5 trigram (SQLite, por bm25) ou pg_trgm
+      (PostgreSQL, por similaridade), empates por registro_ans.
+    As chaves são sempre crescentes (a comparação do keyset é por tupla): por
+    isso a similaridade entra negativa e o bm25 do FTS5 (menor = melhor) direto.
+    """
+    table = "operadoras o"
+    term = fold_text(search) if search else ""
+    if not term:
+        return [(table, [], ["o.registro_ans"])], {}
+
+    digits = digits_only(search)
+    if digits:
+        lo, hi = prefix_bounds(digits)
+        by_registro = "o.registro_ans >= :lo AND o.registro_ans < :hi"
+        return [
+            (table, [by_registro], ["o.registro_ans"]),
+            (table, ["o.cnpj >= :lo AND o.cnpj < :hi", f"NOT ({by_registro})"], ["o.cnpj", "o.registro_ans"]),
+        ], {"lo": lo, "hi": hi}
+
+    lo, hi = prefix_bounds(term)
+    by_prefix = "o.razao_social_busca >= :lo AND o.razao_social_busca < :hi"
+    branches = [(table, [by_prefix], ["o.razao_social_busca", "o.registro_ans"])]
+    params = {"lo": lo, "hi": hi}
+    if len(term) < MIN_TRIGRAM:
+        return branches, params
+
+    if dialect == "sqlite":
+        branches.append(("operadoras_busca JOIN operadoras o USING (registro_ans)",
+                         ["operadoras_busca MATCH :match", f"NOT ({by_prefix})"],
+                         ["bm25(operadoras_busca)", "o.registro_ans"]))
+        params["match"] = match_phrase(term)
+    elif dialect == "postgresql":
+        # LIKE resolvido pelo índice GIN pg_trgm; as mais parecidas com o termo primeiro
+        branches.append((table, ["o.razao_social_busca LIKE :pattern", f"NOT ({by_prefix})"],
+                         ["-similarity(o.razao_social_busca, :term)", "o.registro_ans"]))
+        params.update(pattern=f"%{term}%", term=term)
+    else:
+        # Nos demais bancos é varredura, sem medida de relevância
+        branches.append((table, ["o.razao_social_busca LIKE :pattern", f"NOT ({by_prefix})"], ["o.registro_ans"]))
+        params["pattern"] = f"%{term}%"
+    return branches, params
+
+def key_slots(branches):
+    """
+    Posição da primeira coluna de chave (_k<n>) de cada bloco: cada bloco tem as
+    próprias colunas (NULL nos demais), então chaves de tipos diferentes (texto,
+    bm25, similaridade) nunca dividem uma coluna do UNION ALL.
+    """
+    slots, start = [], 0
+    for _, _, keys in branches:
+        slots.append(start)
+        start += len(keys)
+    return slots, start
+
+def keyset_query(columns, branches, cursor, limit):
+    """
+    SQL de uma página por keyset: o bloco do cursor continua depois da última
+    chave entregue (sem OFFSET) e os blocos seguintes entram do início. Lê
+    limit + 1 linhas para saber se há próxima página. A ordem da página vem do
+    ORDER BY externo (bloco e chaves), não da ordem dos ramos do UNION ALL, que
+    o SQL não garante (o Parallel Append do PostgreSQL pode intercalá-los).
+    """
+    first, after = cursor if cursor else (0, None)
+    slots, width = key_slots(branches)
+    parts, params = [], {"limit": limit + 1}
+    for i in range(first, len(branches)):
+        source, where, keys = branches[i]
+        conditions = list(where)
+        if i == first and after is not None:
+            names = [f"after{j}" for j in range(len(keys))]
+            conditions.append(f"({', '.join(keys)}) > ({', '.join(':' + n for n in names)})")
+            params.update(zip(names, after))
+        own = {slots[i] + j: key for j, key in enumerate(keys)}
+        key_columns = [f"{own.get(j, 'NULL')} AS _k{j}" for j in range(width)]
+        where_sql = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        parts.append(f"SELECT * FROM (SELECT {columns}, {i} AS _ramo, {', '.join(key_columns)} FROM {source}"
+                     f"{where_sql} ORDER BY {', '.join(keys)} LIMIT :limit) AS ramo{i}")
+    order = ", ".join(["_ramo"] + [f"_k{j}" for j in range(width)])
+    return f"SELECT * FROM ({' UNION ALL '.join(parts)}) AS pagina ORDER BY {order} LIMIT :limit", params
+
+def keyset_page(rows, branches, limit):
+    """Linhas da página (sem as colunas internas) e o cursor da próxima, se houver"""
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        branch = last["_ramo"]
+        start = key_slots(branches)[0][branch]
+        next_cursor = encode_cursor(branch, [last[f"_k{start + j}"] for j in range(len(branches[branch][2]))])
+    data = [{k: v for k, v in row.items() if not k.startswith("_")} for row in rows[:limit]]
+    return data, next_cursor
+
+def stored_count(conn, table, key="*"):
+    """Total gravado pelo import_data em `contagens` (None se o banco não tiver a tabela)"""
+    try:
+        count = conn.execute(text("SELECT linhas FROM contagens WHERE tabela = :tabela AND chave = :chave"),
+                             {"tabela": table, "chave": key}).scalar()
+    except DBAPIError:
+        return None
+    return count or 0
+
 @app.get("/api/operadoras")
-def list_operadoras(page: int = 1, limit: int = 10, search: str = None):
-    offset = (page - 1) * limit
-    
-    query_str = "SELECT * FROM operadoras"
-    params = {}
-    
-    if search:
-        query_str += " WHERE razao_social LIKE :search OR registro_ans LIKE :search"
-        params['search'] = f"%{search}%"
-        
-    query_str += " LIMIT :limit OFFSET :offset"
-    params['limit'] = limit
-    params['offset'] = offset
+async def list_operadoras(limit: int = Query(10, ge=1, le=100), search: str = None, cursor: str = None):
+    branches, params = operadora_branches(search, engine.dialect.name)
+    # Total só para a listagem completa: buscas não têm contagem pré-calculada
+    searching = bool(params)
+    position = decode_cursor(cursor, branches) if cursor else None
+    query_str, page_params = keyset_query(qualified(OPERADORA_COLUMNS), branches, position, limit)
+    params.update(page_params)
     
-    with engine.connect() as conn:
-        try:
-            result = conn.execute(text(query_str), params)
-            rows = result.mappings().all()
-            return rows
-        except Exception as e:
-            # Fallback se tabela não existir
-            return []
+    def work(conn):
+        result = conn.execute(text(query_str), params)
+        data, next_cursor = keyset_page(result.mappings().all(), branches, limit)
+        total = None if searching else stored_count(conn, "operadoras")
+        return {"data": data, "total": total, "next_cursor": next_cursor}
+
+    try:
+        return await run_db(work)
+    except DBAPIError as e:
+        # Fallback se banco/tabela não existir (conexões são somente leitura)
+        return {"data": [], "total": 0, "next_cursor": None}
 
 @app.get("/api/operadoras/{id}")
-def get_operadora(id: str):
-    with engine.connect() as conn:
-        result = conn.execute(text("SELECT * FROM operadoras WHERE registro_ans = :id"), {"id": id})
+async def get_operadora(id: str, request: Request):
+    def work(conn):
+        result = conn.execute(text(f"SELECT {OPERADORA_COLUMNS} FROM operadoras WHERE registro_ans = :id"), {"id": id})
         row = result.mappings().first()
         if not row:
             raise HTTPException(status_code=404, detail="Operadora not found")
-        return row
+        return dict(row)
+    return await cached_response(request, work)
 
 @app.get("/api/operadoras/{id}/despesas")
-def get_operadora_despesas(id: str):
-    with engine.connect() as conn:
-        result = conn.execute(text("SELECT * FROM despesas_consolidadas WHERE registro_ans = :id"), {"id": id})
-        rows = result.mappings().all()
-        return rows
+async def get_operadora_despesas(id: str, request: Request, limit: int = Query(100, ge=1, le=1000), cursor: str = None):
+    # Ordem de carga (id), lida do índice (registro_ans, id). Só no SQLite o índice de
+    # registro_ans sozinho bastaria (o rowid vai junto em cada entrada)
+    branches = [("despesas_consolidadas o", ["o.registro_ans = :id"], ["o.id"])]
+    position = decode_cursor(cursor, branches) if cursor else None
+    query_str, params = keyset_query(qualified(DESPESA_COLUMNS), branches, position, limit)
+    params["id"] = id
+
+    def work(conn):
+        result = conn.execute(text(query_str), params)
+        data, next_cursor = keyset_page(result.mappings().all(), branches, limit)
+        total = stored_count(conn, "despesas_consolidadas", id)
+        return {"data": data, "total": total, "next_cursor": next_cursor}
+    return await cached_response(request, work)
+
+def store_index(store, id):
+    index = store.find(id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Operadora not found")
+    return index
+
+def store_period(ano, trimestre):
+    """(ano, trimestre de 1 a 4) do filtro opcional de período; None sem filtro"""
+    if ano is None and trimestre is None:
+        return None
+    if ano is None or trimestre is None:
+        raise HTTPException(status_code=400, detail="Informe ano e trimestre juntos")
+    try:
+        return ano, columnar.parse_quarter(trimestre)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Trimestre inválido (use 1T a 4T)")
+
+@app.get("/api/operadoras/{id}/serie")
+async def get_operadora_serie(id: str):
+    """Total de despesas da operadora em cada trimestre (snapshot colunar, sem SQL)"""
+    store = await analytics_store()
+    ano, trimestre, valor = store.series(store_index(store, id))
+    return {"registro_ans": id, "data": [
+        {"ano": a, "trimestre": f"{t}T", "total_despesas": v}
+        for a, t, v in zip(ano.tolist(), trimestre.tolist(), valor.tolist())
+    ]}
+
+@app.get("/api/operadoras/{id}/crescimento")
+async def get_operadora_crescimento(id: str):
+    """
+    Variação trimestral das despesas da operadora (0.1 = +10% sobre o trimestre
+    anterior). Nula no primeiro trimestre, sem o trimestre anterior ou com ele zerado.
+    """
+    store = await analytics_store()
+    index = store_index(store, id)
+    ano, trimestre, valor = store.series(index)
+    growth = store.growth(index)
+    return {"registro_ans": id, "data": [
+        {"ano": a, "trimestre": f"{t}T", "total_despesas": v, "crescimento": None if math.isnan(g) else g}
+        for a, t, v, g in zip(ano.tolist(), trimestre.tolist(), valor.tolist(), growth.tolist())
+    ]}
+
+@app.get("/api/operadoras/{id}/percentil")
+async def get_operadora_percentil(id: str, ano: int = None, trimestre: str = None):
+    """
+    Posição (1 = maior) e percentil da operadora pelo total de despesas do período
+    carregado ou, com ano e trimestre, do trimestre (entre as operadoras com despesas nele).
+    """
+    store = await analytics_store()
+    index = store_index(store, id)
+    period = store_period(ano, trimestre)
+    if period is None:
+        values, total = store.total_ordenado, float(store.total[index])
+    else:
+        values, total = store.period_slice(*period), store.value_in_period(index, *period)
+        if total is None:
+            raise HTTPException(status_code=404, detail="Operadora sem despesas no trimestre")
+    posicao, percentil = columnar.rank(values, total)
+    return {
+        "registro_ans": id, "ano": ano, "trimestre": f"{period[1]}T" if period else None,
+        "total_despesas": total, "posicao": posicao, "percentil": round(percentil, 2), "operadoras": len(values),
+    }
 
 @app.get("/api/estatisticas")
-def get_estatisticas():
+async def get_estatisticas(request: Request):
     # Retorna dados já agregados da tabela (Cache pattern: pré-calculado na etapa 2/3)
-    with engine.connect() as conn:
-        try:
-            result = conn.execute(text("SELECT * FROM despesas_agregadas LIMIT 100"))
-            return result.mappings().all()
-        except:
-            return []
+    def work(conn):
+        result = conn.execute(text("SELECT * FROM despesas_agregadas ORDER BY total_despesas DESC LIMIT 100"))
+        return [dict(row) for row in result.mappings()]
+    try:
+        return await cached_response(request, work)
+    except DBAPIError:
+        return []
+
+# Colunas de ordenação permitidas no ranking de operadoras (maiores primeiro)
+RANKING_ORDER = {"total": "posicao", "media": "media_trimestral DESC", "desvio": "desvio_padrao DESC"}
+
+def rollup_query(table, columns, filters, order, limit):
+    """
+    SELECT numa tabela de rollup do import_data com filtros de igualdade
+    (valores None são ignorados). Os índices dos rollups começam pelos filtros e
+    terminam na ordenação, então a consulta é uma busca no índice.
+    """
+    params = {col: value for col, value in filters.items() if value is not None}
+    where = " AND ".join(f"{col} = :{col}" for col in params)
+    sql = f"SELECT {columns} FROM {table}{' WHERE ' + where if where else ''} ORDER BY {order} LIMIT :limit"
+    return sql, {**params, "limit": limit}
+
+async def rollup_response(request, sql, params):
+    def work(conn):
+        return [dict(row) for row in conn.execute(text(sql), params).mappings()]
+    return await cached_response(request, work)
+
+@app.get("/api/estatisticas/operadoras")
+async def estatisticas_operadoras(request: Request, uf: str = None, modalidade: str = None, ano: int = None,
+                            trimestre: str = None, top: int = Query(10, ge=1, le=1000),
+                            ordenar: Literal["total", "media", "desvio"] = "total"):
+    """
+    Top N operadoras. Sem período: ranking do período carregado (total, média ou
+    desvio padrão trimestral). Com ano/trimestre: totais de cada trimestre.
+    """
+    uf = uf.upper() if uf else None
+    if ano is None and trimestre is None:
+        sql, params = rollup_query(
+            "rollup_ranking_operadoras",
+            "posicao, registro_ans, razao_social, uf, modalidade, total_despesas, media_trimestral, desvio_padrao, trimestres",
+            {"uf": uf, "modalidade": modalidade}, RANKING_ORDER[ordenar], top,
+        )
+    elif ordenar != "total":
+        raise HTTPException(status_code=400, detail="Por trimestre só há ordenação por total")
+    else:
+        sql, params = rollup_query(
+            "rollup_operadora_trimestre",
+            "registro_ans, razao_social, uf, modalidade, ano, trimestre, total_despesas, lancamentos",
+            {"uf": uf, "modalidade": modalidade, "ano": ano, "trimestre": trimestre}, "total_despesas DESC", top,
+        )
+    return await rollup_response(request, sql, params)
+
+@app.get("/api/estatisticas/uf")
+async def estatisticas_uf(request: Request, uf: str = None, ano: int = None, trimestre: str = None,
+                    top: int = Query(100, ge=1, le=1000)):
+    """Total de despesas e número de operadoras por UF e trimestre, maiores primeiro"""
+    sql, params = rollup_query(
+        "rollup_uf_trimestre", "uf, ano, trimestre, total_despesas, operadoras",
+        {"uf": uf.upper() if uf else None, "ano": ano, "trimestre": trimestre}, "total_despesas DESC", top,
+    )
+    return await rollup_response(request, sql, params)
+
+@app.get("/api/estatisticas/modalidades")
+async def estatisticas_modalidades(request: Request, modalidade: str = None, ano: int = None, trimestre: str = None,
+                             top: int = Query(100, ge=1, le=1000)):
+    """Total de despesas e número de operadoras por modalidade e trimestre, maiores primeiro"""
+    sql, params = rollup_query(
+        "rollup_modalidade_trimestre", "modalidade, ano, trimestre, total_despesas, operadoras",
+        {"modalidade": modalidade, "ano": ano, "trimestre": trimestre}, "total_despesas DESC", top,
+    )
+    return await rollup_response(request, sql, params)
+
+@app.get("/api/estatisticas/percentis")
+async def estatisticas_percentis(ano: int = None, trimestre: str = None,
+                                 p: list[float] = Query([25, 50, 75, 90, 99])):
+    """
+    Percentis (interpolação linear) dos totais de despesas por operadora no
+    período carregado ou, com ano e trimestre, no trimestre.
+    """
+    if any(not 0 <= pct <= 100 for pct in p):
+        raise HTTPException(status_code=400, detail="Percentis devem estar entre 0 e 100")
+    store = await analytics_store()
+    period = store_period(ano, trimestre)
+    values = store.total_ordenado if period is None else store.period_slice(*period)
+    if values is None:
+        raise HTTPException(status_code=404, detail="Trimestre não carregado")
+    results = columnar.quantiles(values, p) if len(values) else [None] * len(p)
+    return {"operadoras": len(values), "percentis": {f"p{pct:g}": value for pct, value in zip(p, results)}}
+
+# Tabelas exportáveis, no layout dos entregáveis das etapas 1 e 2 (mesmos nomes e
+# ordem de colunas de consolidado_despesas.csv e despesas_agregadas.csv): colunas
+# (nome no entregável, tipo Arrow, expressão SQL), origem, filtros aceitos
+# (parâmetro -> coluna) e ordenação. No consolidado, CNPJ é o registro ANS (como
+# na Etapa 1) e RazaoSocial vem do cadastro carregado em operadoras.
+# Sem ORDER BY em despesas_consolidadas: as linhas saem na ordem do índice usado
+# pelo filtro, sem ordenação intermediária que exigiria memória.
+EXPORTS = {
+    "despesas_consolidadas": {
+        "columns": [("CNPJ", "string", "d.registro_ans"), ("Trimestre", "string", "d.trimestre"),
+                    ("Ano", "int64", "d.ano"), ("ValorDespesas", "float64", "d.valor_despesas"),
+                    ("RazaoSocial", "string", "o.razao_social")],
+        "source": "despesas_consolidadas d LEFT JOIN operadoras o ON o.registro_ans = d.registro_ans",
+        "filters": {"ano": "d.ano", "trimestre": "d.trimestre", "registro_ans": "d.registro_ans"},
+        "order": None,
+    },
+    "despesas_agregadas": {
+        "columns": [("RazaoSocial", "string", "razao_social"), ("UF", "string", "uf"),
+                    ("TotalDespesas", "float64", "total_despesas"), ("MediaTrimestral", "float64", "media_trimestral"),
+                    ("DesvioPadrao", "float64", "desvio_padrao")],
+        "source": "despesas_agregadas",
+        "filters": {},
+        "order": "total_despesas DESC",
+    },
+}
+
+def _open_export(sql, params, opened):
+    """
+    Abre conexão e resultado, guardando cada um em `opened` assim que aberto: a
+    thread não é interrompida pelo timeout, então quem chamou fecha o que já foi
+    aberto se for cancelado (ou se a consulta falhar)
+    """
+    conn = engine.connect()
+    opened.append(conn)
+    opened.append(conn.execution_options(stream_results=True).execute(text(sql), params))
+
+def _stream_sync(conn, result, writer):
+    try:
+        yield writer.start()
+        for rows in result.partitions(EXPORT_BATCH_SIZE):
+            yield writer.write(rows)
+        yield writer.finish()
+    finally:
+        result.close()
+        conn.close()
+
+async def _stream_async(conn, result, writer):
+    try:
+        yield writer.start()
+        async for rows in result.partitions(EXPORT_BATCH_SIZE):
+            yield writer.write(rows)
+        yield writer.finish()
+    finally:
+        await result.close()
+        await conn.close()
+
+async def open_export_stream(sql, params, writer):
+    """
+    Abre a consulta com cursor do lado do servidor (stream_results) antes de
+    responder, para que erros do banco virem status HTTP, e devolve o iterador
+    de bytes que lê e codifica EXPORT_BATCH_SIZE linhas por vez.
+    """
+    if DB_MODE == "async":
+        with anyio.fail_after(REQUEST_TIMEOUT):
+            conn = await async_engine.connect()
+            try:
+                return _stream_async(conn, await conn.stream(text(sql), params), writer)
+            except BaseException:
+                await conn.close()
+                raise
+    opened = []
+    try:
+        with anyio.fail_after(REQUEST_TIMEOUT):
+            await anyio.to_thread.run_sync(_open_export, sql, params, opened)
+    except BaseException:
+        for resource in reversed(opened):
+            resource.close()
+        raise
+    conn, result = opened
+    return _stream_sync(conn, result, writer)
+
+@app.get("/api/exportar/{tabela}")
+async def exportar(tabela: Literal["despesas_consolidadas", "despesas_agregadas"],
+                   formato: Literal["csv", "ndjson", "arrow"] = "csv",
+                   compressao: Literal["gzip", "zstd"] = None,
+                   ano: int = None, trimestre: str = None, registro_ans: str = None):
+    """
+    Exporta a tabela inteira (ou filtrada) em streaming, com as colunas do
+    entregável correspondente: CSV com `;` (como os CSVs das etapas 1 e 2), NDJSON
+    ou Arrow IPC stream, opcionalmente com gzip/zstd.
+    """
+    spec = EXPORTS[tabela]
+    filters = {col: value for col, value in {"ano": ano, "trimestre": trimestre, "registro_ans": registro_ans}.items()
+               if value is not None}
+    if set(filters) - set(spec["filters"]):
+        raise HTTPException(status_code=400, detail=f"Filtros aceitos em {tabela}: {', '.join(spec['filters']) or 'nenhum'}")
+    missing = export.available(formato, compressao)
+    if missing:
+        raise HTTPException(status_code=400, detail=missing)
+
+    where = " AND ".join(f"{spec['filters'][col]} = :{col}" for col in filters)
+    sql = (f"SELECT {', '.join(expr for _, _, expr in spec['columns'])} FROM {spec['source']}"
+           f"{' WHERE ' + where if where else ''}{' ORDER BY ' + spec['order'] if spec['order'] else ''}")
+    writer = export.ExportWriter([(name, kind) for name, kind, _ in spec["columns"]], formato, compressao)
+    try:
+        stream = await open_export_stream(sql, filters, writer)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Tempo limite da consulta excedido")
+    except DBAPIError:
+        raise HTTPException(status_code=503, detail="Banco de dados indisponível")
+
+    name = export.filename(tabela, formato, compressao)
+    return StreamingResponse(stream, media_type=export.media_type(formato, compressao),
+                             headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+@app.get("/api/cache")
+async def get_cache_stats():
+    """Acertos, faltas, descartes e ocupação do cache de respostas"""
+    return response_cache.snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Histogramas de latência por rota e das consultas ao banco e contadores do cache (Prometheus)"""
+    cache = response_cache.snapshot()
+    body = "\n".join([
+        REQUEST_DURATION.render(),
+        DB_QUERY_DURATION.render(),
+        metrics.render_counters("api_response_cache_events_total", "Eventos do cache de respostas",
+                                [({"event": name}, cache[name]) for name in ("hits", "misses", "evictions",
+                                                                              "invalidations")]),
+    ])
+    return PlainTextResponse(body + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,8 +1,58 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
 from fastapi.testclient import TestClient
+import main
 from main import app
 
 client = TestClient(app)
 
+# import_data.py (etapa 3) monta o banco usado nos testes de busca
+spec = importlib.util.spec_from_file_location(
+    "import_data_backend", Path(__file__).resolve().parents[2] / "3_database" / "import_data.py"
+)
+import_data = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = import_data
+spec.loader.exec_module(import_data)
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    nomes = ['UNIMED SÃO PAULO', 'Bradesco Saúde S.A.', 'AMIL ASSISTÊNCIA MÉDICA', 'SAUDE CAIXA']
+    operadoras = pd.DataFrame({
+        'registro_ans': ['339679', '005711', '326305', '339680'],
+        'cnpj': ['02812468000106', '92693118000160', '29309127000179', None],
+        'razao_social': nomes,
+        'modalidade': ['Cooperativa Médica', 'Seguradora', 'Medicina de Grupo', 'Autogestão'],
+        'uf': ['SP', 'SP', 'RJ', 'DF'],
+        'razao_social_busca': import_data.fold_series(pd.Series(nomes)),
+    })
+    despesas = pd.DataFrame({
+        'registro_ans': ['339679'] * 5 + ['005711'],
+        'ano': 2023,
+        'trimestre': ['1T', '2T', '3T', '4T', '1T', '1T'],
+        'valor_despesas': [1.0, 2.0, 3.0, 4.0, 5.0, 7.0],
+    })
+    url = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    rollups = import_data.build_rollups(despesas, operadoras)
+    # Snapshot colunar da mesma versão da carga, como no import_data
+    stamp = import_data.new_version()
+    import_data.columnar.write_store(rollups['rollup_operadora_trimestre'], tmp_path / 'snapshot', stamp)
+    import_data.bulk_load(import_data.create_engine(url), {
+        'operadoras': operadoras, 'despesas_consolidadas': despesas, **rollups,
+    }, stamp=stamp)
+    engine = main.create_db_engine(url)
+    monkeypatch.setattr(main, "engine", engine)
+    monkeypatch.setattr(main, "SNAPSHOT_DIR", tmp_path / 'snapshot')
+    monkeypatch.setattr(main, "_store", {"version": None, "value": None})
+    # Cache de respostas novo e versão da carga consultada a cada requisição
+    monkeypatch.setattr(main, "response_cache", main.ResponseCache())
+    monkeypatch.setattr(main, "DATA_VERSION_TTL", 0)
+    yield url
+    engine.dispose()
+
 def test_read_root():
     response = client.get("/")
     assert response.status_code == 200
@@ -10,13 +60,256 @@ def test_read_root():
 
 def test_list_operadoras():
     response = client.get("/api/operadoras")
-    # Mesmo sem banco, deve retornar 200 (lista vazia ou erro tratado) 
-    # ou 500 se o banco não existir. 
-    # O código atual retorna [] no except, então deve ser 200.
+    # Mesmo sem banco, deve retornar 200 com uma página vazia (erro tratado no except)
     assert response.status_code == 200
-    assert isinstance(response.json(), list)
+    assert response.json() == {"data": [], "total": 0, "next_cursor": None}
 
 def test_get_estatisticas():
     response = client.get("/api/estatisticas")
     assert response.status_code == 200
     assert isinstance(response.json(), list)
+
+def buscar(termo):
+    response = client.get("/api/operadoras", params={"search": termo})
+    assert response.status_code == 200
+    return [op["registro_ans"] for op in response.json()["data"]]
+
+def test_busca_operadoras_usa_indices(banco):
+    # Sem acento e sem caixa; quem começa com o termo vem antes de quem só o contém
+    assert buscar("saude") == ['339680', '005711']
+    assert buscar("São Paulo") == ['339679']
+    assert buscar("assistencia med") == ['326305']
+    # Termo curto: prefixo da razão social
+    assert buscar("am") == ['326305']
+    # Prefixo do registro ANS e do CNPJ (com pontuação)
+    assert buscar("3396") == ['339679', '339680']
+    assert buscar("92.693.118") == ['005711']
+    assert buscar("xyz") == []
+    assert "razao_social_busca" not in client.get("/api/operadoras").json()["data"][0]
+
+def paginas(url, **params):
+    """Percorre todas as páginas seguindo next_cursor"""
+    pages, cursor = [], None
+    while True:
+        body = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        pages.append(body)
+        cursor = body["next_cursor"]
+        if not cursor:
+            return pages
+
+def test_paginacao_por_cursor(banco):
+    pages = paginas("/api/operadoras", limit=3)
+    assert [len(p["data"]) for p in pages] == [3, 1]
+    assert [op["registro_ans"] for p in pages for op in p["data"]] == ['005711', '326305', '339679', '339680']
+    assert pages[0]["total"] == 4
+
+    # Busca: o cursor atravessa os blocos de relevância (prefixo -> substring), sem total
+    pages = paginas("/api/operadoras", limit=1, search="saude")
+    assert [op["registro_ans"] for p in pages for op in p["data"]] == ['339680', '005711']
+    assert pages[0]["total"] is None
+
+    # A ordem da página vem do ORDER BY externo, não da ordem dos ramos do UNION ALL
+    branches, _ = main.operadora_branches("saude", "sqlite")
+    sql, _ = main.keyset_query(main.qualified(main.OPERADORA_COLUMNS), branches, None, 10)
+    assert sql.endswith(") AS pagina ORDER BY _ramo, _k0, _k1, _k2, _k3 LIMIT :limit")
+
+    pages = paginas("/api/operadoras/339679/despesas", limit=2)
+    assert [d["valor_despesas"] for p in pages for d in p["data"]] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert pages[0]["total"] == 5
+
+    assert client.get("/api/operadoras", params={"cursor": "invalido"}).status_code == 400
+
+def test_cache_de_respostas_com_etag(banco):
+    url = "/api/operadoras/339679/despesas"
+    first = client.get(url)
+    etag = first.headers["etag"]
+    assert first.json()["total"] == 5
+    assert client.get(url).json() == first.json()
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/cache").json()["hits"] == 2
+
+    # Nova carga: a versão muda e o cache antigo deixa de ser usado
+    despesas = pd.DataFrame({'registro_ans': ['339679'], 'ano': 2024, 'trimestre': '1T', 'valor_despesas': [9.0]})
+    import_data.bulk_load(import_data.create_engine(banco), {'despesas_consolidadas': despesas})
+    reloaded = client.get(url, headers={"If-None-Match": etag})
+    assert reloaded.status_code == 200 and reloaded.json()["total"] == 1
+    assert client.get("/api/cache").json()["invalidations"] == 1
+
+def test_metricas_no_formato_prometheus(banco, monkeypatch):
+    for name in ("REQUEST_DURATION", "DB_QUERY_DURATION"):
+        histogram = getattr(main, name)
+        monkeypatch.setattr(main, name, main.metrics.Histogram(histogram.name, histogram.description,
+                                                               histogram.label_names))
+    client.get("/api/operadoras/339679")
+    client.get("/api/operadoras/005711")
+    client.get("/api/nao-existe")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    linhas = response.text.splitlines()
+    # Rótulo com o template da rota: uma série só para todos os ids
+    assert 'api_request_duration_seconds_count{route="/api/operadoras/{id}",method="GET",status="200"} 2' in linhas
+    assert 'api_request_duration_seconds_count{route="desconhecida",method="GET",status="404"} 1' in linhas
+    consultas = [l for l in linhas if l.startswith('api_db_query_duration_seconds_count{route="/api/operadoras/{id}"}')]
+    assert len(consultas) == 1 and int(consultas[0].split()[-1]) >= 2
+    assert 'api_response_cache_events_total{event="misses"} 2' in linhas
+
+def test_estatisticas_leem_rollups_por_indice(banco):
+    ranking = client.get("/api/estatisticas/operadoras").json()
+    assert [(op["posicao"], op["registro_ans"], op["total_despesas"]) for op in ranking] == [(1, '339679', 15.0), (2, '005711', 7.0)]
+    assert ranking[0]["trimestres"] == 4 and ranking[0]["media_trimestral"] == 3.75
+
+    trimestre = client.get("/api/estatisticas/operadoras", params={"ano": 2023, "trimestre": "1T", "uf": "sp"}).json()
+    assert [(op["registro_ans"], op["total_despesas"], op["lancamentos"]) for op in trimestre] == [('005711', 7.0, 1), ('339679', 6.0, 2)]
+    assert client.get("/api/estatisticas/operadoras", params={"ano": 2023, "ordenar": "media"}).status_code == 400
+
+    por_uf = client.get("/api/estatisticas/uf", params={"ano": 2023, "trimestre": "1T"}).json()
+    assert por_uf == [{"uf": "SP", "ano": 2023, "trimestre": "1T", "total_despesas": 13.0, "operadoras": 2}]
+    modalidades = client.get("/api/estatisticas/modalidades", params={"top": 1}).json()
+    assert modalidades[0]["modalidade"] == "Seguradora" and modalidades[0]["total_despesas"] == 7.0
+
+    # Toda combinação de filtros é uma busca no índice do rollup, nunca uma varredura
+    combinacoes = [
+        ("rollup_ranking_operadoras", {}, main.RANKING_ORDER["total"]),
+        ("rollup_ranking_operadoras", {"uf": "SP"}, main.RANKING_ORDER["total"]),
+        ("rollup_ranking_operadoras", {}, main.RANKING_ORDER["desvio"]),
+        ("rollup_operadora_trimestre", {"ano": 2023, "trimestre": "1T"}, "total_despesas DESC"),
+        ("rollup_operadora_trimestre", {"uf": "SP", "ano": 2023, "trimestre": "1T"}, "total_despesas DESC"),
+        ("rollup_uf_trimestre", {"ano": 2023, "trimestre": "1T"}, "total_despesas DESC"),
+        ("rollup_modalidade_trimestre", {"modalidade": "Seguradora"}, "total_despesas DESC"),
+    ]
+    with main.engine.connect() as conn:
+        for table, filters, order in combinacoes:
+            sql, params = main.rollup_query(table, "*", filters, order, 10)
+            plan = " | ".join(row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql.replace(":limit", "10")
+                                                                      .replace(":uf", "'SP'").replace(":ano", "2023")
+                                                                      .replace(":trimestre", "'1T'").replace(":modalidade", "'Seguradora'")))
+            assert f"SCAN {table} USING" in plan or f"SEARCH {table} USING" in plan, (table, filters, plan)
+
+def test_modo_assincrono_responde_igual_ao_sincrono(banco, monkeypatch):
+    urls = ["/api/operadoras?limit=2", "/api/operadoras?search=saude", "/api/operadoras/339679/despesas",
+            "/api/operadoras/000000", "/api/estatisticas/operadoras", "/api/estatisticas/uf"]
+    sync = [(r.status_code, r.json()) for r in map(client.get, urls)]
+
+    monkeypatch.setattr(main, "DB_MODE", "async")
+    monkeypatch.setattr(main, "async_engine", main.create_async_db_engine(banco))
+    monkeypatch.setattr(main, "response_cache", main.ResponseCache())
+    # Um único event loop para todas as requisições (o pool assíncrono fica preso a ele)
+    with TestClient(app) as async_client:
+        assert [(r.status_code, r.json()) for r in map(async_client.get, urls)] == sync
+        # Listagens de operadoras não passam pelo cache; as demais vieram do banco assíncrono
+        assert async_client.get("/api/cache").json()["misses"] == 4
+
+        # Consulta mais lenta que o limite: 504 em vez de prender a conexão
+        monkeypatch.setattr(main, "REQUEST_TIMEOUT", 0)
+        assert async_client.get("/api/operadoras").status_code == 504
+
+def test_exportacao_em_streaming(banco, monkeypatch):
+    import gzip
+    import io
+    import pyarrow as pa
+    import zstandard
+
+    # Lotes de 2 linhas: a resposta é montada em vários pedaços
+    monkeypatch.setattr(main, "EXPORT_BATCH_SIZE", 2)
+    csv = client.get("/api/exportar/despesas_consolidadas", params={"registro_ans": "339679"})
+    assert csv.status_code == 200
+    assert csv.headers["content-disposition"] == 'attachment; filename="despesas_consolidadas.csv"'
+    linhas = csv.text.splitlines()
+    # Layout do consolidado da Etapa 1 (CNPJ = registro ANS, razão social do cadastro)
+    assert linhas[0] == "CNPJ;Trimestre;Ano;ValorDespesas;RazaoSocial" and len(linhas) == 6
+    assert "339679;1T;2023;1.0;UNIMED SÃO PAULO" in linhas
+
+    ndjson = client.get("/api/exportar/despesas_consolidadas", params={"formato": "ndjson", "ano": 2023, "trimestre": "1T"})
+    assert sorted(line for line in ndjson.text.splitlines()) == [
+        '{"CNPJ": "005711", "Trimestre": "1T", "Ano": 2023, "ValorDespesas": 7.0, "RazaoSocial": "Bradesco Saúde S.A."}',
+        '{"CNPJ": "339679", "Trimestre": "1T", "Ano": 2023, "ValorDespesas": 1.0, "RazaoSocial": "UNIMED SÃO PAULO"}',
+        '{"CNPJ": "339679", "Trimestre": "1T", "Ano": 2023, "ValorDespesas": 5.0, "RazaoSocial": "UNIMED SÃO PAULO"}',
+    ]
+
+    arrow = client.get("/api/exportar/despesas_consolidadas", params={"formato": "arrow", "compressao": "zstd"})
+    assert arrow.headers["content-type"] == "application/zstd"
+    tabela = pa.ipc.open_stream(zstandard.ZstdDecompressor().stream_reader(io.BytesIO(arrow.content)).read()).read_all()
+    assert tabela.num_rows == 6 and tabela.schema.field("Ano").type == pa.int64()
+
+    gz = client.get("/api/exportar/despesas_consolidadas", params={"compressao": "gzip", "registro_ans": "339679"})
+    assert gz.headers["content-disposition"].endswith('.csv.gz"') and gzip.decompress(gz.content).decode() == csv.text
+    assert client.get("/api/exportar/despesas_agregadas", params={"ano": 2023}).status_code == 400
+    # Tabela não carregada: erro antes de começar a resposta
+    assert client.get("/api/exportar/despesas_agregadas").status_code == 503
+
+    # Agregadas no layout do entregável da Etapa 2, maiores totais primeiro
+    import_data.bulk_load(import_data.create_engine(banco), {'despesas_agregadas': pd.DataFrame({
+        'razao_social': ['A', 'B'], 'uf': ['SP', 'RJ'], 'total_despesas': [1.0, 2.5],
+        'media_trimestral': [1.0, 2.5], 'desvio_padrao': [0.0, 0.0],
+    })})
+    assert client.get("/api/exportar/despesas_agregadas").text.splitlines() == [
+        "RazaoSocial;UF;TotalDespesas;MediaTrimestral;DesvioPadrao", "B;RJ;2.5;2.5;0.0", "A;SP;1.0;1.0;0.0"]
+
+    # Modo assíncrono: mesmo conteúdo lido pelo cursor do engine assíncrono
+    monkeypatch.setattr(main, "DB_MODE", "async")
+    monkeypatch.setattr(main, "async_engine", main.create_async_db_engine(banco))
+    with TestClient(app) as async_client:
+        assert async_client.get("/api/exportar/despesas_consolidadas", params={"registro_ans": "339679"}).text == csv.text
+
+def test_exportacao_cancelada_devolve_conexao_ao_pool(banco, monkeypatch):
+    import anyio
+
+    run_sync = anyio.to_thread.run_sync
+    async def late_timeout(*args, **kwargs):
+        # A thread abre conexão e cursor, mas o timeout vence antes de o resultado voltar
+        await run_sync(*args, **kwargs)
+        raise TimeoutError
+    monkeypatch.setattr(anyio.to_thread, "run_sync", late_timeout)
+    sql = "SELECT registro_ans FROM despesas_consolidadas"
+    with pytest.raises(TimeoutError):
+        anyio.run(main.open_export_stream, sql, {}, None)
+    assert main.engine.pool.checkedout() == 0
+
+def test_analises_pelo_snapshot_colunar(banco, monkeypatch):
+    serie = client.get("/api/operadoras/339679/serie").json()
+    assert serie == {"registro_ans": "339679", "data": [
+        {"ano": 2023, "trimestre": f"{n}T", "total_despesas": total} for n, total in ((1, 6.0), (2, 2.0), (3, 3.0), (4, 4.0))
+    ]}
+    crescimento = [row["crescimento"] for row in client.get("/api/operadoras/339679/crescimento").json()["data"]]
+    assert crescimento[0] is None and crescimento[1:] == pytest.approx([-2 / 3, 0.5, 1 / 3])
+
+    # Total do período: 15 contra 7; no 1T: 6 contra 7
+    geral = client.get("/api/operadoras/005711/percentil").json()
+    assert (geral["posicao"], geral["percentil"], geral["operadoras"]) == (2, 50.0, 2)
+    primeiro = client.get("/api/operadoras/339679/percentil", params={"ano": 2023, "trimestre": "1T"}).json()
+    assert (primeiro["total_despesas"], primeiro["posicao"], primeiro["percentil"]) == (6.0, 2, 50.0)
+    assert client.get("/api/operadoras/005711/percentil", params={"ano": 2023, "trimestre": "2T"}).status_code == 404
+    assert client.get("/api/estatisticas/percentis", params={"p": [0, 50, 100]}).json() == {
+        "operadoras": 2, "percentis": {"p0": 7.0, "p50": 11.0, "p100": 15.0}}
+
+    assert client.get("/api/operadoras/999999/serie").status_code == 404
+    assert client.get("/api/operadoras/339679/percentil", params={"ano": 2023}).status_code == 400
+    assert client.get("/api/estatisticas/percentis", params={"p": 101}).status_code == 400
+
+    # Sem snapshot para a versão carregada: 503 em vez de dados de outra carga
+    monkeypatch.setattr(main, "SNAPSHOT_DIR", Path(banco.removeprefix("sqlite:///")).parent / "outro")
+    monkeypatch.setattr(main, "_store", {"version": None, "value": None})
+    assert client.get("/api/operadoras/339679/serie").status_code == 503
+
+def test_busca_por_substring_ordenada_por_relevancia(tmp_path, monkeypatch):
+    # Inseridas da menos para a mais relevante: a ordem do rowid seria a inversa
+    nomes = ['CLINICA ODONTO E SAUDE DOS TRABALHADORES DO PORTO LTDA', 'BOA SAUDE', 'SAUDE E SAUDE MAIS']
+    operadoras = pd.DataFrame({
+        'registro_ans': ['100001', '100002', '100003'], 'cnpj': None, 'razao_social': nomes,
+        'modalidade': None, 'uf': 'SP', 'razao_social_busca': import_data.fold_series(pd.Series(nomes)),
+    })
+    url = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    import_data.bulk_load(import_data.create_engine(url), {'operadoras': operadoras})
+    engine = main.create_db_engine(url)
+    monkeypatch.setattr(main, "engine", engine)
+
+    # 'SAUDE E SAUDE MAIS' é prefixo; no bloco de substring, bm25 (mais curta primeiro)
+    esperado = ['100003', '100002', '100001']
+    assert buscar("saude") == esperado
+    assert [op["registro_ans"] for p in paginas("/api/operadoras", limit=1, search="saude") for op in p["data"]] == esperado
+
+    # PostgreSQL: similaridade do pg_trgm, crescente como chave do keyset
+    branches, params = main.operadora_branches("Saúde", "postgresql")
+    assert branches[-1][2] == ["-similarity(o.razao_social_busca, :term)", "o.registro_ans"] and params["term"] == "saude"
+    engine.dispose()
@@ -0,0 +1 @@
+"""Utilitários compartilhados entre as etapas do pipeline."""
@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+# Snapshot colunar das despesas por operadora e trimestre, gravado pelo import_data
+# ao lado do banco e lido pela API via mmap. Cada carga fica em `<raiz>/<versão>/`
+# (mesma versão gravada em `versao_dados`), com um .npy por coluna:
+#
+#   registro_ans      chaves ordenadas (bytes de largura fixa), uma por operadora
+#   offsets           início da série de cada operadora nas colunas abaixo (+ o fim)
+#   ano, trimestre    período de cada linha (trimestre 1 a 4)
+#   valor             total de despesas da operadora no trimestre
+#   total             total do período carregado, alinhado às chaves
+#   total_ordenado    os mesmos totais em ordem crescente (percentis)
+#   periodos          períodos carregados (ano * 4 + trimestre - 1), crescentes
+#   periodo_offsets   início de cada período em periodo_valor (+ o fim)
+#   periodo_valor     totais do trimestre em ordem crescente, período a período
+#
+# Os arquivos são abertos com mmap somente leitura: as páginas ficam no cache do
+# sistema operacional, compartilhadas por todos os workers da API.
+FORMAT_VERSION = 1
+COLUMNS = ('registro_ans', 'offsets', 'ano', 'trimestre', 'valor', 'total', 'total_ordenado',
+           'periodos', 'periodo_offsets', 'periodo_valor')
+META_FILE = 'meta.json'
+
+
+def period_code(ano, trimestre):
+    """Período como inteiro crescente: ano * 4 + trimestre - 1"""
+    return ano * 4 + trimestre - 1
+
+
+def parse_quarter(label):
+    """'1T' -> 1 (trimestre no formato gravado pela Etapa 1)"""
+    text = str(label).strip().upper()
+    if len(text) != 2 or text[1] != 'T' or text[0] not in '1234':
+        raise ValueError(f"Trimestre inválido: {label!r}")
+    return int(text[0])
+
+
+def write_store(por_trimestre, root, version):
+    """
+    Grava o snapshot de `por_trimestre` (registro_ans, ano, trimestre,
+    total_despesas: o rollup operadora x trimestre) em `<root>/<version>/`.
+    Escrito num diretório temporário e renomeado no fim: quem abrir a versão
+    nunca vê o snapshot pela metade. Retorna o diretório.
+    """
+    df = por_trimestre[['registro_ans', 'ano', 'trimestre', 'total_despesas']].dropna(subset=['registro_ans'])
+    keys = df['registro_ans'].astype(str).str.encode('utf-8').to_numpy(dtype=object)
+    ano = df['ano'].to_numpy(dtype=np.int16)
+    labels = df['trimestre'].astype(str)
+    trimestre = labels.map({label: parse_quarter(label) for label in labels.unique()}).to_numpy(dtype=np.int8)
+    valor = df['total_despesas'].to_numpy(dtype=np.float64)
+
+    width = max((len(key) for key in keys), default=1)
+    keys = keys.astype(f'S{width}')
+    periods = period_code(ano.astype(np.int32), trimestre)
+    order = np.lexsort((periods, keys))
+    keys, ano, trimestre, valor, periods = keys[order], ano[order], trimestre[order], valor[order], periods[order]
+
+    unique, starts = np.unique(keys, return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.int64)
+    total = np.add.reduceat(valor, starts) if len(valor) else np.zeros(0)
+
+    by_period = np.lexsort((valor, periods))
+    period_values, period_starts = np.unique(periods[by_period], return_index=True)
+
+    columns = {
+        'registro_ans': unique,
+        'offsets': offsets,
+        'ano': ano,
+        'trimestre': trimestre,
+        'valor': valor,
+        'total': total,
+        'total_ordenado': np.sort(total),
+        'periodos': period_values.astype(np.int32),
+        'periodo_offsets': np.append(period_starts, len(periods)).astype(np.int64),
+        'periodo_valor': valor[by_period],
+    }
+
+    root = os.fspath(root)
+    target = os.path.join(root, version)
+    tmp = os.path.join(root, f".{version}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), values)
+        meta = {'formato': FORMAT_VERSION, 'versao': version, 'linhas': len(valor), 'operadoras': len(unique)}
+        with open(os.path.join(tmp, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        shutil.rmtree(target, ignore_errors=True)
+        os.rename(tmp, target)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    logging.info(f"Snapshot colunar: {len(valor)} linhas de {len(unique)} operadoras em {target}")
+    return target
+
+
+def prune_stores(root, keep):
+    """
+    Remove os snapshots mais antigos, mantendo as `keep` versões mais recentes
+    (a anterior continua disponível para workers que ainda não viram a troca).
+    """
+    if not os.path.isdir(root):
+        return
+    versions = sorted((entry for entry in os.listdir(root)
+                       if not entry.startswith('.') and os.path.isdir(os.path.join(root, entry))),
+                      key=lambda name: (len(name), name))
+    for name in versions[:-keep] if keep else versions:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+class ColumnarStore:
+    """
+    Consultas sobre o snapshot aberto com mmap: a operadora é localizada por busca
+    binária nas chaves ordenadas (O(log n)) e a série é uma fatia das colunas,
+    sem cópia.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, META_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('formato') != FORMAT_VERSION:
+            raise ValueError(f"Formato de snapshot não suportado: {self.meta.get('formato')}")
+        self.version = self.meta['versao']
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.registro_ans)
+
+    def find(self, registro_ans):
+        """Índice da operadora nas chaves, ou None"""
+        key = str(registro_ans).encode('utf-8')
+        if not key or len(key) > self.registro_ans.dtype.itemsize:
+            return None
+        index = int(np.searchsorted(self.registro_ans, key))
+        if index < len(self.registro_ans) and self.registro_ans[index] == key:
+            return index
+        return None
+
+    def series(self, index):
+        """(ano, trimestre, valor) da operadora, em ordem de período (fatias do mmap)"""
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self.ano[start:end], self.trimestre[start:end], self.valor[start:end]
+
+    def growth(self, index):
+        """
+        Variação de cada trimestre sobre o trimestre anterior (0.1 = +10%). NaN no
+        primeiro trimestre, quando falta o trimestre imediatamente anterior ou
+        quando o total anterior é zero.
+        """
+        ano, trimestre, valor = self.series(index)
+        result = np.full(len(valor), np.nan)
+        if len(valor) > 1:
+            periods = period_code(ano.astype(np.int32), trimestre)
+            previous = valor[:-1]
+            valid = (np.diff(periods) == 1) & (previous != 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result[1:] = np.where(valid, (valor[1:] - previous) / previous, np.nan)
+        return result
+
+    def period_slice(self, ano, trimestre):
+        """Totais do trimestre em ordem crescente (fatia do mmap), ou None se não carregado"""
+        code = period_code(ano, trimestre)
+        index = int(np.searchsorted(self.periodos, code))
+        if index == len(self.periodos) or self.periodos[index] != code:
+            return None
+        return self.periodo_valor[int(self.periodo_offsets[index]):int(self.periodo_offsets[index + 1])]
+
+    def value_in_period(self, index, ano, trimestre):
+        """Total da operadora no trimestre, ou None se ela não teve despesas nele"""
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        periods = period_code(self.ano[start:end].astype(np.int32), self.trimestre[start:end])
+        position = int(np.searchsorted(periods, period_code(ano, trimestre)))
+        if position == len(periods) or periods[position] != period_code(ano, trimestre):
+            return None
+        return float(self.valor[start + position])
+
+
+def rank(sorted_values, value):
+    """
+    Posição (1 = maior total; empates dividem a melhor posição) e percentil (% dos
+    valores menores ou iguais) de `value` entre `sorted_values`, por busca binária.
+    """
+    at_most = int(np.searchsorted(sorted_values, value, side='right'))
+    return len(sorted_values) - at_most + 1, 100.0 * at_most / len(sorted_values)
+
+
+def quantiles(sorted_values, percents):
+    """Percentis por interpolação linear (como numpy.percentile), sem reordenar os valores"""
+    n = len(sorted_values)
+    result = []
+    for pct in percents:
+        position = pct / 100 * (n - 1)
+        low = int(np.floor(position))
+        high = min(low + 1, n - 1)
+        low_value, high_value = float(sorted_values[low]), float(sorted_values[high])
+        result.append(low_value + (high_value - low_value) * (position - low))
+    return result
+
+
+def open_store(root, version):
+    """Snapshot da versão `version` em `root`; FileNotFoundError se não existir"""
+    return ColumnarStore(os.path.join(os.fspath(root), version))
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadCache:
+    """
+    Cache em disco dos artefatos da ANS, indexado pela URL.
+
+    Para cada URL guarda o conteúdo e um JSON com ETag, Last-Modified, tamanho
+    e hash SHA-256. Novas buscas usam requisições condicionais
+    (If-None-Match / If-Modified-Since) e downloads interrompidos são
+    retomados com HTTP Range.
+    """
+
+    def __init__(self, cache_dir, session=None):
+        self.cache_dir = Path(cache_dir)
+        self.session = session or requests.Session()
+        self.stats = {"hits": 0, "misses": 0, "resumed": 0, "bytes": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()[:32]
+        base = self.cache_dir / key
+        return base.with_suffix(".bin"), base.with_suffix(".part"), base.with_suffix(".json")
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def metadata(self, url):
+        """Retorna os metadados salvos para a URL (ou {} se nunca baixada)"""
+        _, _, meta_path = self._paths(url)
+        if meta_path.exists():
+            with open(meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def fetch(self, url, chunk_size=CHUNK_SIZE):
+        """
+        Garante o conteúdo da URL no cache.
+        Retorna (caminho_local, metadados) ou (None, None) em caso de falha HTTP.
+        """
+        body_path, part_path, meta_path = self._paths(url)
+        meta = self.metadata(url)
+        headers = {}
+
+        if meta.get("complete") and body_path.exists():
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        elif part_path.exists() and (meta.get("etag") or meta.get("last_modified")):
+            # Download parcial anterior: retoma de onde parou se o arquivo não mudou
+            headers["Range"] = f"bytes={part_path.stat().st_size}-"
+            headers["If-Range"] = meta.get("etag") or meta["last_modified"]
+
+        response = self.session.get(url, headers=headers, stream=True, verify=False)
+        if "Range" in headers and response.status_code not in (200, 206):
+            # Retomada recusada (416 etc.): descarta o parcial e baixa do início
+            logging.warning(f"Retomada de {url} recusada ({response.status_code}), baixando do início")
+            response.close()
+            part_path.unlink(missing_ok=True)
+            response = self.session.get(url, stream=True, verify=False)
+
+        with response:
+            if response.status_code == 304:
+                self._count("hits")
+                logging.info(f"Cache válido para {url}")
+                return body_path, meta
+            if response.status_code not in (200, 206):
+                logging.error(f"Falha no download de {url}: {response.status_code}")
+                return None, None
+
+            new_meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "complete": False,
+            }
+            hasher = hashlib.sha256()
+            if response.status_code == 206:
+                self._count("resumed")
+                with open(part_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b""):
+                        hasher.update(chunk)
+                mode = "ab"
+            else:
+                mode = "wb"
+            self._write_meta(meta_path, new_meta)
+
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    self._count("bytes", len(chunk))
+
+        os.replace(part_path, body_path)
+        new_meta.update(complete=True, size=body_path.stat().st_size, sha256=hasher.hexdigest())
+        self._write_meta(meta_path, new_meta)
+
+        # Mesmo conteúdo de antes (servidor sem validadores): conta como acerto
+        if meta.get("sha256") == new_meta["sha256"]:
+            self._count("hits")
+        else:
+            self._count("misses")
+        return body_path, new_meta
+
+    def read(self, url):
+        """Atalho para páginas pequenas (listagens HTML): retorna o conteúdo em bytes"""
+        path, _ = self.fetch(url)
+        if path is None:
+            return None
+        return path.read_bytes()
+
+    @staticmethod
+    def _write_meta(meta_path, meta):
+        tmp = meta_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    def log_stats(self):
+        s = self.stats
+        logging.info(
+            f"Cache de downloads: {s['hits']} hits, {s['misses']} misses, "
+            f"{s['resumed']} retomados, {s['bytes'] / 1024 / 1024:.1f} MB baixados"
+        )
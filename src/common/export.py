@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+import zlib
+
+# Arrow e zstd são opcionais: sem eles a exportação fica restrita a CSV/NDJSON e gzip
+try:
+    import pyarrow as pa
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# formato -> (media type, extensão)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+# compressão -> (media type do arquivo comprimido, extensão)
+COMPRESSIONS = {'gzip': ('application/gzip', 'gz'), 'zstd': ('application/zstd', 'zst')}
+
+
+def available(fmt, compression=None):
+    """Mensagem de erro se o formato/compressão depender de biblioteca ausente, senão None"""
+    if fmt == 'arrow' and not ARROW_AVAILABLE:
+        return "Formato arrow requer pyarrow"
+    if compression == 'zstd' and not ZSTD_AVAILABLE:
+        return "Compressão zstd requer zstandard"
+    return None
+
+
+def media_type(fmt, compression=None):
+    return COMPRESSIONS[compression][0] if compression else FORMATS[fmt][0]
+
+
+def filename(name, fmt, compression=None):
+    parts = [name, FORMATS[fmt][1]] + ([COMPRESSIONS[compression][1]] if compression else [])
+    return ".".join(parts)
+
+
+class _Buffer(io.BytesIO):
+    """Destino de escrita que devolve e esvazia o que foi escrito desde a última leitura"""
+
+    def drain(self):
+        data = self.getvalue()
+        self.seek(0)
+        self.truncate()
+        return data
+
+
+class ExportWriter:
+    """
+    Codifica lotes de linhas (tuplas na ordem de `columns`) em CSV com `;`
+    (mesmo formato do consolidado da Etapa 1), NDJSON ou Arrow IPC stream,
+    opcionalmente comprimidos com gzip ou zstd. Cada chamada devolve só os
+    bytes novos, então a memória usada não depende do tamanho da exportação.
+
+    `columns` é uma lista de (nome, tipo Arrow), ex.: ('ano', 'int64').
+    """
+
+    def __init__(self, columns, fmt='csv', compression=None):
+        self.names = [name for name, _ in columns]
+        self.fmt = fmt
+        self.buffer = _Buffer()
+        if fmt == 'csv':
+            self.text = io.StringIO()
+            self.csv = csv.writer(self.text, delimiter=';', lineterminator='\n')
+        elif fmt == 'arrow':
+            self.schema = pa.schema([(name, kind) for name, kind in columns])
+        if compression == 'gzip':
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif compression == 'zstd':
+            self.compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            self.compressor = None
+
+    def _output(self, data):
+        return self.compressor.compress(data) if self.compressor else data
+
+    def start(self):
+        """Cabeçalho (CSV) ou schema (Arrow)"""
+        if self.fmt == 'csv':
+            self.csv.writerow(self.names)
+            return self._output(self._take_text())
+        if self.fmt == 'arrow':
+            self.arrow = pa.ipc.new_stream(self.buffer, self.schema)
+            return self._output(self.buffer.drain())
+        return b""
+
+    def write(self, rows):
+        """Bytes de um lote de linhas"""
+        if not rows:
+            return b""
+        if self.fmt == 'csv':
+            self.csv.writerows(rows)
+            return self._output(self._take_text())
+        if self.fmt == 'ndjson':
+            lines = "".join(json.dumps(dict(zip(self.names, row)), ensure_ascii=False) + "\n" for row in rows)
+            return self._output(lines.encode("utf-8"))
+        columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), self.schema)]
+        self.arrow.write_batch(pa.RecordBatch.from_arrays(columns, schema=self.schema))
+        return self._output(self.buffer.drain())
+
+    def finish(self):
+        """Fim do stream Arrow e resto do compressor"""
+        data = b""
+        if self.fmt == 'arrow':
+            self.arrow.close()
+            data = self._output(self.buffer.drain())
+        if self.compressor:
+            data += self.compressor.flush()
+        return data
+
+    def _take_text(self):
+        data = self.text.getvalue().encode("utf-8")
+        self.text.seek(0)
+        self.text.truncate()
+        return data
@@ -0,0 +1,74 @@
+import logging
+import os
+import shutil
+
+import pandas as pd
+
+# Parquet é opcional: sem pyarrow as etapas continuam trocando dados pelos CSVs
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Tipos das colunas de partição (o nome do diretório não carrega tipo)
+PARTITION_TYPES = {'Ano': 'int32', 'Trimestre': 'string'}
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def cast_partitions(df, partition_cols):
+    """Cópia do DataFrame com as colunas de partição nos tipos de PARTITION_TYPES (os mesmos da leitura)"""
+    return df.astype({col: PARTITION_TYPES.get(col, 'string') for col in partition_cols})
+
+
+def write_table(df, path, partition_cols=None):
+    """
+    Grava o DataFrame como Parquet intermediário (particionado se `partition_cols`).
+    Sem pyarrow, apenas remove uma cópia antiga para que as etapas seguintes não
+    leiam dados desatualizados. Retorna True se o arquivo foi gravado.
+    """
+    _remove(path)
+    if not PARQUET_AVAILABLE:
+        logging.info(f"pyarrow indisponível, {os.path.basename(path)} não será gerado.")
+        return False
+
+    if partition_cols:
+        df = cast_partitions(df, partition_cols)
+    df.to_parquet(path, index=False, partition_cols=partition_cols)
+    logging.info(f"Parquet intermediário salvo em {path}")
+    return True
+
+
+def has_table(path):
+    return PARQUET_AVAILABLE and os.path.exists(path)
+
+
+def read_table(path, columns=None):
+    """
+    Lê um Parquet intermediário apenas com as colunas pedidas.
+    Colunas de partição voltam com o tipo de PARTITION_TYPES, não inferido.
+    """
+    names = _partition_names(path) if os.path.isdir(path) else []
+    if not names:
+        return pd.read_parquet(path, columns=columns)
+    schema = pa.schema([(col, PARTITION_TYPES.get(col, 'string')) for col in names])
+    return pd.read_parquet(path, columns=columns, partitioning=ds.partitioning(schema, flavor='hive'))
+
+
+def _partition_names(path):
+    """Nomes das colunas de partição, na ordem dos diretórios (ex.: Ano=2023/Trimestre=1T)"""
+    names = []
+    current = path
+    while True:
+        subdirs = [d for d in sorted(os.listdir(current)) if '=' in d and os.path.isdir(os.path.join(current, d))]
+        if not subdirs:
+            return names
+        names.append(subdirs[0].split('=')[0])
+        current = os.path.join(current, subdirs[0])
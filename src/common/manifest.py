@@ -0,0 +1,32 @@
+import hashlib
+import json
+import os
+
+
+def load_manifest(path):
+    """Lê um manifesto JSON (ou {} se ainda não existir / estiver corrompido)"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, data):
+    """Grava o manifesto de forma atômica (arquivo temporário + rename)"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def quarter_key(year, quarter):
+    return f"{year}_{quarter}"
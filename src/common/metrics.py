@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# getrusage não existe no Windows: lá o pico de memória fica ausente do relatório
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo (e dos filhos já encerrados), em MB"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class RunReport:
+    """
+    Spans (tempo de cada trecho) e contadores (linhas lidas, filtradas, gravadas,
+    bytes baixados...) de uma execução de etapa, gravados como JSON no fim.
+    Seguro para os threads de download.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = _now()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add_span(self, name, labels, seconds):
+        entry = {'name': name, 'labels': labels, 'seconds': round(seconds, 4), 'peak_rss_mb': peak_rss_mb()}
+        with self.lock:
+            self.spans.append(entry)
+
+    def add(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        """Spans e contadores em forma serializável (também usado entre processos)"""
+        with self.lock:
+            return {
+                'spans': list(self.spans),
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in self.counters.items()],
+            }
+
+    def merge(self, snapshot):
+        """Incorpora o snapshot de outro relatório (ex.: de um processo do pool)"""
+        with self.lock:
+            self.spans.extend(snapshot['spans'])
+        for counter in snapshot['counters']:
+            self.add(counter['name'], counter['value'], counter['labels'])
+
+    def to_dict(self):
+        return {
+            'stage': self.stage,
+            'run_id': self.run_id,
+            'started_at': self.started_at,
+            'finished_at': _now(),
+            'seconds': round(time.perf_counter() - self.start, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            **self.snapshot(),
+        }
+
+    def save(self, directory):
+        """Grava `<etapa>-<início>-<id>.json` em `directory` e retorna o caminho"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = self.started_at.replace(':', '').replace('-', '').split('+')[0]
+        path = os.path.join(directory, f"{self.stage}-{stamp}-{self.run_id}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+# Relatório da execução em andamento; sem execução ativa, span/count não fazem nada
+_current = None
+
+
+@contextmanager
+def run(stage, directory):
+    """Ativa um relatório para a etapa e o grava em `directory` ao sair (mesmo com erro)"""
+    global _current
+    previous, report = _current, RunReport(stage)
+    _current = report
+    try:
+        yield report
+    finally:
+        _current = previous
+        data = report.to_dict()
+        path = report.save(directory)
+        logging.info(f"Relatório de execução: {path} ({data['seconds']:.2f}s, pico {data['peak_rss_mb']} MB)")
+
+
+@contextmanager
+def collect():
+    """Relatório avulso, sem gravação (ex.: dentro de um processo do pool, devolvido com snapshot())"""
+    global _current
+    previous, report = _current, RunReport('parcial')
+    _current = report
+    try:
+        yield report
+    finally:
+        _current = previous
+
+
+def merge(snapshot):
+    if _current is not None:
+        _current.merge(snapshot)
+
+
+@contextmanager
+def span(name, **labels):
+    """Mede o trecho e registra no relatório ativo"""
+    report = _current
+    if report is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report.add_span(name, labels, time.perf_counter() - start)
+
+
+def count(name, value=1, **labels):
+    """Soma `value` ao contador `name` (com os rótulos) no relatório ativo"""
+    report = _current
+    if report is not None:
+        report.add(name, value, labels)
+
+
+# Limites (s) dos buckets dos histogramas de latência
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Histograma no formato de exposição do Prometheus, com rótulos fixos por instância"""
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.series.items())
+        for label_values, (counts, total) in items:
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values)]
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = ','.join(labels + ['le="%s"' % le])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ''
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return "\n".join(lines)
+
+
+def render_counters(name, description, values):
+    """Contadores simples (`values`: pares (rótulos, valor)) no formato do Prometheus"""
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+    for labels, value in values:
+        rendered = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f"{name}{{{rendered}}} {value}" if rendered else f"{name} {value}")
+    return "\n".join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
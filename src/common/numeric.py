@@ -0,0 +1,146 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Códigos dos caracteres tratados pelo parser
+_ZERO, _NINE = ord('0'), ord('9')
+_MINUS, _QUOTE, _SPACE = ord('-'), ord('"'), ord(' ')
+
+# Acima de 15 dígitos a mantissa deixa de ser exata em float64: vai para o caminho lento
+_MAX_FAST_DIGITS = 15
+_POW10 = 10.0 ** np.arange(_MAX_FAST_DIGITS + 1)
+
+# Linhas por bloco no caminho rápido (mantém os vetores de trabalho no cache da CPU)
+_BLOCK_ROWS = 65536
+
+
+def _slow_parse(value, decimal, thousands):
+    """Conversão elemento a elemento, com a mesma semântica da antiga cadeia de replace"""
+    text = str(value).replace('"', '')
+    if thousands:
+        text = text.replace(thousands, '')
+    if decimal != '.':
+        text = text.replace(decimal, '.')
+    return float(text)
+
+
+def _fast_parse(codes, dec_code, thou_code):
+    """
+    Caminho rápido sobre um bloco da matriz de caracteres (uma linha por célula).
+    Percorre as posições da esquerda para a direita acumulando mantissa, sinal e
+    casas decimais de todas as células ao mesmo tempo.
+    Retorna (valores, inválidos).
+    """
+    n = len(codes)
+    mantissa = np.zeros(n)
+    digits = np.zeros(n, dtype=np.int16)
+    scale = np.zeros(n, dtype=np.int16)
+    negative = np.zeros(n, dtype=bool)
+    seen_decimal = np.zeros(n, dtype=bool)
+    ended = np.zeros(n, dtype=bool)
+    bad = np.zeros(n, dtype=bool)
+
+    for j in range(codes.shape[1]):
+        c = codes[:, j]
+        d = c - np.uint8(_ZERO)
+        is_digit = d < 10
+        is_decimal = c == dec_code
+        is_thousands = c == thou_code
+        is_minus = c == _MINUS
+        is_blank = (c == _QUOTE) | (c == _SPACE) | (c == 0)
+        content = is_digit | is_decimal | is_thousands
+        started = (digits > 0) | seen_decimal
+
+        bad |= ~(content | is_minus | is_blank)
+        bad |= is_minus & (started | negative)
+        bad |= (is_decimal | is_thousands) & seen_decimal
+        bad |= content & ended
+        ended |= is_blank & started
+
+        negative |= is_minus
+        seen_decimal |= is_decimal
+        np.multiply(mantissa, 10, out=mantissa, where=is_digit)
+        np.add(mantissa, d, out=mantissa, where=is_digit)
+        digits += is_digit
+        scale += is_digit & seen_decimal
+
+    bad |= (digits == 0) | (digits > _MAX_FAST_DIGITS)
+    values = mantissa / _POW10[np.minimum(scale, _MAX_FAST_DIGITS)]
+    return np.where(negative, -values, values), bad
+
+
+def parse_decimal(values, decimal=',', thousands='.'):
+    """
+    Converte uma coluna de números em texto (padrão pt-BR `1.234.567,89`) para float64.
+
+    O caminho rápido trabalha sobre o buffer de caracteres da coluna (uma
+    matriz NumPy de bytes, processada em blocos e sem colunas de texto
+    intermediárias), validando o formato enquanto converte. Células que ele
+    não valida (notação científica, sinais extras, mais de 15 dígitos...) são
+    convertidas uma a uma; as que ainda assim falham viram NaN e são devolvidas
+    em `malformed`, em vez de derrubar o arquivo inteiro.
+
+    Retorna (valores: Series float64, malformed: Series com o texto original),
+    ambas com o mesmo índice da entrada.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    result = np.full(len(series), np.nan)
+    missing = series.isna().to_numpy()
+    positions = np.flatnonzero(~missing)
+    malformed_pos = []
+
+    if len(positions):
+        raw = series.to_numpy()[positions]
+        # Buffer UCS-4 -> bytes; caracteres fora do ASCII viram 255 (inválido)
+        chars = np.asarray(raw.astype(str), dtype=str)
+        width = max(chars.dtype.itemsize // 4, 1)
+        codes = np.minimum(chars.view(np.uint32).reshape(len(chars), width), 255).astype(np.uint8)
+
+        dec_code = ord(decimal)
+        thou_code = ord(thousands) if thousands else 256
+        bad = np.zeros(len(codes), dtype=bool)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = slice(start, start + _BLOCK_ROWS)
+            result[positions[block]], bad[block] = _fast_parse(codes[block], dec_code, thou_code)
+
+        # Caminho lento apenas para as células que o rápido não validou
+        for pos, cell in zip(positions[bad], raw[bad]):
+            try:
+                result[pos] = _slow_parse(cell, decimal, thousands)
+            except ValueError:
+                result[pos] = np.nan
+                malformed_pos.append(pos)
+
+    return pd.Series(result, index=series.index, name=series.name), series.iloc[malformed_pos]
+
+
+def parse_br_decimal(values):
+    """Atalho para o formato pt-BR (`1.234,56`)"""
+    return parse_decimal(values, decimal=',', thousands='.')
+
+
+def log_malformed(malformed, source, header_lines=1, limit=10):
+    """
+    Registra no log as células inválidas. Supõe índice posicional do read_csv:
+    a linha no arquivo é índice + cabeçalho + 1.
+    """
+    if malformed.empty:
+        return
+    examples = ", ".join(
+        f"linha {idx + header_lines + 1}: {raw!r}" for idx, raw in malformed.head(limit).items()
+    )
+    logging.warning(f"{len(malformed)} valores inválidos em {source} ({examples})")
+
+
+def convert_numeric_columns(df, columns, source, decimal='.', thousands=None):
+    """
+    Converte, no próprio DataFrame, colunas lidas como texto (dtype=str) usando
+    parse_decimal. Colunas ausentes são ignoradas; células inválidas viram NaN
+    e são registradas no log com o número da linha.
+    """
+    for col in columns:
+        if col in df.columns:
+            df[col], malformed = parse_decimal(df[col], decimal=decimal, thousands=thousands)
+            log_malformed(malformed, f"{source} ({col})")
+    return df
@@ -0,0 +1,98 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.interchange import PARQUET_AVAILABLE, read_table, write_table
+from common.manifest import file_sha256, load_manifest, save_manifest
+
+KEY = 'REGISTRO_OPERADORA'
+# Colunas do Relatorio_cadop.csv usadas no enriquecimento (o resto nem é lido)
+COLUMNS = [KEY, 'CNPJ', 'Razao_Social', 'UF', 'Modalidade']
+CATEGORICAL = ['UF', 'Modalidade']
+
+
+class OperatorRegistry:
+    """
+    Cadastro de operadoras indexado pelo Registro ANS, só com as colunas usadas
+    no enriquecimento (UF e Modalidade categóricas). Substitui o merge com o
+    cadastro inteiro por uma busca vetorizada no índice.
+    """
+
+    def __init__(self, table):
+        table = table.drop_duplicates(subset=KEY, keep='first')
+        self.table = table.set_index(KEY)
+
+    @classmethod
+    def from_csv(cls, path):
+        """Lê o Relatorio_cadop.csv (latin1, ';') projetando apenas COLUMNS"""
+        wanted = set(COLUMNS)
+        df = pd.read_csv(
+            path, sep=';', encoding='latin1', on_bad_lines='skip', dtype=str,
+            usecols=lambda c: c.replace('"', '').strip() in wanted,
+        )
+        # Limpar aspas se houver
+        df.columns = df.columns.str.replace('"', '').str.strip()
+        if KEY not in df.columns:
+            raise ValueError(f"Coluna {KEY} não encontrada no cadastro")
+        for col in CATEGORICAL:
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+        return cls(df)
+
+    @classmethod
+    def load_or_build(cls, csv_path, registry_path):
+        """
+        Reaproveita o registro salvo em `registry_path` se foi construído a partir
+        do mesmo cadastro (mesmo hash); senão lê o CSV e salva para a próxima execução.
+        """
+        meta_path = f"{registry_path}.json"
+        sha = file_sha256(csv_path)
+        if PARQUET_AVAILABLE and os.path.exists(registry_path) and load_manifest(meta_path).get('sha256') == sha:
+            logging.info("Registro de operadoras reaproveitado.")
+            return cls(read_table(registry_path))
+
+        registry = cls.from_csv(csv_path)
+        if write_table(registry.table.reset_index(), registry_path):
+            save_manifest(meta_path, {'sha256': sha})
+        return registry
+
+    def __len__(self):
+        return len(self.table)
+
+    def lookup(self, keys):
+        """Posição de cada chave no registro (-1 quando não encontrada)"""
+        return self.table.index.get_indexer(pd.Index(keys, dtype=str))
+
+    def enrich(self, df, key_col='CNPJ'):
+        """
+        Acrescenta ao DataFrame de despesas RazaoSocial (priorizando o cadastro),
+        UF, Modalidade e CNPJ_Real, sem materializar o merge com o cadastro.
+        Retorna (DataFrame enriquecido, quantidade de linhas sem cadastro).
+        """
+        positions = self.lookup(df[key_col].astype(str))
+        found = positions >= 0
+        out = df.copy()
+
+        def take(col):
+            if not len(self.table):
+                return pd.Series(np.nan, index=out.index, dtype=object)
+            values = self.table[col].take(np.where(found, positions, 0))
+            values.index = out.index
+            return values.where(found)
+
+        # Prioriza Razao_Social do cadastro
+        if 'Razao_Social' in self.table.columns:
+            out['RazaoSocial'] = take('Razao_Social').fillna(out['RazaoSocial'])
+        for col in CATEGORICAL:
+            if col in self.table.columns:
+                out[col] = take(col)
+        if 'CNPJ' in self.table.columns:
+            out['CNPJ_Real'] = take('CNPJ')
+
+        unmatched = int((~found).sum())
+        if unmatched:
+            missing = df.loc[~found, key_col].nunique()
+            logging.warning(f"{unmatched} linhas ({missing} registros ANS) sem correspondência no cadastro.")
+        return out, unmatched
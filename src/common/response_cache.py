@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Cache LRU de respostas já serializadas (corpo + ETag), limitado por número
+    de entradas e por bytes. Cada entrada pertence a uma versão dos dados:
+    quando a versão muda (nova carga do import_data), o cache inteiro é
+    descartado de uma vez. Seguro para os threads do servidor.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = None
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.stats['invalidations'] += 1
+            self.entries.clear()
+            self.size = 0
+            self.version = version
+
+    def get(self, key, version):
+        """(corpo, etag) da entrada, ou None; conta acerto/falta"""
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def put(self, key, version, body, etag):
+        """Guarda a resposta e descarta as menos usadas até caber nos limites"""
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            self._check_version(version)
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self.entries[key] = (body, etag)
+            self.size += len(body)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats['evictions'] += 1
+
+    def snapshot(self):
+        """Contadores e ocupação atuais"""
+        with self.lock:
+            return {**self.stats, 'entries': len(self.entries), 'bytes': self.size, 'version': self.version}
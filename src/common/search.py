@@ -0,0 +1,52 @@
+import re
+import unicodedata
+
+import pandas as pd
+
+# Tamanho mínimo de termo para o índice de trigramas (FTS5 trigram / pg_trgm)
+MIN_TRIGRAM = 3
+
+_SPACES = re.compile(r"\s+")
+_CNPJ_PUNCT = re.compile(r"[.\-/\s]")
+
+
+def fold_text(value):
+    """Texto sem acentos, minúsculo e com espaços normalizados (`Saúde  São Paulo` -> `saude sao paulo`)"""
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _SPACES.sub(" ", text).strip().lower()
+
+
+def fold_series(values):
+    """
+    fold_text aplicado a uma coluna inteira (usado na carga do índice; nulos viram
+    ''). A mesma função dos termos buscados: o índice e a busca nunca divergem.
+    """
+    return values.astype("string").fillna("").map(fold_text).astype("string")
+
+
+def digits_only(value):
+    """Apenas os dígitos de um CNPJ/registro digitado com pontuação; None se houver outros caracteres"""
+    text = _CNPJ_PUNCT.sub("", str(value))
+    return text if text.isdigit() else None
+
+
+def prefix_bounds(prefix):
+    """
+    Intervalo [início, fim) que cobre todos os textos começando com `prefix`.
+    Permite busca por prefixo com o índice B-tree comum (sem LIKE).
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def match_phrase(text):
+    """Termo de busca como frase FTS5 (aspas escapadas), para não interpretar operadores"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def digits_series(values):
+    """Coluna de CNPJ só com dígitos (NULL quando vazia)"""
+    digits = values.astype("string").str.replace(r"\D", "", regex=True)
+    return digits.where(digits.str.len() > 0, pd.NA)
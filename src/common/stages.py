@@ -0,0 +1,41 @@
+import hashlib
+import importlib.util
+import os
+import sys
+
+
+def script_module_name(path):
+    """Nome de módulo estável (o mesmo em qualquer processo) para o script em `path`"""
+    return "etapa_" + hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+
+
+def load_script(path, name=None):
+    """
+    Carrega o script de uma etapa como módulo (as pastas começam com dígito e não
+    são pacotes importáveis) e o registra em sys.modules. Devolve o já carregado
+    com o mesmo nome, se houver.
+    """
+    name = name or script_module_name(path)
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def call(path, function, *args):
+    """
+    Chama `function` do script `path`, carregado uma vez por processo. Usado com
+    functools.partial como alvo dos pools de processos: o pickle guarda só
+    `common.stages.call` (importável em qualquer processo, com qualquer método de
+    início: fork, spawn ou forkserver) e o caminho do script, nunca o nome com que
+    o processo pai carregou a etapa.
+    """
+    return getattr(load_script(path), function)(*args)
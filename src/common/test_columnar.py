@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common import columnar
+
+def test_snapshot_busca_binaria_fatias_e_percentis(tmp_path):
+    # Fora de ordem, com um trimestre faltando (2T de 2023) e um total zerado
+    por_trimestre = pd.DataFrame({
+        'registro_ans': ['000200', '000100', '000200', '000100', '000200', '000300'],
+        'ano': [2023, 2023, 2023, 2022, 2024, 2023],
+        'trimestre': pd.Categorical(['3T', '1T', '1T', '4T', '1T', '1T']),
+        'total_despesas': [30.0, 5.0, 10.0, 0.0, 60.0, 1.0],
+    })
+    directory = columnar.write_store(por_trimestre, tmp_path, 'v1')
+    store = columnar.open_store(tmp_path, 'v1')
+    assert len(store) == 3 and store.meta['linhas'] == 6
+    assert isinstance(store.valor, np.memmap)
+
+    index = store.find('000200')
+    ano, trimestre, valor = store.series(index)
+    assert ano.tolist() == [2023, 2023, 2024] and trimestre.tolist() == [1, 3, 1]
+    assert np.shares_memory(valor, store.valor)
+    # 1T -> 3T e 3T -> 1T do ano seguinte pulam trimestres: sem variação
+    assert np.isnan(store.growth(index)).all()
+    growth = store.growth(store.find('000100'))
+    assert np.isnan(growth[0]) and np.isnan(growth[1])   # anterior zerado
+    assert store.find('000150') is None and store.find('0001000') is None
+
+    assert columnar.rank(store.total_ordenado, 100.0) == (1, 100.0)
+    assert columnar.rank(store.total_ordenado, 5.0) == (2, pytest.approx(200 / 3))
+    assert columnar.quantiles(store.total_ordenado, [0, 50, 100]) == [1.0, 5.0, 100.0]
+    assert store.period_slice(2023, 1).tolist() == [1.0, 5.0, 10.0]
+    assert store.period_slice(2023, 2) is None
+    assert store.value_in_period(index, 2024, 1) == 60.0 and store.value_in_period(index, 2022, 4) is None
+
+    # Versões antigas são removidas; a nova substitui a de mesmo nome por inteiro
+    columnar.write_store(por_trimestre.iloc[:2], tmp_path, 'v2')
+    columnar.write_store(por_trimestre.iloc[:1], tmp_path, 'v3')
+    columnar.prune_stores(tmp_path, keep=2)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['v2', 'v3']
+    assert not (tmp_path / 'v1').exists() and directory.endswith('v1')
+
+    with pytest.raises(ValueError):
+        columnar.write_store(por_trimestre.assign(trimestre='5T'), tmp_path, 'v4')
+    assert not (tmp_path / 'v4').exists()
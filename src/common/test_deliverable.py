@@ -0,0 +1,58 @@
+import gzip
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.deliverable import ParallelGzipWriter, csv_chunks, write_csv
+
+DF = pd.DataFrame({
+    'CNPJ': pd.Categorical(['339679', '005711', None, '326305']),
+    'RazaoSocial': ['UNIMED; SÃO PAULO', 'Bradesco "Saúde"', None, 'AMIL'],
+    'Ano': np.int32(2023),
+    'ValorDespesas': [2.0, 1e-05, np.nan, 123456789012345.67],
+    'Quantidade': pd.array([1, None, 3, 4], dtype='Int64'),
+})
+
+
+def test_csv_em_blocos_igual_ao_to_csv():
+    esperado = DF.to_csv(index=False, sep=';').encode('utf-8')
+    # Blocos de 1 e 2 linhas: os com `;`/aspas caem no to_csv, os demais no Arrow
+    assert b"".join(csv_chunks(DF, rows=1)) == esperado
+    assert b"".join(csv_chunks(DF, rows=2)) == esperado
+    assert b"".join(csv_chunks(DF.iloc[:0])) == DF.iloc[:0].to_csv(index=False, sep=';').encode('utf-8')
+
+
+def test_entregavel_zip_gzip_e_zstd(tmp_path):
+    esperado = DF.to_csv(index=False, sep=';').encode('utf-8')
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text("antigo")
+
+    path = write_csv(DF, tmp_path / "entrega.zip", "dados.csv", csv_path=csv_path, level=1)
+    with zipfile.ZipFile(path) as z:
+        assert z.namelist() == ["dados.csv"] and z.read("dados.csv") == esperado
+    # Sem keep_csv a cópia antiga some; com keep_csv sai igual ao conteúdo do ZIP
+    assert not csv_path.exists()
+    write_csv(DF, tmp_path / "entrega.zip", "dados.csv", csv_path=csv_path, keep_csv=True)
+    assert csv_path.read_bytes() == esperado
+
+    path = write_csv(DF, tmp_path / "entrega.zip", "dados.csv", fmt='gzip')
+    assert path.name == "dados.csv.gz" and gzip.decompress(path.read_bytes()) == esperado
+
+    zstandard = pytest.importorskip("zstandard")
+    path = write_csv(DF, tmp_path / "entrega.zip", "dados.csv", fmt='zstd')
+    assert path.name == "dados.csv.zst"
+    assert zstandard.ZstdDecompressor().stream_reader(io.BytesIO(path.read_bytes())).read() == esperado
+
+
+def test_gzip_paralelo_em_varios_membros():
+    data = b"".join(b"%d;linha de teste\n" % i for i in range(20000))
+    out = io.BytesIO()
+    writer = ParallelGzipWriter(out, level=1, threads=3, block_size=4096)
+    for start in range(0, len(data), 1000):
+        writer.write(data[start:start + 1000])
+    writer.close()
+    assert out.getvalue().count(b"\x1f\x8b\x08") > 10
+    assert gzip.decompress(out.getvalue()) == data
@@ -0,0 +1,51 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from common.download_cache import DownloadCache
+
+CONTENT = b"conteudo completo do arquivo"
+
+class NoRangeHandler(BaseHTTPRequestHandler):
+    """Responde 416 a qualquer pedido com Range (parcial maior que o arquivo)"""
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("Range"))
+        if self.headers.get("Range"):
+            self.send_response(416)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v2"')
+        self.send_header("Content-Length", str(len(CONTENT)))
+        self.end_headers()
+        self.wfile.write(CONTENT)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    NoRangeHandler.requests = []
+    httpd = HTTPServer(("127.0.0.1", 0), NoRangeHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/arquivo.zip"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_retomada_recusada_baixa_do_inicio(server, tmp_path):
+    cache = DownloadCache(tmp_path)
+    _, part_path, meta_path = cache._paths(server)
+    # Download interrompido de uma versão anterior, maior que a atual
+    part_path.write_bytes(b"x" * (len(CONTENT) + 10))
+    meta_path.write_text(json.dumps({"url": server, "etag": '"v1"', "complete": False}))
+
+    path, meta = cache.fetch(server)
+    assert path.read_bytes() == CONTENT and meta["complete"] and meta["etag"] == '"v2"'
+    assert not part_path.exists()
+    assert NoRangeHandler.requests == [f"bytes={len(CONTENT) + 10}-", None]
+    assert cache.stats["resumed"] == 0
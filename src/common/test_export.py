@@ -0,0 +1,31 @@
+import gzip
+import io
+
+import pandas as pd
+import pyarrow as pa
+
+from common.export import ExportWriter
+
+COLUMNS = [('registro_ans', 'string'), ('ano', 'int64'), ('valor_despesas', 'float64')]
+LOTES = [[('339679', 2023, 1.5), ('005711', 2023, None)], [], [('326305', 2024, 7.0)]]
+
+
+def exportar(fmt, compression=None):
+    writer = ExportWriter(COLUMNS, fmt, compression)
+    return writer.start() + b"".join(writer.write(rows) for rows in LOTES) + writer.finish()
+
+
+def test_lotes_viram_csv_ndjson_e_arrow():
+    assert exportar('csv').decode() == "registro_ans;ano;valor_despesas\n339679;2023;1.5\n005711;2023;\n326305;2024;7.0\n"
+    assert gzip.decompress(exportar('csv', 'gzip')) == exportar('csv')
+
+    linhas = pd.read_json(io.BytesIO(exportar('ndjson')), lines=True, dtype={'registro_ans': str})
+    assert linhas['registro_ans'].tolist() == ['339679', '005711', '326305']
+
+    tabela = pa.ipc.open_stream(exportar('arrow')).read_all()
+    assert tabela.schema.names == ['registro_ans', 'ano', 'valor_despesas']
+    assert tabela.num_rows == 3 and tabela.column('valor_despesas').null_count == 1
+
+    # Sem linhas: CSV só com cabeçalho e Arrow só com o schema
+    vazio = ExportWriter(COLUMNS, 'arrow')
+    assert pa.ipc.open_stream(vazio.start() + vazio.finish()).read_all().num_rows == 0
@@ -0,0 +1,39 @@
+import json
+
+from common import metrics
+
+
+def test_relatorio_de_execucao_com_spans_e_contadores(tmp_path):
+    # Sem execução ativa, span e count não fazem nada
+    with metrics.span("solto"):
+        metrics.count("linhas", 10)
+
+    with metrics.run("etapa_teste", tmp_path) as report:
+        with metrics.span("leitura", trimestre="2024-1"):
+            metrics.count("rows_read", 100, trimestre="2024-1")
+            metrics.count("rows_read", 50, trimestre="2024-1")
+        # Relatório parcial de um processo do pool, devolvido por snapshot()
+        with metrics.collect() as parcial:
+            metrics.count("rows_read", 25, trimestre="2024-2")
+        metrics.merge(parcial.snapshot())
+    assert report.counters == {('rows_read', (('trimestre', '2024-1'),)): 150,
+                               ('rows_read', (('trimestre', '2024-2'),)): 25}
+
+    [path] = tmp_path.glob("etapa_teste-*.json")
+    data = json.loads(path.read_text())
+    assert data['stage'] == "etapa_teste" and data['seconds'] >= 0
+    assert [span['name'] for span in data['spans']] == ["leitura"]
+    assert {'name': 'rows_read', 'labels': {'trimestre': '2024-2'}, 'value': 25} in data['counters']
+
+
+def test_histograma_no_formato_prometheus():
+    histogram = metrics.Histogram("latencia_seconds", "Latência", ("rota",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, '/api/"x"')
+    histogram.observe(0.5, '/api/"x"')
+    histogram.observe(5.0, '/api/"x"')
+    linhas = histogram.render().splitlines()
+    assert linhas[:2] == ["# HELP latencia_seconds Latência", "# TYPE latencia_seconds histogram"]
+    assert 'latencia_seconds_bucket{rota="/api/\\"x\\"",le="0.1"} 1' in linhas
+    assert 'latencia_seconds_bucket{rota="/api/\\"x\\"",le="1.0"} 2' in linhas
+    assert 'latencia_seconds_bucket{rota="/api/\\"x\\"",le="+Inf"} 3' in linhas
+    assert 'latencia_seconds_count{rota="/api/\\"x\\""} 3' in linhas
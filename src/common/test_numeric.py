@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from common.numeric import parse_br_decimal, parse_decimal
+
+def replace_chain(series):
+    return series.astype(str).str.replace('"', '').str.replace('.', '').str.replace(',', '.').astype(float)
+
+def test_parse_br_decimal_igual_a_cadeia_de_replace():
+    series = pd.Series(['"1.234.567,89"', '-0,01', '12', '0,5', '"-9.999,00"', '1e5', 'nan', None], dtype=str)
+    values, malformed = parse_br_decimal(series)
+    expected = replace_chain(series.fillna('nan'))
+    assert np.array_equal(values.to_numpy(), expected.to_numpy(), equal_nan=True)
+    assert malformed.empty
+
+def test_parse_br_decimal_reporta_linhas_invalidas():
+    series = pd.Series(['1,00', 'abc', '1,2,3', '2,00', '-'], index=[10, 11, 12, 13, 14])
+    values, malformed = parse_br_decimal(series)
+    assert values.loc[[10, 13]].tolist() == [1.0, 2.0]
+    assert values.loc[[11, 12, 14]].isna().all()
+    assert malformed.to_dict() == {11: 'abc', 12: '1,2,3', 14: '-'}
+
+def test_parse_decimal_formato_ponto():
+    values, malformed = parse_decimal(pd.Series(['1234.56', '-3', '1.5e+20', '1,5']), decimal='.', thousands=None)
+    assert values.tolist()[:3] == [1234.56, -3.0, 1.5e20]
+    assert malformed.tolist() == ['1,5']
@@ -0,0 +1,16 @@
+from common.response_cache import ResponseCache
+
+def test_lru_descarta_menos_usadas_e_limpa_ao_mudar_versao():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.put('a', 'v1', b'1234', '"a"')
+    cache.put('b', 'v1', b'1234', '"b"')
+    assert cache.get('a', 'v1') == (b'1234', '"a"')   # 'a' passa a ser a mais recente
+    cache.put('c', 'v1', b'1234', '"c"')              # estoura os dois limites: sai 'b'
+    assert cache.get('b', 'v1') is None
+    assert cache.get('c', 'v1') is not None
+
+    # Nova carga: nada da versão anterior é servido
+    assert cache.get('a', 'v2') is None
+    stats = cache.snapshot()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['invalidations']) == (2, 2, 1, 1)
+    assert (stats['entries'], stats['bytes'], stats['version']) == (0, 0, 'v2')
@@ -0,0 +1,9 @@
+import pandas as pd
+
+from common.search import fold_series, fold_text
+
+def test_coluna_e_termo_com_a_mesma_normalizacao():
+    nomes = pd.Series(['Straße  Saúde', 'ØRESUND Æ', None])
+    assert fold_series(nomes).tolist() == ['straße saude', 'øresund æ', '']
+    # Termo digitado com os mesmos caracteres casa com a coluna gravada no índice
+    assert [fold_text(nome) for nome in nomes[:2]] == fold_series(nomes)[:2].tolist()
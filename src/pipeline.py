@@ -0,0 +1,211 @@
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy.engine import make_url
+
+# Configuração de Logs
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SRC_DIR = Path(__file__).resolve().parent
+BASE_DIR = SRC_DIR.parent
+DATA_PROCESSED = BASE_DIR / "data" / "processed"
+# Impressões digitais (entradas + código) da última execução de cada etapa
+PIPELINE_MANIFEST = DATA_PROCESSED / "pipeline_manifest.json"
+REPORTS_DIR = DATA_PROCESSED / "relatorios"
+
+sys.path.insert(0, str(SRC_DIR))
+from common import deliverable, metrics, stages
+from common.interchange import has_table
+from common.manifest import file_sha256, load_manifest, save_manifest
+
+
+def load_stage(name, path):
+    """
+    Carrega o script de uma etapa como módulo (as pastas começam com dígito). O nome
+    só existe neste processo: o pool da Etapa 1 não depende dele, cada processo
+    carrega o script pelo caminho (common.stages.call), com qualquer método de início.
+    """
+    return stages.load_script(path, name)
+
+
+STAGE_SCRIPTS = {
+    'etapa1': SRC_DIR / "1_integration" / "main.py",
+    'etapa2': SRC_DIR / "2_transformation" / "main.py",
+    'etapa3': SRC_DIR / "3_database" / "import_data.py",
+}
+etapa1 = load_stage("pipeline_etapa1", STAGE_SCRIPTS['etapa1'])
+etapa2 = load_stage("pipeline_etapa2", STAGE_SCRIPTS['etapa2'])
+etapa3 = load_stage("pipeline_etapa3", STAGE_SCRIPTS['etapa3'])
+
+
+def fingerprint(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def code_fingerprint(stage):
+    """Hash do script da etapa e dos módulos compartilhados (src/common), sem os testes"""
+    common = sorted(p for p in (SRC_DIR / "common").glob("*.py") if not p.name.startswith("test_"))
+    return fingerprint([(path.name, file_sha256(path)) for path in [STAGE_SCRIPTS[stage]] + common])
+
+
+def unchanged(previous, key, outputs, force):
+    """Mesma impressão digital da última execução e saídas ainda no disco"""
+    return not force and previous.get('key') == key and all(outputs)
+
+
+def code_changed(previous, code):
+    # Sem execução anterior pelo runner, vale o incremental de cada etapa
+    return previous.get('code') not in (None, code)
+
+
+def run_cadastro(inputs, previous, options):
+    """Download condicional do cadastro, em paralelo com os downloads da Etapa 1"""
+    path = etapa2.download_cadastro()
+    return {'path': path, 'fingerprint': file_sha256(path) if path else None}
+
+
+def run_etapa1(inputs, previous, options):
+    """
+    Sempre executa: as entradas estão no FTP e a própria etapa pula os trimestres
+    inalterados (manifesto + download condicional). A impressão digital da saída
+    combina o manifesto de trimestres e o código da etapa.
+    """
+    code = code_fingerprint('etapa1')
+    data = etapa1.main(workers=options.workers, chunksize=options.chunksize, processes=options.processes,
+                       full=options.full or code_changed(previous, code),
+                       count=options.quarters, since=options.since, until=options.until,
+                       output_format=options.output_format, compresslevel=options.compresslevel,
+                       keep_csv=options.keep_csv)
+    quarters = load_manifest(etapa1.MANIFEST).get('quarters')
+    output = deliverable.output_path(etapa1.OUTPUT_ZIP, etapa1.OUTPUT_CSV.name, options.output_format)
+    if not quarters or not output.exists():
+        raise RuntimeError("Etapa 1 não gerou o consolidado")
+    key = fingerprint(code, quarters)
+    return {'data': data, 'code': code, 'key': key, 'fingerprint': key}
+
+
+def run_etapa2(inputs, previous, options):
+    code = code_fingerprint('etapa2')
+    key = fingerprint(code, inputs['etapa1']['fingerprint'], inputs['cadastro']['fingerprint'])
+    outputs = [deliverable.output_path(etapa2.OUTPUT_ZIP, etapa2.OUTPUT_CSV.name, options.output_format).exists(),
+               has_table(etapa2.OUTPUT_PARQUET) or etapa2.OUTPUT_CSV.exists()]
+    if unchanged(previous, key, outputs, options.force or options.full):
+        return {'data': None, 'skipped': True, 'fingerprint': key}
+
+    data = etapa2.main(full=options.full or code_changed(previous, code),
+                       consolidated=inputs['etapa1']['data'], cad_path=inputs['cadastro']['path'],
+                       output_format=options.output_format, compresslevel=options.compresslevel,
+                       keep_csv=options.keep_csv)
+    if data is None:
+        raise RuntimeError("Etapa 2 não gerou as estatísticas")
+    return {'data': data, 'code': code, 'key': key, 'fingerprint': key}
+
+
+def run_etapa3(inputs, previous, options):
+    code = code_fingerprint('etapa3')
+    key = fingerprint(code, inputs['etapa1']['fingerprint'], inputs['etapa2']['fingerprint'], etapa3.DB_URL)
+    url = make_url(etapa3.DB_URL)
+    database_exists = url.get_backend_name() != 'sqlite' or Path(url.database or '').exists()
+    if unchanged(previous, key, [database_exists], options.force or options.full):
+        return {'data': None, 'skipped': True, 'fingerprint': key}
+
+    if not etapa3.import_data(consolidated=inputs['etapa1']['data'], aggregated=inputs['etapa2']['data']):
+        raise RuntimeError("Etapa 3 não carregou o banco")
+    return {'data': None, 'code': code, 'key': key, 'fingerprint': key}
+
+
+# Grafo do pipeline: nome -> (dependências, função). Cada função recebe as saídas
+# das dependências, o registro da última execução da etapa e as opções da CLI.
+STAGES = {
+    'cadastro': ((), run_cadastro),
+    'etapa1': ((), run_etapa1),
+    'etapa2': (('etapa1', 'cadastro'), run_etapa2),
+    'etapa3': (('etapa1', 'etapa2'), run_etapa3),
+}
+
+
+def run_graph(stages, run_stage, workers=2):
+    """
+    Executa cada nó assim que as dependências terminam (nós independentes em
+    paralelo). Retorna {nome: saída}; a primeira falha interrompe o grafo.
+    """
+    done, running = {}, {}
+    pending = dict(stages)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name, (deps, func) in list(pending.items()):
+                if all(dep in done for dep in deps):
+                    future = executor.submit(run_stage, name, func, {dep: done[dep] for dep in deps})
+                    running[future] = name
+                    del pending[name]
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done[running.pop(future)] = future.result()
+    return done
+
+
+def main(options):
+    """
+    Roda o pipeline inteiro num só processo: as etapas trocam DataFrames em
+    memória e as que têm as mesmas entradas e o mesmo código da última execução
+    são puladas. Retorna {etapa: saída}.
+    """
+    state = load_manifest(PIPELINE_MANIFEST)
+
+    def run_stage(name, func, inputs):
+        start = time.perf_counter()
+        with metrics.span("etapa", nome=name):
+            result = func(inputs, state.get(name, {}), options)
+        status = "inalterada, pulada" if result.get('skipped') else "concluída"
+        logging.info(f"[pipeline] {name} {status} em {time.perf_counter() - start:.2f}s")
+        # Só as etapas que rodaram até o fim atualizam o registro (mesmo se outra falhar depois)
+        if 'code' in result:
+            state[name] = {'code': result['code'], 'key': result['key'],
+                           'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds')}
+        return result
+
+    try:
+        return run_graph(STAGES, run_stage)
+    finally:
+        if state:
+            DATA_PROCESSED.mkdir(parents=True, exist_ok=True)
+            save_manifest(PIPELINE_MANIFEST, state)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline completo (etapas 1 a 3) num só processo")
+    parser.add_argument("--force", action="store_true",
+                        help="Executa as etapas 2 e 3 mesmo sem mudança nas entradas")
+    parser.add_argument("--full", action="store_true",
+                        help="Reprocessa tudo do zero (ignora os manifestos das etapas)")
+    parser.add_argument("--workers", type=int, default=etapa1.DEFAULT_WORKERS,
+                        help="Número de trimestres baixados em paralelo")
+    parser.add_argument("--chunksize", type=int, default=etapa1.CHUNK_ROWS,
+                        help="Linhas por bloco na leitura dos CSVs (0 = arquivo inteiro em memória)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Processos para ler/filtrar os trimestres em paralelo (padrão 1)")
+    parser.add_argument("--quarters", type=int, default=3,
+                        help="Quantidade de trimestres mais recentes (0 = todos do intervalo)")
+    parser.add_argument("--since", type=etapa1.parse_quarter_arg, help="Primeiro trimestre, ex.: 2019-1T")
+    parser.add_argument("--until", type=etapa1.parse_quarter_arg, help="Último trimestre, ex.: 2023-4T")
+    parser.add_argument("--output-format", choices=list(deliverable.FORMATS), default='zip',
+                        help="Entregáveis: zip (padrão), gzip (multithread) ou zstd")
+    parser.add_argument("--compresslevel", type=int, help="Nível de compressão (padrão: 6 no zip/gzip, 3 no zstd)")
+    parser.add_argument("--keep-csv", action="store_true", help="Mantém os CSVs sem compressão em data/processed")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    with metrics.run("pipeline", REPORTS_DIR):
+        main(args)
@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+import threading
+import zipfile
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+import pipeline
+
+CSV_HEADER = '"DATA";"REG_ANS";"CD_CONTA_CONTABIL";"DESCRICAO";"VL_SALDO_INICIAL";"VL_SALDO_FINAL"\n'
+CADASTRO = (
+    'REGISTRO_OPERADORA;CNPJ;Razao_Social;Modalidade;UF\n'
+    '100001;11111111000111;OPERADORA A;Cooperativa Médica;SP\n'
+    '100002;22222222000122;OPERADORA B;Seguradora;RJ\n'
+)
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def ans_site(tmp_path):
+    """FTP da ANS em miniatura: dois trimestres de 2023 e o cadastro de operadoras"""
+    site = tmp_path / "site"
+    (site / "2023").mkdir(parents=True)
+    for n in (1, 2):
+        rows = "".join(f'"2023-01-01";"{reg}";"{conta}";"{descricao}";"0";"{n}.{reg[-1]}00,50"\n'
+                       for reg in ("100001", "100002", "100003")
+                       for conta, descricao in (("41", "EVENTOS"), ("31", "RECEITAS")))
+        with zipfile.ZipFile(site / "2023" / f"{n}T2023.zip", 'w') as z:
+            z.writestr(f"{n}T2023.csv", CSV_HEADER + rows)
+    (site / "cadop.csv").write_text(CADASTRO, encoding="latin1")
+
+    server = HTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(site)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/", site
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def workspace(tmp_path, ans_site, monkeypatch):
+    """Aponta os caminhos das etapas carregadas pelo runner para um diretório temporário"""
+    base_url, _ = ans_site
+    root = tmp_path / "projeto"
+    for module in (pipeline, pipeline.etapa1, pipeline.etapa2, pipeline.etapa3):
+        for name, value in list(vars(module).items()):
+            if isinstance(value, Path) and value.is_relative_to(module.BASE_DIR) and value != module.BASE_DIR \
+                    and name != 'SRC_DIR' and not name.startswith('STAGE'):
+                monkeypatch.setattr(module, name, root / value.relative_to(module.BASE_DIR))
+    monkeypatch.setattr(pipeline.etapa1, "BASE_URL", base_url)
+    monkeypatch.setattr(pipeline.etapa2, "CADASTRO_URL", f"{base_url}cadop.csv")
+    monkeypatch.setattr(pipeline.etapa3, "DB_URL", f"sqlite:///{root / 'database.db'}")
+    return root
+
+def tabela(url, name):
+    with create_engine(url).connect() as conn:
+        df = pd.read_sql_table(name, conn)
+    return df.drop(columns='id', errors='ignore').sort_values(list(df.columns.drop('id', errors='ignore')))
+
+def test_runner_passa_dados_em_memoria_e_pula_etapas_inalteradas(workspace, ans_site):
+    options = pipeline.parse_args(["--quarters", "2", "--until", "2023-4T"])
+    results = pipeline.main(options)
+    assert all(not result.get('skipped') for result in results.values())
+    assert len(results['etapa1']['data']) == 6
+    db_url = pipeline.etapa3.DB_URL
+    operadoras = tabela(db_url, 'operadoras').set_index('registro_ans')
+    assert operadoras.loc['100002', 'uf'] == 'RJ' and operadoras.loc['100001', 'cnpj'] == '11111111000111'
+    # Snapshot colunar da mesma versão gravada no banco
+    versao = tabela(db_url, 'versao_dados')['versao'].iloc[0]
+    assert (pipeline.etapa3.SNAPSHOT_DIR / versao / 'meta.json').exists()
+
+    # Carga a partir dos arquivos (etapas rodadas separadamente): mesmo conteúdo no banco
+    pipeline.etapa3.DB_URL = f"sqlite:///{workspace / 'separado.db'}"
+    assert pipeline.etapa3.import_data()
+    for name in ('operadoras', 'despesas_consolidadas', 'despesas_agregadas', 'rollup_ranking_operadoras'):
+        pd.testing.assert_frame_equal(tabela(db_url, name).reset_index(drop=True),
+                                      tabela(pipeline.etapa3.DB_URL, name).reset_index(drop=True))
+    pipeline.etapa3.DB_URL = db_url
+
+    # Nada mudou: as etapas 2 e 3 são puladas
+    again = pipeline.main(options)
+    assert again['etapa2'].get('skipped') and again['etapa3'].get('skipped')
+
+    # Cadastro novo: a Etapa 2 roda de novo (consolidado lido do disco) e a 3 em seguida
+    _, site = ans_site
+    cadop = site / "cadop.csv"
+    cadop.write_text(CADASTRO.replace(';RJ', ';MG'), encoding="latin1")
+    # Last-Modified tem resolução de segundos: garante que o servidor veja a mudança
+    os.utime(cadop, (cadop.stat().st_mtime + 10,) * 2)
+    changed = pipeline.main(options)
+    assert not changed['etapa2'].get('skipped') and not changed['etapa3'].get('skipped')
+    assert tabela(db_url, 'operadoras').set_index('registro_ans').loc['100002', 'uf'] == 'MG'
+
+def test_etapa1_com_processos_em_spawn(workspace, monkeypatch):
+    # O script da Etapa 1 foi carregado pelo runner como pipeline_etapa1: os
+    # processos criados com spawn não herdam esse módulo
+    etapa1 = pipeline.etapa1
+    monkeypatch.setattr(etapa1, "process_all",
+                        partial(etapa1.process_all, context=multiprocessing.get_context("spawn")))
+    options = pipeline.parse_args(["--quarters", "2", "--until", "2023-4T", "--processes", "2"])
+    results = pipeline.main(options)
+    assert len(results['etapa1']['data']) == 6
+    # Cache dos trimestres gravado no diretório do processo principal (não no padrão do script)
+    assert sorted(p.name for p in etapa1.QUARTERS_DIR.glob("*.parquet")) == ["2023_1T.parquet", "2023_2T.parquet"]